@@ -3,105 +3,105 @@
 GUI Image Resizer for Print Sizes at 300 DPI (Modernized)
 """
 
+import multiprocessing
 import os
+import sys
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk
-from PIL import Image
 
-# Configuration for print sizes in inches (width, height)
-TARGET_SIZES_INCHES = {
-    (4, 5): (16, 20),   # 16x20 inches @300 DPI => 4800x6000 pixels
-    (3, 4): (18, 24),   # 18x24 inches @300 DPI => 5400x7200 pixels
-    (2, 3): (24, 36),   # 24x36 inches @300 DPI => 7200x10800 pixels
-    (5, 7): (5, 7),     # 5x7 inches @300 DPI   => 1500x2100 pixels
-}
+# The shared engine lives at the repository root, next to this app's folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cropengine import (
+    AUTO_CROP_AVAILABLE, RENDER_CACHE_AVAILABLE, TARGET_SIZES_INCHES, BatchEngine, EncoderStats, Manifest,
+    RenderCache, RunReport, TkLogChannel, format_event, peek, run_incremental, scan_jobs, specs_from_target_sizes,
+)
+
+# Print sizes in inches per aspect ratio: TARGET_SIZES_INCHES in cropengine/sizes.py
 
 DPI = 300  # Output resolution
 VALID_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".bmp", ".webp")
 JPEG_QUALITY = 95  # Higher quality for JPEG output
-
-def center_crop_to_aspect_ratio(img, aspect_w, aspect_h):
-    """
-    Improved center-crop with accurate aspect ratio handling.
-    """
-    orig_w, orig_h = img.size
-    target_ratio = aspect_w / aspect_h
-    current_ratio = orig_w / orig_h
-
-    if current_ratio > target_ratio:
-        # Crop width
-        new_width = int(orig_h * target_ratio)
-        left = (orig_w - new_width) // 2
-        return img.crop((left, 0, left + new_width, orig_h))
-    else:
-        # Crop height
-        new_height = int(orig_w / target_ratio)
-        top = (orig_h - new_height) // 2
-        return img.crop((0, top, orig_w, top + new_height))
-
-def process_images(input_folder, output_folder, log_func):
+WORKERS = None  # Parallel worker processes (None = one per CPU core)
+FAST_DECODE = True  # Decode oversized JPEGs at reduced scale when every output is much smaller
+INCREMENTAL = True  # Skip outputs the output folder's manifest says are already up to date
+RECURSIVE = True  # Also process subfolders, mirroring them in the output folder
+MEMORY_BUDGET_MB = None  # RAM budget for parallel renders (None = 75% of physical RAM, 0 = no limit)
+INSTRUMENT = False  # Write per-stage timings to imagecropper-report.csv/.json in the output folder
+PROFILE_FILE = None  # File name (or path) of one image to run under cProfile, e.g. "IMG_0001.jpg"
+AUTO_CROP = False  # Center each crop on the subject instead of the image center (needs NumPy)
+RENDER_CACHE_MB = 0  # On-disk cache of decoded crops for repeat renders, in MB (0 = off, needs NumPy)
+RENDER_CACHE_DIR = None  # Cache folder (None = the per-user cache folder)
+OVERLAP_IO = True  # Write outputs (and read the next sources) in the background while rendering
+ENCODER = "print"  # Output profile: "proof" (fast JPEG), "print" (optimized JPEG), "archive" (lossless TIFF), ...
+COLOR_MODE = "preserve"  # "preserve" keeps embedded RGB ICC profiles; "srgb" converts every profiled source to sRGB
+MATTE = "white"  # Color transparent pixels (PNG alpha) are composited onto, e.g. "#808080"
+
+def process_images(input_folder, output_folder, log_func, workers=WORKERS, incremental=INCREMENTAL,
+                   on_event=None, instrument=INSTRUMENT, profile=PROFILE_FILE):
     """
     Enhanced processing with better error handling and quality controls.
+    Images are rendered in parallel by the shared batch engine. Engine events
+    go to on_event when given, otherwise they are logged as text via log_func.
+    With instrument, per-stage timings are written next to the outputs.
     """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    files = [f for f in os.listdir(input_folder) if f.lower().endswith(VALID_EXTENSIONS)]
+    specs = specs_from_target_sizes(TARGET_SIZES_INCHES)
+    auto_crop = AUTO_CROP
+    if auto_crop and not AUTO_CROP_AVAILABLE:
+        log_func("Auto crop needs NumPy (pip install numpy); using center crops")
+        auto_crop = False
+    # The file total for the progress bar is counted by the same walk, once it finishes
+    on_total = (lambda count: on_event({"event": "scan_total", "files": count})) if on_event else None
+    jobs = scan_jobs(
+        input_folder, output_folder, specs, recursive=RECURSIVE, extensions=VALID_EXTENSIONS, on_total=on_total,
+        dpi=DPI, quality=JPEG_QUALITY, fast_decode=FAST_DECODE, crop_mode="auto" if auto_crop else None,
+        encoder=ENCODER, color_mode=COLOR_MODE, matte=MATTE,
+    )
+    # Files stream in while the scan continues; only the first is needed to know there is work
+    first, jobs = peek(jobs)
     
-    if not files:
+    if first is None:
         log_func("No valid image files found in input folder")
         return
 
-    for filename in files:
-        input_path = os.path.join(input_folder, filename)
-        try:
-            with Image.open(input_path) as img:
-                base_name = os.path.splitext(filename)[0]
-                log_func(f"\nProcessing: {filename}")
-                
-                # Convert to RGB if needed
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                for (aspect_w, aspect_h), (in_w, in_h) in TARGET_SIZES_INCHES.items():
-                    try:
-                        # Calculate target dimensions
-                        target_w = int(in_w * DPI)
-                        target_h = int(in_h * DPI)
-                        
-                        # Center crop
-                        cropped = center_crop_to_aspect_ratio(img, aspect_w, aspect_h)
-                        
-                        # High-quality resize
-                        resized = cropped.resize((target_w, target_h), Image.LANCZOS)
-                        
-                        # Save settings
-                        out_name = f"{base_name}_{aspect_w}x{aspect_h}_{in_w}x{in_h}in.jpg"
-                        out_path = os.path.join(output_folder, out_name)
-                        
-                        # Save with quality and DPI settings
-                        resized.save(
-                            out_path, 
-                            dpi=(DPI, DPI),
-                            quality=JPEG_QUALITY,
-                            optimize=True,
-                            subsampling=0  # Best quality for JPEG
-                        )
-                        log_func(f"Saved: {out_name} ({target_w}x{target_h}px)")
-                    except Exception as e:
-                        log_func(f"Error processing {filename} for {aspect_w}:{aspect_h}: {str(e)}")
-        except Exception as e:
-            log_func(f"Failed to process {filename}: {str(e)}")
+    cache = None
+    if RENDER_CACHE_MB and RENDER_CACHE_AVAILABLE:
+        cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MB)
+    elif RENDER_CACHE_MB:
+        log_func("The render cache needs NumPy (pip install numpy); rendering without it")
+    engine = BatchEngine(
+        workers=workers, instrument=instrument, profile=profile, memory_mb=MEMORY_BUDGET_MB, cache=cache,
+        overlap_io=OVERLAP_IO,
+    )
+    if on_event is None:
+        on_event = lambda event: log_event(event, log_func)
+    stats = EncoderStats(on_event)
+    report = RunReport(stats) if instrument else None
+    if incremental:
+        run_incremental(engine, jobs, Manifest(output_folder), report or stats)
+    else:
+        engine.run(jobs, report or stats)
     
+    for line in stats.lines():
+        log_func(line)
+    if report is not None:
+        log_func(f"Timing report: {report.write(output_folder)[1]}")
     log_func("\nProcessing complete. Check output folder.")
 
+def log_event(event, log_func):
+    line = format_event(event)
+    if line is not None:
+        log_func(line)
+
 class ImageResizerGUI(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("GUI Image Resizer for Print Sizes")
-        self.geometry("615x550")
+        self.geometry("615x600")
         self.resizable(False, False)
 
         # Use ttk's themed style for a modern look
@@ -142,13 +142,27 @@ class ImageResizerGUI(tk.Tk):
         frame_button = ttk.Frame(container)
         frame_button.grid(row=2, column=0, sticky="ew", pady=10)
         frame_button.columnconfigure(0, weight=1)
-        process_button = ttk.Button(frame_button, text="Process Images", command=self.start_processing)
-        process_button.grid(row=0, column=0, sticky="")
+        self.process_button = ttk.Button(frame_button, text="Process Images", command=self.start_processing)
+        self.process_button.grid(row=0, column=0, sticky="")
+
+        # Progress bar and throughput / ETA line
+        frame_progress = ttk.Frame(container)
+        frame_progress.grid(row=3, column=0, sticky="ew")
+        frame_progress.columnconfigure(0, weight=1)
+        self.progressbar = ttk.Progressbar(frame_progress, mode="determinate")
+        self.progressbar.grid(row=0, column=0, sticky="ew")
+        self.status_var = tk.StringVar()
+        ttk.Label(frame_progress, textvariable=self.status_var).grid(row=1, column=0, sticky="w")
 
         # Log area (scrolled text)
         self.log_area = scrolledtext.ScrolledText(container, width=70, height=20, state="disabled")
-        self.log_area.grid(row=3, column=0, sticky="nsew", pady=10)
-        container.rowconfigure(3, weight=1)
+        self.log_area.grid(row=4, column=0, sticky="nsew", pady=10)
+        container.rowconfigure(4, weight=1)
+
+        # Worker threads only queue messages; the main loop applies them in batches
+        self.channel = TkLogChannel(
+            self, self.log_area, self.progressbar, self.status_var, on_finished=self.enable_widgets
+        )
 
     def browse_input(self):
         folder = filedialog.askdirectory(title="Select Input Folder")
@@ -161,10 +175,8 @@ class ImageResizerGUI(tk.Tk):
             self.output_folder.set(folder)
 
     def log(self, message):
-        self.log_area.config(state="normal")
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state="disabled")
+        # Safe from any thread
+        self.channel.log(message)
 
     def start_processing(self):
         input_dir = self.input_folder.get()
@@ -175,9 +187,7 @@ class ImageResizerGUI(tk.Tk):
             return
 
         # Clear log area
-        self.log_area.config(state="normal")
-        self.log_area.delete("1.0", tk.END)
-        self.log_area.config(state="disabled")
+        self.channel.clear()
 
         # Disable widgets during processing
         for widget in self.winfo_children():
@@ -186,7 +196,9 @@ class ImageResizerGUI(tk.Tk):
                     widget.config(state="disabled")
             except Exception:
                 pass
+        self.process_button.config(state="disabled")
 
+        self.channel.start()
         self.log("Starting image processing...")
 
         # Run the process in a separate thread to avoid freezing the GUI
@@ -197,19 +209,25 @@ class ImageResizerGUI(tk.Tk):
         thread.start()
 
     def run_processing(self, input_dir, output_dir):
-        process_images(input_dir, output_dir, self.log)
-        # Re-enable widgets after processing is complete
-        self.after(0, self.enable_widgets)
+        try:
+            process_images(input_dir, output_dir, self.log, on_event=self.channel.put)
+        except Exception as e:
+            self.log(f"Processing stopped: {str(e)}")
+        finally:
+            self.channel.put({"event": "batch_done"})
 
     def enable_widgets(self):
+        # Runs in the main loop once the channel has drained the "batch_done" event
         for widget in self.winfo_children():
             try:
                 if "state" in widget.keys():
                     widget.config(state="normal")
             except Exception:
                 pass
+        self.process_button.config(state="normal")
         messagebox.showinfo("Complete", "Image processing is complete.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Required for the process pool in frozen builds
     app = ImageResizerGUI()
     app.mainloop()
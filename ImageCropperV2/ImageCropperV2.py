@@ -1,28 +1,44 @@
+import multiprocessing
 import os
-import threading
+import sys
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 from PIL import Image, ImageTk
 
+# The shared engine lives at the repository root, next to this app's folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cropengine import (
+    AUTO_CROP_AVAILABLE, PROFILES, RATIO_DIMENSIONS, RENDER_CACHE_AVAILABLE, BatchEngine, EncoderStats, Manifest,
+    RenderCache, RenderJob, RunControl, RunReport, TkLogChannel, cached_preview,
+    fit_size, make_proofs, peek, run_incremental, scan_jobs, specs_from_dimensions_map,
+)
+
 DPI = 300
 VALID_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".bmp", ".webp")
 JPEG_QUALITY = 95
+WORKERS = None  # Parallel worker processes for folders (None = one per CPU core)
+FAST_DECODE = True  # Decode oversized JPEGs at reduced scale when every output is much smaller
+INCREMENTAL = True  # Default for "Skip Up-to-date Outputs"
+RECURSIVE = True  # Also process subfolders, mirroring them in the output folder
+MEMORY_BUDGET_MB = None  # RAM budget for parallel renders (None = 75% of physical RAM, 0 = no limit)
+INSTRUMENT = False  # Default for "Write Timing Report" (imagecropper-report.csv/.json in the output folder)
+PROFILE_FILE = None  # File name (or path) of one image to run under cProfile, e.g. "IMG_0001.jpg"
+AUTO_CROP = False  # Default for "Auto Crop Center" (subject-aware crops, needs NumPy)
+RENDER_CACHE_MB = 0  # On-disk cache of decoded crops for repeat renders, in MB (0 = off, needs NumPy)
+RENDER_CACHE_DIR = None  # Cache folder (None = the per-user cache folder)
+OVERLAP_IO = True  # Write outputs (and read the next sources) in the background while rendering
+ENCODER = "print"  # Output profile: "proof" (fast JPEG), "print" (optimized JPEG), "archive" (lossless TIFF), ...
+COLOR_MODE = "preserve"  # "preserve" keeps embedded RGB ICC profiles; "srgb" converts every profiled source to sRGB
+MATTE = "white"  # Color transparent pixels (PNG alpha) are composited onto, e.g. "#808080"
+PROOF_FORMAT = "pdf"  # "Proof Sheets" writes one PDF per ratio ("jpg" = numbered JPEG pages)
+# Available print sizes per aspect ratio: RATIO_DIMENSIONS in cropengine/sizes.py
 
-RATIO_DIMENSIONS = {
-    "1:1": [(5, 5), (8, 8), (10, 10), (12, 12), (16, 16), (20, 20), (24, 24), (30, 30), (36, 36)],
-    "4:5": [(4, 5), (8, 10), (11, 14), (16, 20), (20, 25), (24, 30), (32, 40)],
-    "2:3": [(2, 3), (4, 6), (8, 12), (12, 18), (16, 24), (20, 30), (24, 36), (30, 45)],
-    "3:4": [(3, 4), (6, 8), (9, 12), (12, 16), (18, 24), (24, 32), (30, 40)],
-    "5:7": [(5, 7), (10, 14), (15, 21), (20, 28), (25, 35), (30, 42)],
-    "16:9": [(16, 9), (32, 18), (48, 27), (64, 36)],
-    "9:16": [(9, 16), (18, 32), (27, 48), (36, 64)],
-    "16:10": [(16, 10), (32, 20), (48, 30), (64, 40)]
-}
 class ImageResizerGUI(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("GUI Image Resizer for Print Sizes")
-        self.geometry("850x750")
+        self.geometry("850x800")
         self.resizable(False, False)
 
         self.input_folder = tk.StringVar()
@@ -33,8 +49,14 @@ class ImageResizerGUI(tk.Tk):
         self.manual_crop_mode = False
         self.crop_x = None
         self.crop_y = None
+        self.crop_focus = None  # Selected center as fractions of the image, applied to every crop
+
+        # Processing runs on this single background thread; the control cancels/pauses it
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.control = None
 
         self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def create_widgets(self):
         container = ttk.Frame(self, padding=10)
@@ -91,14 +113,47 @@ class ImageResizerGUI(tk.Tk):
         self.manual_crop_check = ttk.Checkbutton(frame_options, text="Enable Manual Crop", command=self.toggle_manual_crop)
         self.manual_crop_check.pack(side="left")
         self.manual_crop_check.state(["!alternate"])
-
-        # Process Button
-        ttk.Button(container, text="Process Images", command=self.start_processing).pack(pady=10)
+        self.incremental_var = tk.BooleanVar(value=INCREMENTAL)
+        ttk.Checkbutton(frame_options, text="Skip Up-to-date Outputs",
+                        variable=self.incremental_var).pack(side="left", padx=10)
+        self.instrument_var = tk.BooleanVar(value=INSTRUMENT)
+        ttk.Checkbutton(frame_options, text="Write Timing Report", variable=self.instrument_var).pack(side="left")
+        # Manual crop still wins for a single image; without NumPy the option is unavailable
+        self.auto_crop_var = tk.BooleanVar(value=AUTO_CROP and AUTO_CROP_AVAILABLE)
+        ttk.Checkbutton(frame_options, text="Auto Crop Center", variable=self.auto_crop_var,
+                        state="normal" if AUTO_CROP_AVAILABLE else "disabled").pack(side="left", padx=10)
+        ttk.Label(frame_options, text="Encoder:").pack(side="left")
+        self.encoder_var = tk.StringVar(value=ENCODER)
+        ttk.Combobox(frame_options, textvariable=self.encoder_var, values=list(PROFILES),
+                     state="readonly", width=13).pack(side="left", padx=5)
+
+        # Process / Pause / Cancel Buttons
+        frame_buttons = ttk.Frame(container)
+        frame_buttons.pack(pady=10)
+        self.process_button = ttk.Button(frame_buttons, text="Process Images", command=self.start_processing)
+        self.process_button.pack(side="left", padx=5)
+        self.proof_button = ttk.Button(frame_buttons, text="Proof Sheets", command=self.start_proof)
+        self.proof_button.pack(side="left", padx=5)
+        self.pause_button = ttk.Button(frame_buttons, text="Pause", command=self.toggle_pause, state="disabled")
+        self.pause_button.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(frame_buttons, text="Cancel", command=self.cancel_processing, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+
+        # Progress bar and throughput / ETA line
+        self.progressbar = ttk.Progressbar(container, mode="determinate")
+        self.progressbar.pack(fill="x", padx=10)
+        self.status_var = tk.StringVar()
+        ttk.Label(container, textvariable=self.status_var).pack(anchor="w", padx=10)
 
         # Log Area
         self.log_area = scrolledtext.ScrolledText(container, width=100, height=15, state="disabled")
         self.log_area.pack(padx=10, pady=10)
 
+        # Processing only queues messages; the main loop applies them in batches
+        self.channel = TkLogChannel(
+            self, self.log_area, self.progressbar, self.status_var, on_finished=self.processing_finished
+        )
+
 
     def browse_input_folder(self):
         folder = filedialog.askdirectory(title="Select Input Folder")
@@ -135,118 +190,232 @@ class ImageResizerGUI(tk.Tk):
         self.manual_crop_mode = not self.manual_crop_mode
 
     def start_processing(self):
-        if self.input_folder.get():
-            self.process_folder()
-        elif self.input_file.get():
-            self.process_single_image()
-        else:
-            messagebox.showwarning("Missing Input", "Please select an input file or folder.")
+        if self.control is not None:
+            return  # Already running
 
-    def process_folder(self):
         input_dir = self.input_folder.get()
+        img_path = self.input_file.get()
         output_dir = self.output_folder.get()
 
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        files = [f for f in os.listdir(input_dir) if f.lower().endswith(VALID_EXTENSIONS)]
-        
-        if not files:
-            self.log("No valid image files found in input folder")
+        if not input_dir and not img_path:
+            messagebox.showwarning("Missing Input", "Please select an input file or folder.")
+            return
+        if not output_dir:
+            messagebox.showwarning("Missing Output", "Please select an output folder.")
             return
 
-        for filename in files:
-            input_path = os.path.join(input_dir, filename)
-            try:
-                with Image.open(input_path) as img:
-                    base_name = os.path.splitext(filename)[0]
-                    self.log(f"\nProcessing: {filename}")
-
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
+        # Tk state is read here, on the main thread; the background task only gets plain values
+        specs = specs_from_dimensions_map(self.dimensions_map)
+        instrument = self.instrument_var.get()
+        crop_mode = "auto" if self.auto_crop_var.get() else None
+        encoder = self.encoder_var.get()
+        if input_dir:
+            task, args = self.process_folder, (
+                input_dir, output_dir, specs, self.incremental_var.get(), instrument, crop_mode, encoder)
+        else:
+            # The crop picker is a Tk window, so it runs before handing off
+            if self.manual_crop_mode and not self.select_crop_center(img_path):
+                return
+            focus = self.crop_focus if self.manual_crop_mode else None
+            task, args = self.process_single_image, (
+                img_path, output_dir, specs, instrument, focus, crop_mode, encoder)
+
+        self.control = RunControl()
+        self.set_running(True)
+        self.channel.start()
+        self.executor.submit(self.run_in_background, task, *args)
+
+    def start_proof(self):
+        if self.control is not None:
+            return  # Already running
 
-                    for ratio, dimensions in self.dimensions_map.items():
-                        aspect_w, aspect_h = map(int, ratio.split(":"))
-                        for dim in dimensions:
-                            width_in, height_in = map(int, dim.split("x"))
-                            target_w = width_in * DPI
-                            target_h = height_in * DPI
+        input_dir = self.input_folder.get()
+        output_dir = self.output_folder.get()
+        if not input_dir:
+            messagebox.showwarning("Missing Input", "Proof sheets need an input folder.")
+            return
+        if not output_dir:
+            messagebox.showwarning("Missing Output", "Please select an output folder.")
+            return
 
-                            cropped = self.center_crop_to_aspect_ratio(img, aspect_w, aspect_h)
-                            resized = cropped.resize((target_w, target_h), Image.LANCZOS)
+        specs = specs_from_dimensions_map(self.dimensions_map)
+        crop_mode = "auto" if self.auto_crop_var.get() else None
+        self.control = RunControl()
+        self.set_running(True)
+        self.channel.start()
+        self.executor.submit(self.run_in_background, self.proof_folder, input_dir, output_dir, specs, crop_mode)
 
-                            out_name = f"{base_name}_{aspect_w}x{aspect_h}_{width_in}x{height_in}in.jpg"
-                            out_path = os.path.join(output_dir, out_name)
+    def run_in_background(self, task, *args):
+        try:
+            task(*args)
+        except Exception as e:
+            self.log(f"Processing stopped: {str(e)}")
+        finally:
+            self.channel.put({"event": "batch_done"})
+
+    def processing_finished(self):
+        # Runs in the main loop once the channel has drained the "batch_done" event
+        self.control = None
+        self.set_running(False)
+
+    def on_close(self):
+        # Stop a running batch cleanly; the interpreter waits for the worker thread on exit
+        if self.control is not None:
+            self.control.cancel()
+        self.destroy()
+
+    def set_running(self, running):
+        self.process_button.config(state="disabled" if running else "normal")
+        self.proof_button.config(state="disabled" if running else "normal")
+        self.cancel_button.config(state="normal" if running else "disabled")
+        self.pause_button.config(state="normal" if running else "disabled", text="Pause")
+
+    def cancel_processing(self):
+        if self.control is not None and not self.control.cancelled:
+            self.control.cancel()
+            self.pause_button.config(state="disabled", text="Pause")
+            self.log("\nCancelling... outputs in progress are discarded, finished ones are kept.")
+
+    def toggle_pause(self):
+        if self.control is None:
+            return
+        if self.control.paused:
+            self.control.resume()
+            self.pause_button.config(text="Pause")
+            self.log("Resumed")
+        else:
+            self.control.pause()
+            self.pause_button.config(text="Resume")
+            self.log("Paused after the current outputs")
 
-                            resized.save(out_path, dpi=(DPI, DPI), quality=JPEG_QUALITY, optimize=True, subsampling=0)
-                            self.log(f"Saved: {out_name} ({target_w}x{target_h}px)")
+    def finish_message(self):
+        if self.control is not None and self.control.cancelled:
+            return "\nProcessing cancelled. No partial files were left in the output folder."
+        return "\nProcessing complete. Check output folder."
 
-            except Exception as e:
-                self.log(f"Failed to process {filename}: {str(e)}")
+    def process_folder(self, input_dir, output_dir, specs, incremental, instrument=False, crop_mode=None,
+                       encoder=None):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
 
-        self.log("\nProcessing complete. Check output folder.")
+        jobs = scan_jobs(
+            input_dir, output_dir, specs, recursive=RECURSIVE, extensions=VALID_EXTENSIONS, on_total=self.scan_total,
+            dpi=DPI, quality=JPEG_QUALITY, fast_decode=FAST_DECODE, crop_mode=crop_mode, encoder=encoder,
+            color_mode=COLOR_MODE, matte=MATTE,
+        )
+        first, jobs = peek(jobs)
+        
+        if first is None:
+            self.log("No valid image files found in input folder")
+            return
 
-    def process_single_image(self):
-        img_path = self.input_file.get()
-        output_dir = self.output_folder.get()
+        engine = BatchEngine(
+            workers=WORKERS, control=self.control, instrument=instrument, profile=PROFILE_FILE,
+            memory_mb=MEMORY_BUDGET_MB, cache=self.render_cache(), overlap_io=OVERLAP_IO,
+        )
+        stats = EncoderStats(self.log_event)
+        report = RunReport(stats) if instrument else None
+        if incremental:
+            run_incremental(engine, jobs, Manifest(output_dir), report or stats)
+        else:
+            engine.run(jobs, on_event=report or stats)
+
+        self.write_report(report, stats, output_dir)
+        self.log(self.finish_message())
+
+    def proof_folder(self, input_dir, output_dir, specs, crop_mode=None):
+        jobs = scan_jobs(
+            input_dir, output_dir, specs, recursive=RECURSIVE, extensions=VALID_EXTENSIONS, on_total=self.scan_total,
+            fast_decode=FAST_DECODE, crop_mode=crop_mode, color_mode=COLOR_MODE, matte=MATTE,
+        )
+        sheets = make_proofs(jobs, output_dir, PROOF_FORMAT, WORKERS, self.control, self.log_event,
+                             title=os.path.basename(os.path.normpath(input_dir)))
+        if sheets:
+            self.log("\nProof sheets written: " + ", ".join(os.path.basename(path) for path in sheets))
+
+    def scan_total(self, files):
+        # Called from the scan's walk-ahead thread once every file has been found
+        self.channel.put({"event": "scan_total", "files": files})
+
+    def select_crop_center(self, img_path):
+        """
+        Show the crop picker for img_path; returns False if it was cancelled.
+        """
+        try:
+            # The picker only needs a 500px preview, not a full decode; it is cached per file
+            preview, orig_size = cached_preview(img_path, 500, FAST_DECODE)
+        except Exception as e:
+            self.log(f"Failed to process {img_path}: {str(e)}")
+            return False
 
+        self.crop_x = None  # Reset previous selection
+        self.crop_y = None
+        self.show_crop_window(preview, orig_size)
+        # Wait for crop window to close
+        self.wait_window(self.crop_window)
+        
+        if self.crop_x is None or self.crop_y is None:
+            self.log("Crop selection cancelled")
+            return False
+        # Fractions of the image, so the center survives reduced-resolution decoding
+        self.crop_focus = ((self.crop_x + 0.5) / orig_size[0], (self.crop_y + 0.5) / orig_size[1])
+        self.log(f"Crop center: X={self.crop_x}, Y={self.crop_y}")
+        return True
+
+    def process_single_image(self, img_path, output_dir, specs, instrument=False, focus=None, crop_mode=None,
+                             encoder=None):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
+        self.channel.put({"event": "scan_total", "files": 1})
+        job = RenderJob(
+            img_path, output_dir, specs, DPI, JPEG_QUALITY, fast_decode=FAST_DECODE, focus=focus, crop_mode=crop_mode,
+            encoder=encoder, color_mode=COLOR_MODE, matte=MATTE,
+        )
+        stats = EncoderStats(self.log_event)
+        report = RunReport(stats) if instrument else None
+        engine = BatchEngine(
+            workers=1, control=self.control, instrument=instrument, profile=PROFILE_FILE, cache=self.render_cache(),
+            overlap_io=OVERLAP_IO,
+        )
+        engine.run([job], on_event=report or stats)
+
+        self.write_report(report, stats, output_dir)
+        self.log(self.finish_message())
+
+    def render_cache(self):
+        if not RENDER_CACHE_MB:
+            return None
+        if not RENDER_CACHE_AVAILABLE:
+            self.log("The render cache needs NumPy (pip install numpy); rendering without it")
+            return None
+        return RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MB)
+
+    def write_report(self, report, stats, output_dir):
+        for line in stats.lines():
+            self.log(line)
+        if report is None:
+            return
         try:
-            with Image.open(img_path) as img:
-                base_name = os.path.splitext(os.path.basename(img_path))[0]
-
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                if self.manual_crop_mode:
-                    self.crop_x = None  # Reset previous selection
-                    self.crop_y = None
-                    self.show_crop_window(img)
-                    # Wait for crop window to close
-                    self.wait_window(self.crop_window)
-                    
-                    if self.crop_x is None or self.crop_y is None:
-                        self.log("Crop selection cancelled")
-                        return
-
-                for ratio, dimensions in self.dimensions_map.items():
-                    aspect_w, aspect_h = map(int, ratio.split(":"))
-                    for dim in dimensions:
-                        width_in, height_in = map(int, dim.split("x"))
-                        target_w = width_in * DPI
-                        target_h = height_in * DPI
-
-                        cropped = self.center_crop_to_aspect_ratio(img, aspect_w, aspect_h)
-                        resized = cropped.resize((target_w, target_h), Image.LANCZOS)
-
-                        out_name = f"{base_name}_{aspect_w}x{aspect_h}_{width_in}x{height_in}in.jpg"
-                        out_path = os.path.join(output_dir, out_name)
-
-                        resized.save(out_path, dpi=(DPI, DPI), quality=JPEG_QUALITY, optimize=True, subsampling=0)
-                        self.log(f"Saved: {out_name} ({target_w}x{target_h}px)")
-
-            self.log("\nProcessing complete. Check output folder.")
-
-        except Exception as e:
-            self.log(f"Failed to process {img_path}: {str(e)}")
+            self.log(f"Timing report: {report.write(output_dir)[1]}")
+        except OSError as e:
+            self.log(f"Could not write timing report: {str(e)}")
 
     def clear_ratio_dimensions(self):
         self.dimensions_map.clear()
         self.dimensions_display.delete(0, tk.END)
 
-    def show_crop_window(self, img):
+    def show_crop_window(self, img, orig_size=None):
         self.crop_window = tk.Toplevel(self)
         self.crop_window.title("Select Crop Center")
         
-        orig_w, orig_h = img.size
+        # img may be a reduced decode; coordinates are always mapped to the original size
+        orig_w, orig_h = orig_size or img.size
         max_size = 500
-        ratio = min(max_size / orig_w, max_size / orig_h)
-        new_w = int(orig_w * ratio)
-        new_h = int(orig_h * ratio)
+        new_w, new_h = fit_size((orig_w, orig_h), max_size)
         
-        img_resized = img.resize((new_w, new_h), Image.LANCZOS)
+        # Cached previews arrive already fitted
+        img_resized = img if img.size == (new_w, new_h) else img.resize((new_w, new_h), Image.LANCZOS)
         self.tk_img = ImageTk.PhotoImage(img_resized)
         
         self.canvas = tk.Canvas(self.crop_window, width=max_size, height=max_size)
@@ -307,26 +476,14 @@ class ImageResizerGUI(tk.Tk):
         else:
             messagebox.showerror("Invalid Selection", "Please click within the image area")
 
-    def center_crop_to_aspect_ratio(self, img, aspect_w, aspect_h):
-        orig_w, orig_h = img.size
-        target_ratio = aspect_w / aspect_h
-        current_ratio = orig_w / orig_h
-
-        if current_ratio > target_ratio:
-            new_width = int(orig_h * target_ratio)
-            left = (orig_w - new_width) // 2
-            return img.crop((left, 0, left + new_width, orig_h))
-        else:
-            new_height = int(orig_w / target_ratio)
-            top = (orig_h - new_height) // 2
-            return img.crop((0, top, orig_w, top + new_height))
-
     def log(self, message):
-        self.log_area.config(state="normal")
-        self.log_area.insert(tk.END, message + "\n")
-        self.log_area.see(tk.END)
-        self.log_area.config(state="disabled")
+        # Safe from any thread
+        self.channel.log(message)
+
+    def log_event(self, event):
+        self.channel.put(event)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Required for the process pool in frozen builds
     app = ImageResizerGUI()
     app.mainloop()
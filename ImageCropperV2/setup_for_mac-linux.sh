@@ -27,7 +27,7 @@ python3 -m venv venv
 echo "Installing dependencies..."
 source venv/bin/activate
 python3 -m pip install --upgrade pip==23.3.1
-python3 -m pip install pyinstaller==6.3.0 pillow tk
+python3 -m pip install pyinstaller==6.3.0 pillow tk numpy
 
 # BUILD EXECUTABLE
 echo "Building executable..."
@@ -35,6 +35,7 @@ python3 -m PyInstaller \
     --onefile \
     --noconfirm \
     --noconsole \
+    --paths .. \
     --name "ImageCropperV2" \
     ImageCropper.py
 
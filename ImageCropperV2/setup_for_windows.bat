@@ -31,7 +31,7 @@ python -m venv venv
 echo Installing dependencies...
 call .\venv\Scripts\activate.bat
 python -m pip install --upgrade pip==23.3.1
-python -m pip install pyinstaller==6.3.0 pillow tk
+python -m pip install pyinstaller==6.3.0 pillow tk numpy
 
 :: BUILD EXECUTABLE
 echo Building executable...
@@ -39,6 +39,7 @@ python -m PyInstaller ^
     --onefile ^
     --noconfirm ^
     --noconsole ^
+    --paths .. ^
     --name "ImageCropperV2" ^
     ImageCropperV2.py
 
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark for the crop / resize / encode pipeline.
+
+Generates deterministic synthetic sources (RGB JPEG, RGBA PNG, 16-bit TIFF,
+palette PNG), runs them through the TARGET_SIZES_INCHES (V1) or
+RATIO_DIMENSIONS (V2) matrices and reports per-stage wall time, peak RSS and
+output bytes as JSON. Each case runs in a fresh process so peak RSS belongs
+to that case alone.
+
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json
+
+Exits with status 1 when any stage regressed against the baseline.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from cropengine import (  # noqa: E402
+    DEFAULT_ENCODER, PROFILES, RATIO_DIMENSIONS, TARGET_SIZES_INCHES, OutputSpec, RenderJob,
+    center_crop_to_aspect_ratio, get_profile, parse_selection, prepare, render_job, save_params,
+    specs_from_target_sizes, target_pixels, to_8bit,
+)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = {
+    "rgb": ("RGB", "JPEG", ".jpg"),
+    "rgba": ("RGBA", "PNG", ".png"),
+    "i16": ("I;16", "TIFF", ".tif"),
+    "palette": ("P", "PNG", ".png"),
+}
+STAGES = ("decode", "convert", "crop", "resize", "encode")
+
+# A stage regresses when it is this much slower than the baseline...
+REGRESSION_TOLERANCE = 0.10
+# ...and by at least this many milliseconds (ignores noise on tiny stages)
+REGRESSION_MIN_MS = 5.0
+
+
+def make_source(path, width, height, mode_key):
+    """
+    Deterministic photo-like test image: gradients for smooth areas, fixed-seed
+    noise for texture. Uses only Pillow so the benchmark has no extra dependencies.
+    """
+    mode, fmt, _ = MODES[mode_key]
+    horizontal = Image.linear_gradient("L").rotate(90).resize((width, height))
+    vertical = Image.linear_gradient("L").resize((width, height))
+    radial = Image.radial_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 24)
+    base = Image.merge("RGB", (horizontal, vertical, Image.blend(radial, noise, 0.5)))
+
+    if mode == "RGBA":
+        img = base.copy()
+        img.putalpha(radial)
+    elif mode == "I;16":
+        img = Image.blend(horizontal, noise, 0.3).point(lambda v: v * 257, "I").convert("I;16")
+    elif mode == "P":
+        img = base.quantize(colors=256)
+    else:
+        img = base
+    img.save(path, fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+
+
+def matrix_specs(name, selections):
+    if selections:
+        return [spec for selection in selections for spec in parse_selection(selection)]
+    if name == "v1":
+        return specs_from_target_sizes(TARGET_SIZES_INCHES)
+    return [spec for ratio in RATIO_DIMENSIONS for spec in parse_selection(ratio)]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_stages(path, specs, dpi, quality, encoder):
+    """
+    The pipeline's stages, called one by one so each can be timed.
+    """
+    times = dict.fromkeys(STAGES, 0.0)
+    output_bytes = 0
+
+    start = time.perf_counter()
+    img = Image.open(path)
+    img.load()
+    times["decode"] += time.perf_counter() - start
+
+    # Alpha matting, ICC transforms and the 16-bit float working mode, as render_job does
+    start = time.perf_counter()
+    img, icc = prepare(img)
+    times["convert"] += time.perf_counter() - start
+
+    for spec in specs:
+        start = time.perf_counter()
+        cropped = center_crop_to_aspect_ratio(img, spec.aspect_w, spec.aspect_h)
+        times["crop"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        resized = cropped.resize(target_pixels(spec, dpi), Image.LANCZOS)
+        times["resize"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        buffer = io.BytesIO()
+        to_8bit(resized).save(buffer, encoder.format, **save_params(encoder, dpi, quality, icc=icc))
+        times["encode"] += time.perf_counter() - start
+        output_bytes += buffer.tell()
+
+    return times, output_bytes
+
+
+def run_case(case):
+    """
+    Benchmark one (source, matrix) pair. Runs in its own process.
+    """
+    specs = [OutputSpec(*spec) for spec in case["specs"]]
+    samples = {stage: [] for stage in STAGES}
+    pipeline = []
+    overlapped = []
+    output_bytes = 0
+
+    for _ in range(case["repeats"]):
+        times, output_bytes = _run_stages(
+            case["path"], specs, case["dpi"], case["quality"], get_profile(case["encoder"]))
+        for stage, seconds in times.items():
+            samples[stage].append(seconds)
+
+        # The engine end to end, with the planner and reduced decode it uses in production,
+        # writing on the rendering thread and then with writes overlapped (as BatchEngine does)
+        for overlap_io, timings in ((False, pipeline), (True, overlapped)):
+            with tempfile.TemporaryDirectory() as out_dir:
+                job = RenderJob(case["path"], out_dir, specs, case["dpi"], case["quality"], encoder=case["encoder"])
+                start = time.perf_counter()
+                render_job(job, overlap_io=overlap_io)
+                timings.append(time.perf_counter() - start)
+
+    with Image.open(case["path"]) as img:
+        source_size = img.size
+    return {
+        "case": case["name"],
+        "source": os.path.basename(case["path"]),
+        "source_pixels": source_size[0] * source_size[1],
+        "output_pixels": sum(w * h for w, h in (target_pixels(s, case["dpi"]) for s in specs)),
+        "outputs": len(specs),
+        "stages_ms": {stage: round(statistics.median(v) * 1000, 2) for stage, v in samples.items()},
+        "pipeline_ms": round(statistics.median(pipeline) * 1000, 2),
+        "pipeline_overlap_ms": round(statistics.median(overlapped) * 1000, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_bytes,
+    }
+
+
+def calibration(results):
+    """
+    Throughput per stage across all cases, in nanoseconds per pixel: decode and
+    convert per source pixel, crop/resize/encode per output pixel.
+    """
+    totals = dict.fromkeys(STAGES, 0.0)
+    source_pixels = sum(r["source_pixels"] for r in results)
+    output_pixels = sum(r["output_pixels"] for r in results)
+    for result in results:
+        for stage in STAGES:
+            totals[stage] += result["stages_ms"][stage] * 1e6
+    per_pixel = {}
+    for stage in STAGES:
+        pixels = source_pixels if stage in ("decode", "convert") else output_pixels
+        per_pixel[stage] = round(totals[stage] / pixels, 3) if pixels else None
+    bytes_per_pixel = sum(r["output_bytes"] for r in results) / output_pixels if output_pixels else None
+    return {"ns_per_pixel": per_pixel, "output_bytes_per_pixel": bytes_per_pixel and round(bytes_per_pixel, 4)}
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE, min_ms=REGRESSION_MIN_MS):
+    """
+    List stages that got slower than the baseline, matched by case name.
+    """
+    base_cases = {case["case"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for result in results:
+        base = base_cases.get(result["case"])
+        if base is None:
+            continue
+        measured = dict(result["stages_ms"], pipeline=result["pipeline_ms"],
+                        pipeline_overlap=result["pipeline_overlap_ms"])
+        reference = dict(base["stages_ms"], pipeline=base["pipeline_ms"],
+                         pipeline_overlap=base.get("pipeline_overlap_ms"))
+        for stage, ms in measured.items():
+            before = reference.get(stage)
+            if before is not None and ms > before * (1 + tolerance) and ms - before >= min_ms:
+                regressions.append({
+                    "case": result["case"], "stage": stage, "baseline_ms": before, "ms": ms,
+                    "change": f"+{(ms / before - 1) * 100:.0f}%" if before else "new",
+                })
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sizes", default="3000x2000,6000x4000",
+                        help="comma-separated source sizes WxH (default %(default)s)")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help=f"comma-separated source modes from {', '.join(MODES)} (default all)")
+    parser.add_argument("--matrix", choices=("v1", "v2"), default="v1",
+                        help="v1 = TARGET_SIZES_INCHES, v2 = every RATIO_DIMENSIONS size (default v1)")
+    parser.add_argument("-s", "--select", action="append",
+                        help="use these RATIO[=WxH,...] selections instead of a matrix; repeatable")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--quality", type=int, default=95)
+    parser.add_argument("--encoder", choices=PROFILES, default=DEFAULT_ENCODER, help="output encoder profile")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--baseline", help="compare against this saved result and flag regressions")
+    parser.add_argument("--save-baseline", metavar="PATH", help="also write the results to PATH")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--workdir", help="keep generated sources here (default: a temp folder)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    specs = matrix_specs(args.matrix, args.select)
+    matrix_name = "custom" if args.select else args.matrix
+    # Non-default encoders get their own case names, so baselines only compare like with like
+    if args.encoder != DEFAULT_ENCODER:
+        matrix_name += "/" + args.encoder
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="cropbench-")
+    os.makedirs(workdir, exist_ok=True)
+    cases = []
+    for size in args.sizes.split(","):
+        width, height = map(int, size.lower().split("x"))
+        for mode_key in args.modes.split(","):
+            name = f"{width}x{height}-{mode_key}"
+            path = os.path.join(workdir, name + MODES[mode_key][2])
+            if not os.path.exists(path):
+                make_source(path, width, height, mode_key)
+            cases.append({
+                "name": f"{name}/{matrix_name}", "path": path, "specs": [list(s) for s in specs],
+                "dpi": args.dpi, "quality": args.quality, "encoder": args.encoder, "repeats": args.repeats,
+            })
+
+    results = []
+    # One fresh process per case keeps peak RSS per case honest
+    with multiprocessing.Pool(processes=1, maxtasksperchild=1) as pool:
+        for result in pool.imap(run_case, cases):
+            results.append(result)
+            print(f"{result['case']}: pipeline {result['pipeline_ms']:.0f} ms "
+                  f"({result['pipeline_overlap_ms']:.0f} ms overlapped), peak {result['peak_rss_mb']} MB",
+                  file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(), "pillow": PIL.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "matrix": matrix_name, "dpi": args.dpi, "quality": args.quality, "encoder": args.encoder,
+            "repeats": args.repeats,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "cases": results,
+        "calibration": calibration(results),
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f))
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['case']} {regression['stage']}: {regression['baseline_ms']} -> "
+                  f"{regression['ms']} ms ({regression['change']})", file=sys.stderr)
+        status = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
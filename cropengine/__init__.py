@@ -0,0 +1,55 @@
+"""
+Headless processing engine shared by the ImageCropper GUIs.
+
+Nothing in this package imports tkinter, so it can run on machines without a display.
+"""
+
+import importlib
+
+from .batch import BatchEngine, FileResult, OutputResult, RenderJob, format_event, render_job
+from .cache import RENDER_CACHE_AVAILABLE, RenderCache, default_cache_dir
+from .color import (
+    COLOR_MANAGEMENT_AVAILABLE, COLOR_MODE, COLOR_MODES, MATTE, output_profile, prepare, to_8bit,
+)
+from .control import Cancelled, RunControl
+from .decode import (
+    FAST_DECODE, cached_preview, decode_scale, decoded_size, fit_size, load_for_outputs, load_preview,
+    source_profile,
+)
+from .encoders import (
+    DEFAULT_ENCODER, PROFILES, EncoderProfile, EncoderStats, encode_output, get_profile, save_output,
+    save_params,
+)
+from .estimate import (
+    DEFAULT_CALIBRATION, UPSCALE_WARNING, Calibration, FileEstimate, OutputEstimate, estimate_batch, estimate_job,
+    load_calibration, upscale_factor,
+)
+from .imaging import (
+    DPI, JPEG_QUALITY, VALID_EXTENSIONS, OutputSpec, center_crop_to_aspect_ratio, crop_box,
+    focal_crop_to_aspect_ratio, output_name, specs_from_dimensions_map, specs_from_target_sizes,
+    target_pixels,
+)
+from .instrument import REPORT_NAME, RunReport, StageTimer, memory_mb
+from .jobqueue import JobQueue, LeasedJob, job_from_json, job_to_json
+from .manifest import MANIFEST_NAME, Manifest, run_incremental
+from .memory import STRIP_PIXELS, MemoryBudget, estimate_job_mb, estimate_peak_mb, save_strips
+from .pipeline import AsyncWriter, Prefetcher
+from .plan import CASCADE_FACTOR, RenderPlan, build_plan
+from .progress import ProgressTracker, TkLogChannel
+from .proofs import PROOF_FORMATS, ProofSheet, SheetLayout, make_proofs, proof_tiles
+from .saliency import AUTO_CROP_AVAILABLE, CROP_MODES, SaliencyMap
+from .scan import ScanEntry, count_images, peek, scan_entry, scan_images, scan_jobs, sniff_image
+from .sizes import RATIO_DIMENSIONS, TARGET_SIZES_INCHES, parse_selection
+
+# Modules that are also run with `python -m` are imported on first use only;
+# importing them here would make runpy warn that they were already imported
+_LAZY_NAMES = {
+    "Worker": "worker",
+    "INOTIFY_AVAILABLE": "watch", "Debouncer": "watch", "FolderWatcher": "watch", "Inotify": "watch",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{_LAZY_NAMES[name]}", __name__), name)
@@ -0,0 +1,536 @@
+"""
+Headless batch engine: spreads per-image (or per-image x per-size) render jobs
+across a process pool and reports progress as event dicts.
+"""
+
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from math import gcd
+
+from PIL import Image
+
+from .control import Cancelled
+from .color import to_8bit
+from .decode import FAST_DECODE, decoded_size, load_for_outputs, source_profile
+from .encoders import encode_output, get_profile, save_output
+from .imaging import DPI, JPEG_QUALITY, base_name_of, focal_crop_to_aspect_ratio, output_name
+from .instrument import NULL_TIMER, StageTimer, matches_source, profiled
+from .memory import STRIP_PIXELS, MemoryBudget, default_budget_mb, estimate_job_mb, is_strip_output, save_strips
+from .pipeline import AsyncWriter, Prefetcher
+from .plan import CASCADE_FACTOR, build_plan
+from .saliency import SaliencyMap
+
+# focus is the crop center as (x, y) fractions of the source, or None to center every crop;
+# crop_mode "auto" picks a subject-aware focus per ratio when no focus is given;
+# encoder names an EncoderProfile (None = DEFAULT_ENCODER); color_mode and matte
+# control ICC handling and alpha compositing (None = color.COLOR_MODE / color.MATTE)
+RenderJob = namedtuple(
+    "RenderJob",
+    "source output_dir specs dpi quality cascade_factor fast_decode focus crop_mode encoder color_mode matte",
+)
+RenderJob.__new__.__defaults__ = (DPI, JPEG_QUALITY, CASCADE_FACTOR, FAST_DECODE, None, None, None, None, None)
+
+OutputResult = namedtuple("OutputResult", "spec name path size elapsed error")
+FileResult = namedtuple("FileResult", "source outputs error")
+
+# Marker a pool worker puts on the event queue after the last event of a task
+_TASK_DONE = "__task_done__"
+
+# Event queue and RunControl installed in each pool worker by _init_worker
+_worker_events = None
+_worker_control = None
+
+
+def _discard(event):
+    pass
+
+
+def render_job(job, emit=None, announce=True, control=None, instrument=False, profile=None,
+               strip_pixels=STRIP_PIXELS, cache=None, overlap_io=False, source_data=None):
+    """
+    Decode one source once (at reduced scale when allowed) and write every
+    requested output following its render plan (one crop per ratio, cascaded
+    resizes), emitting progress events.
+    `announce` controls the file-level events (started / planned / failed) so
+    split jobs for the same source only report them once. A RunControl is
+    checked before the decode and before every output.
+    `instrument` adds per-stage timings and memory samples to output_saved and
+    emits a "file_timed" event; if `profile` names this source, the render runs
+    under cProfile and the stats go to <output_dir>/<name>.prof.
+    Outputs of strip_pixels or more are resized and encoded strip-wise
+    (see cropengine.memory); 0 disables that. With a RenderCache, crops are
+    read from and stored in it, and the source is only decoded on a miss.
+    `overlap_io` encodes outputs to memory and writes them on a background
+    thread while the next output renders; every write has finished (and been
+    reported) when render_job returns. `source_data` is the source file's
+    content if it has already been read (see Prefetcher).
+    """
+    emit = emit or _discard
+    timer = StageTimer() if instrument else NULL_TIMER
+    profile_path = None
+    if announce and matches_source(job.source, profile):
+        profile_path = os.path.join(job.output_dir, base_name_of(job.source) + ".prof")
+    try:
+        with profiled(profile_path):
+            return _render_job(job, emit, announce, control, timer, strip_pixels, cache, overlap_io, source_data)
+    finally:
+        if timer.enabled:
+            emit({"event": "file_timed", "source": job.source, "stages_ms": timer.rounded(),
+                  "peak_mb": timer.peak_mb})
+
+
+def _render_job(job, emit, announce, control, timer, strip_pixels, cache=None, overlap_io=False, data=None):
+    outputs = {}
+    writer = AsyncWriter() if overlap_io else None
+    error = None
+    cancelled = False
+    try:
+        if control is not None:
+            control.checkpoint()
+        os.makedirs(job.output_dir, exist_ok=True)
+        if cache is None:
+            img, source_size = load_for_outputs(
+                job.source, job.specs, job.dpi, job.fast_decode, timer=timer, data=data,
+                color_mode=job.color_mode, matte=job.matte)
+            size = img.size
+            icc = img.info.get("icc_profile")
+        else:
+            # Decoded lazily, on the first crop the cache does not have
+            img = None
+            source_size, size = decoded_size(job.source, job.specs, job.dpi, job.fast_decode, data=data)
+            icc = source_profile(job.source, job.color_mode, data)
+        base_name = base_name_of(job.source)
+        if announce:
+            emit({
+                "event": "file_started", "source": job.source,
+                "size": list(source_size), "decoded": list(size),
+            })
+
+        saliency = None
+        cached = 0
+        plan = build_plan(job.specs, size, job.dpi, job.cascade_factor, strip_pixels)
+        plan_start = time.perf_counter()
+        for step in plan.steps:
+            cropped = key = None
+            if cache is not None:
+                with timer.stage("cache"):
+                    key = cache.key(job, step.aspect_w, step.aspect_h, data)
+                    cropped = cache.get(key, step.crop_size)
+                cached += cropped is not None
+            if cropped is None:
+                if img is None:
+                    img, _ = load_for_outputs(
+                        job.source, job.specs, job.dpi, job.fast_decode, timer=timer, data=data,
+                        color_mode=job.color_mode, matte=job.matte)
+                if saliency is None and job.crop_mode == "auto" and job.focus is None:
+                    with timer.stage("analyze"):
+                        saliency = SaliencyMap(img)
+                focus = job.focus if saliency is None else saliency.focus_for(step.crop_size, size)
+                with timer.stage("crop"):
+                    cropped = focal_crop_to_aspect_ratio(img, step.aspect_w, step.aspect_h, focus)
+                if key is not None:
+                    with timer.stage("cache"):
+                        cache.put(key, cropped)
+            _render_step(job, cropped, base_name, step, outputs, emit, control, timer, strip_pixels, writer, icc)
+            cropped = None
+    except Cancelled as e:
+        cancelled, error = True, str(e)
+    except Exception as e:
+        error = str(e)
+    finally:
+        if writer is not None:
+            writer.close()  # Outputs already encoded are still written, never half
+
+    # Split parts (announce=False) stay silent; the engine reports the file once
+    if announce:
+        if cancelled:
+            emit({"event": "file_cancelled", "source": job.source, "completed": len(outputs)})
+        elif error is not None:
+            emit({"event": "file_error", "source": job.source, "error": error})
+        else:
+            elapsed = time.perf_counter() - plan_start
+            emit({
+                "event": "file_planned", "source": job.source,
+                "outputs": plan.output_count, "crops": len(plan.steps),
+                "cascaded": plan.cascaded_count, "cached": cached, "ms": round(elapsed * 1000, 1),
+                "saved_ms": round(plan.estimated_saving(elapsed) * 1000, 1),
+            })
+    return FileResult(job.source, _in_spec_order(job, outputs), error)
+
+
+def _render_step(job, cropped, base_name, step, outputs, emit, control=None, timer=NULL_TIMER,
+                 strip_pixels=STRIP_PIXELS, writer=None, icc=None):
+    """
+    Render a ratio's sizes largest-first from its single crop, saving them
+    directly or through an AsyncWriter, with `icc` embedded. Cascade
+    intermediates stay in the crop's working mode; each output is brought
+    to 8 bits just before it is encoded.
+    """
+    encoder = get_profile(job.encoder)
+    # Keep each intermediate only until the last output that cascades from it
+    last_use = {out.parent: index for index, out in enumerate(step.outputs) if out.parent is not None}
+    rendered = {}
+    for index, planned in enumerate(step.outputs):
+        if writer is not None:
+            writer.poll()
+        if control is not None:
+            control.checkpoint()
+        spec = planned.spec
+        start = time.perf_counter()
+        out_name = output_name(base_name, spec, encoder.extension)
+        out_path = os.path.join(job.output_dir, out_name)
+        # Always timed: encode throughput is reported per encoder profile
+        out_timer = StageTimer()
+        settle = partial(_settle_output, job, emit, outputs, timer, encoder, spec, out_name, out_path,
+                         planned.size, start, out_timer)
+        try:
+            source = rendered.get(planned.parent, cropped)
+            if encoder.streams and is_strip_output(planned.size, strip_pixels):
+                # Never a cascade parent (see build_plan), so the full output is never held in memory
+                save_strips(source, planned.size, out_path, job.dpi, job.quality, encoder, timer=out_timer,
+                            icc=icc)
+            else:
+                with out_timer.stage("resize"):
+                    resized = source.resize(planned.size, Image.LANCZOS)
+                if index in last_use:
+                    rendered[index] = resized
+                with out_timer.stage("encode"):
+                    output = to_8bit(resized)
+                    if writer is None:
+                        save_output(output, out_path, job.dpi, job.quality, encoder, icc=icc)
+                    else:
+                        data = encode_output(output, job.dpi, job.quality, encoder, icc)
+                if writer is not None:
+                    writer.submit(out_path, data, settle, out_timer)
+                    settle = None  # The writer settles it once the file is in place
+            if settle is not None:
+                settle(None)
+        except Exception as e:
+            settle(e)
+        for parent in [p for p, last in last_use.items() if last == index]:
+            rendered.pop(parent, None)
+
+
+def _settle_output(job, emit, outputs, timer, encoder, spec, out_name, out_path, size, start, out_timer, error):
+    """
+    Record and report one output once it is on disk (error None) or has failed.
+    """
+    elapsed = time.perf_counter() - start
+    if error is not None:
+        outputs[spec] = OutputResult(spec, out_name, out_path, None, elapsed, str(error))
+        emit({
+            "event": "output_error", "source": job.source, "name": out_name,
+            "ratio": f"{spec.aspect_w}:{spec.aspect_h}", "error": str(error),
+        })
+        return
+    outputs[spec] = OutputResult(spec, out_name, out_path, size, elapsed, None)
+    event = {
+        "event": "output_saved", "source": job.source, "name": out_name,
+        "path": out_path, "width": size[0], "height": size[1],
+        "ms": round(elapsed * 1000, 1), "encoder": encoder.name,
+        "encode_ms": round(out_timer.ms["encode"], 1), "bytes": os.path.getsize(out_path),
+    }
+    if timer.enabled:
+        timer.merge(out_timer)
+        event.update(stages_ms=out_timer.rounded(), rss_mb=out_timer.peak_mb)
+    emit(event)
+
+
+def _in_spec_order(job, outputs):
+    results = []
+    for spec in job.specs:
+        if spec in outputs and outputs[spec] not in results:
+            results.append(outputs[spec])
+    return results
+
+
+def format_event(event):
+    """
+    Render an engine event as the log line the GUIs have always printed,
+    or None for progress-only events that should not be logged.
+    """
+    kind = event["event"]
+    filename = os.path.basename(event.get("source", ""))
+    if kind == "file_started":
+        return f"\nProcessing: {filename}"
+    if kind == "output_saved":
+        return f"Saved: {event['name']} ({event['width']}x{event['height']}px)"
+    if kind == "output_error":
+        return f"Error processing {filename} for {event['ratio']}: {event['error']}"
+    if kind == "file_planned":
+        cached = f" ({event['cached']} from cache)" if event.get("cached") else ""
+        return (f"Rendered {event['outputs']} outputs from {event['crops']} crop(s){cached}, "
+                f"{event['cascaded']} cascaded (~{event['saved_ms'] / 1000:.1f}s saved vs. per-size crop+resize)")
+    if kind == "manifest_checked":
+        lines = [f"Up to date: {event['skipped_outputs']} output(s) skipped, "
+                 f"{event['skipped_files']} file(s) unchanged, {event['pending_files']} to process"]
+        for stale in event["stale"]:
+            lines.append(f"Stale: {os.path.basename(stale['source'])} is gone but left "
+                         f"{', '.join(stale['outputs'])}")
+        return "\n".join(lines)
+    if kind == "file_error":
+        return f"Failed to process {filename}: {event['error']}"
+    if kind == "file_cancelled":
+        return f"Cancelled: {filename} ({event['completed']} output(s) finished)"
+    if kind == "proof_page":
+        return f"Proof page {event['page']} for {event['ratio']}: {os.path.basename(event['path'])}"
+    if kind == "proof_finished":
+        return (f"Proof sheets: {event['files']} file(s) on {event['pages']} page(s) "
+                f"in {event['ms'] / 1000:.1f}s")
+    if kind == "proof_cancelled":
+        return "Proof cancelled; unfinished PDFs were discarded"
+    if kind == "file_estimated":
+        return "\n".join(f"Warning: {warning}" for warning in event["warnings"]) or None
+    if kind == "estimate_finished":
+        return (f"Dry run: {event['pending_outputs']} of {event['outputs']} output(s) to render from "
+                f"{event['files']} file(s), ~{event['bytes'] / 1e9:.2f} GB, ~{event['wall_ms'] / 60000:.1f} min "
+                f"on {event['workers']} worker(s), {event['upscaled']} enlarged beyond the warning limit")
+    if kind in ("file_skipped", "scan_total", "file_timed", "file_proofed"):
+        return None
+    return str(event)
+
+
+def _ratio_groups(specs):
+    groups = {}
+    for spec in specs:
+        divisor = gcd(spec.aspect_w, spec.aspect_h)
+        groups.setdefault((spec.aspect_w // divisor, spec.aspect_h // divisor), []).append(spec)
+    return list(groups.values())
+
+
+def _init_worker(events, control):
+    global _worker_events, _worker_control
+    _worker_events = events
+    _worker_control = control
+
+
+def _pool_render(task_id, job, announce, options):
+    try:
+        return render_job(job, _worker_events.put, announce, _worker_control, **options)
+    finally:
+        _worker_events.put((_TASK_DONE, task_id))
+
+
+class BatchEngine:
+    """
+    Runs render jobs serially or across a process pool.
+
+    workers      -- pool size; None means one per CPU core, 1 runs in-process
+    split_sizes  -- schedule every (image, aspect ratio) pair as its own task
+                    instead of one task per image; better balance for few images
+                    with many sizes, at the cost of decoding the source once per
+                    ratio (sizes of one ratio stay together so they can cascade)
+    control      -- optional RunControl; cancelling stops between outputs and
+                    leaves no partial files, pausing blocks workers in place
+    instrument   -- record per-stage timings and memory (see cropengine.instrument)
+    profile      -- path or file name of one source to render under cProfile
+    memory_mb    -- RAM budget for the pool: tasks are only started while their
+                    estimated peaks fit; None means MEMORY_FRACTION of physical
+                    RAM, 0 no limit
+    strip_pixels -- outputs this large are rendered strip-wise; 0 disables
+    cache        -- optional RenderCache of crops shared across sizes and runs
+    overlap_io   -- write outputs on a background thread while the next one
+                    renders and, when running in-process, read the next
+                    sources ahead (see cropengine.pipeline)
+
+    Each run() starts and stops its own process pool, unless start() has
+    been called: the pool then serves every run() until close(). Use that
+    (or a with block) for long-lived callers such as the watch service.
+    """
+
+    def __init__(self, workers=None, split_sizes=False, control=None, instrument=False, profile=None,
+                 memory_mb=None, strip_pixels=STRIP_PIXELS, cache=None, overlap_io=True):
+        self.workers = workers or os.cpu_count() or 1
+        self.split_sizes = split_sizes
+        self.control = control
+        self.memory_mb = default_budget_mb() if memory_mb is None else memory_mb
+        self.options = {"instrument": instrument, "profile": profile, "strip_pixels": strip_pixels, "cache": cache,
+                        "overlap_io": overlap_io}
+        self._pool = None  # (executor, event queue) kept by start()
+
+    def start(self):
+        """
+        Keep one process pool for every run() until close().
+        """
+        if self.workers > 1 and self._pool is None:
+            self._pool = self._new_pool()
+        return self
+
+    def close(self):
+        if self._pool is not None:
+            pool, events = self._pool
+            self._pool = None
+            pool.shutdown()
+            events.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _new_pool(self):
+        ctx = multiprocessing.get_context()
+        events = ctx.Queue()
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                   initializer=_init_worker, initargs=(events, self.control))
+        return pool, events
+
+    def _tasks(self, jobs, seen):
+        """
+        Lazily expand jobs into (job index, job, announce) tasks, appending each
+        job to `seen` as it is pulled so a streaming source can feed the pool.
+        """
+        for index, job in enumerate(jobs):
+            seen.append(job)
+            groups = _ratio_groups(job.specs) if self.split_sizes else [job.specs]
+            if len(groups) > 1:
+                for part, specs in enumerate(groups):
+                    yield index, job._replace(specs=specs), part == 0
+            else:
+                yield index, job, True
+
+    def run(self, jobs, on_event=None):
+        """
+        Render all jobs and return one FileResult per job, in job order.
+        `jobs` may be a generator; work starts as soon as the first job arrives.
+        Events are delivered to on_event (e.g. a queue's put) in the calling thread.
+        """
+        on_event = on_event or _discard
+        seen = []
+        tasks = self._tasks(jobs, seen)
+
+        if self.workers <= 1:
+            partials = []
+            # Pool workers already overlap each other's reads, so only the serial loop prefetches
+            if self.options["overlap_io"]:
+                tasks = Prefetcher(tasks, lambda task: task[1].source)
+            else:
+                tasks = ((task, None) for task in tasks)
+            try:
+                for (index, job, announce), data in tasks:
+                    if self.control is not None and self.control.cancelled:
+                        break
+                    partials.append((index, render_job(job, on_event, announce, self.control,
+                                                       source_data=data, **self.options)))
+            finally:
+                tasks.close()
+        else:
+            partials = self._run_pool(tasks, on_event)
+
+        return self._merge(seen, partials)
+
+    def _run_pool(self, tasks, on_event):
+        if self._pool is not None:
+            pool, events = self._pool
+            partials, broken = self._schedule(pool, events, tasks, on_event)
+            if broken:
+                # A worker died and took the pool with it; the next run gets a fresh one
+                self.close()
+                self.start()
+            return partials
+        pool, events = self._new_pool()
+        with pool:
+            partials, _ = self._schedule(pool, events, tasks, on_event)
+        events.close()
+        return partials
+
+    def _schedule(self, pool, events, tasks, on_event):
+        """
+        Feed `tasks` to `pool` within the memory budget and forward worker
+        events until every task has finished. Returns (partials, whether the
+        pool broke).
+        """
+        partials = []
+        broken = False
+        remaining = set()  # task ids whose done-marker has not arrived yet
+        futures = {}
+        # Keep a little work queued per worker without draining the whole generator
+        max_pending = self.workers * 2
+        exhausted = False
+        budget = MemoryBudget(self.memory_mb, self.workers)
+        held = None  # Next task, pulled from the generator but waiting for memory
+
+        while True:
+            if self.control is not None and self.control.cancelled and not exhausted:
+                exhausted = True
+                # Drop queued tasks that no worker has picked up yet
+                held = None
+                for future in [f for f in futures if f.cancel()]:
+                    task_id, _, _, cost = futures.pop(future)
+                    remaining.discard(task_id)
+                    budget.release(cost)
+            while not exhausted and len(futures) < max_pending:
+                if held is None:
+                    try:
+                        index, job, announce = next(tasks)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    cost = estimate_job_mb(job, self.options["strip_pixels"]) if budget.limit_mb else 0
+                    held = (index, job, announce, cost)
+                index, job, announce, cost = held
+                if not budget.fits(cost):
+                    break
+                held = None
+                budget.acquire(cost)
+                task_id = len(partials)
+                partials.append(None)
+                remaining.add(task_id)
+                futures[pool.submit(_pool_render, task_id, job, announce, self.options)] = (
+                    task_id, index, job, cost)
+
+            if exhausted and held is None and not futures and not remaining:
+                break
+            if futures:
+                done, _ = wait(futures, timeout=0.05, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id, index, job, cost = futures.pop(future)
+                    budget.release(cost)
+                    try:
+                        partials[task_id] = (index, future.result())
+                    except Exception as e:
+                        # Worker died (e.g. killed by the OS); no marker will follow
+                        broken = broken or isinstance(e, BrokenProcessPool)
+                        remaining.discard(task_id)
+                        partials[task_id] = (index, FileResult(job.source, [], str(e)))
+                        on_event({"event": "file_error", "source": job.source, "error": str(e)})
+            self._drain(events, on_event, remaining, block=not futures)
+
+        return partials, broken
+
+    @staticmethod
+    def _drain(events, on_event, remaining, block):
+        while remaining:
+            try:
+                item = events.get(timeout=0.05) if block else events.get_nowait()
+            except queue.Empty:
+                return
+            if isinstance(item, tuple) and item[0] == _TASK_DONE:
+                remaining.discard(item[1])
+            else:
+                on_event(item)
+
+    @staticmethod
+    def _merge(jobs, partials):
+        outputs = [[] for _ in jobs]
+        # Jobs without any finished task were cancelled before they started
+        errors = ["cancelled"] * len(jobs)
+        started = set()
+        for partial in partials:
+            if partial is None:
+                continue  # Cancelled before it started
+            index, result = partial
+            outputs[index].extend(result.outputs)
+            if index not in started:
+                started.add(index)
+                errors[index] = None
+            if result.error and errors[index] is None:
+                errors[index] = result.error
+        return [FileResult(job.source, outputs[i], errors[i]) for i, job in enumerate(jobs)]
@@ -0,0 +1,176 @@
+"""
+On-disk render cache of decoded, cropped intermediates.
+
+Re-rendering a source to a different set of sizes normally repeats the decode,
+the RGB conversion and every crop. With a RenderCache, each ratio's crop is
+stored as a NumPy .npy file keyed by the source's content hash, the ratio, the
+crop center and the color settings, but not the decoded size. A later run
+reads it back through a memory map and never decodes the source, as long as
+the cached crop is at least as large as the crop it needs; a larger one (kept
+from a run with bigger outputs) is resized from directly. When every ratio
+hits, the source file is only hashed. A crop that is too small is replaced by
+the larger one the new run decodes.
+
+The cache is bounded by total bytes. Entries are stamped on every hit and the
+least recently used are evicted after each write. Several worker processes can
+share one cache directory: entries are written to a temp file and renamed
+into place, and races on eviction are harmless.
+
+NumPy is optional: without it, RENDER_CACHE_AVAILABLE is False.
+"""
+
+import hashlib
+import os
+from math import gcd
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .color import COLOR_MODE, MATTE
+from .manifest import data_digest, file_digest
+
+RENDER_CACHE_AVAILABLE = np is not None
+# Bump when decoding or cropping changes, so old entries are never reused
+CACHE_VERSION = 3
+CACHE_SUFFIX = ".npy"
+
+_MB = 1 << 20
+
+
+def default_cache_dir():
+    """
+    Per-user cache folder (LOCALAPPDATA on Windows, XDG_CACHE_HOME or ~/.cache elsewhere).
+    """
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "imagecropper", "crops")
+
+
+class RenderCache:
+    """
+    Size-bounded LRU cache of cropped intermediates in `directory`.
+    Picklable, so a BatchEngine hands it to its pool workers.
+    """
+
+    def __init__(self, directory=None, limit_mb=1024):
+        if np is None:
+            raise RuntimeError("the render cache needs NumPy (pip install numpy)")
+        self.directory = directory or default_cache_dir()
+        self.limit_bytes = int(limit_mb * _MB)
+        self._digests = {}  # (path, size, mtime) -> content hash, per process
+
+    def source_digest(self, path, data=None):
+        """
+        Content hash of `path`, computed once per process while its size and
+        mtime hold; `data` is its content when already read.
+        """
+        st = os.stat(path)
+        key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        if key not in self._digests:
+            self._digests[key] = file_digest(path) if data is None else data_digest(data)
+        return self._digests[key]
+
+    def key(self, job, aspect_w, aspect_h, data=None):
+        """
+        Cache key of one ratio's crop of job.source, whatever size it was decoded at.
+        """
+        divisor = gcd(aspect_w, aspect_h)
+        if job.focus is not None:
+            center = "%.6f,%.6f" % tuple(job.focus)
+        else:
+            center = "auto" if job.crop_mode == "auto" else "center"
+        text = (f"v{CACHE_VERSION};{self.source_digest(job.source, data)};{aspect_w // divisor}:{aspect_h // divisor};"
+                f"{center};{job.color_mode or COLOR_MODE};{job.matte or MATTE}")
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key, min_size=None):
+        """
+        The cached crop (RGB, or F for 16-bit grayscale sources), or None on a
+        miss or when it is smaller than min_size (width, height).
+        """
+        path = self._path(key)
+        try:
+            pixels = np.load(path, mmap_mode="r")
+            if min_size is not None and (pixels.shape[1] < min_size[0] or pixels.shape[0] < min_size[1]):
+                return None  # Decoded for smaller outputs; the caller replaces it
+            # Pillow copies the mapped rows into its own 4-bytes-per-pixel layout
+            img = Image.fromarray(pixels)
+        except (OSError, ValueError, TypeError):
+            return None  # Missing, evicted meanwhile, or a damaged entry
+        if img.mode not in ("RGB", "F"):
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return img
+
+    def put(self, key, img):
+        """
+        Store a crop (unless it alone exceeds the limit), then evict.
+        Returns False if it was not stored; a full disk never fails a render.
+        """
+        if img.width * img.height * len(img.getbands()) * (4 if img.mode == "F" else 1) > self.limit_bytes:
+            return False
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                np.save(f, np.asarray(img))
+            os.replace(temp_path, path)
+        except OSError:
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+        return True
+
+    def entries(self):
+        """
+        (mtime, bytes, path) of every entry, oldest first.
+        """
+        result = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return result
+        for name in names:
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((st.st_mtime, st.st_size, path))
+        result.sort()
+        return result
+
+    def evict(self):
+        """
+        Remove least recently used entries until the total fits the limit.
+        Returns the number of bytes freed.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in entries:
+            if total - freed <= self.limit_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Already gone, or still mapped elsewhere (Windows)
+            freed += size
+        return freed
+
+    def usage_mb(self):
+        return round(sum(size for _, size, _ in self.entries()) / _MB, 1)
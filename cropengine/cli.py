@@ -0,0 +1,262 @@
+"""
+Headless command-line batch mode.
+
+    python -m cropengine INPUT OUTPUT --select 4:5=8x10,16x20 --select 1:1
+
+Progress is streamed to stdout as one JSON object per line. Exit codes:
+0 every output saved, 1 partial failure, 2 usage error, 3 nothing succeeded.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from .batch import BatchEngine, RenderJob
+from .cache import RENDER_CACHE_AVAILABLE, RenderCache, default_cache_dir
+from .color import COLOR_MODE, COLOR_MODES, MATTE, matte_rgb
+from .decode import FAST_DECODE
+from .encoders import DEFAULT_ENCODER, PROFILES, EncoderStats
+from .estimate import UPSCALE_WARNING, estimate_batch, load_calibration
+from .imaging import DPI, JPEG_QUALITY, VALID_EXTENSIONS
+from .instrument import REPORT_NAME, RunReport
+from .manifest import Manifest, run_incremental
+from .memory import MEMORY_FRACTION, STRIP_PIXELS
+from .plan import CASCADE_FACTOR
+from .proofs import PROOF_FORMATS, make_proofs
+from .saliency import AUTO_CROP_AVAILABLE, CROP_MODES
+from .scan import peek, scan_jobs
+from .sizes import RATIO_DIMENSIONS, parse_selection
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+
+
+def add_job_arguments(parser):
+    """
+    The options that describe what each RenderJob renders (read back with job_settings).
+    """
+    parser.add_argument(
+        "-s", "--select", action="append", required=True, metavar="RATIO[=WxH,...]",
+        help=f"aspect ratio and print sizes in inches, e.g. 4:5=8x10,16x20; a bare ratio "
+             f"selects all of its sizes; repeatable. Ratios: {', '.join(RATIO_DIMENSIONS)}",
+    )
+    parser.add_argument("--crop", choices=CROP_MODES, default="center",
+                        help="center every crop, or 'auto' to center it on the subject (needs NumPy)")
+    parser.add_argument("--focus", metavar="X,Y",
+                        help="crop center as fractions of the image, e.g. 0.5,0.3 (default: centered)")
+    parser.add_argument("--dpi", type=int, default=DPI, help=f"output resolution (default {DPI})")
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY,
+                        help=f"JPEG quality 1-100 (default {JPEG_QUALITY})")
+    parser.add_argument("--encoder", choices=PROFILES, default=DEFAULT_ENCODER,
+                        help=f"output encoder profile: proof (fast JPEG), print (optimized JPEG), archive "
+                             f"(lossless TIFF) or archive-png/-webp/-jpeg (default {DEFAULT_ENCODER})")
+    parser.add_argument("--color", choices=COLOR_MODES, default=COLOR_MODE,
+                        help="keep embedded RGB ICC profiles (converting CMYK/gray ones to sRGB), or "
+                             f"convert every profiled source to sRGB (default {COLOR_MODE})")
+    parser.add_argument("--matte", default=MATTE,
+                        help=f"color transparent pixels are composited onto, e.g. white or #808080 "
+                             f"(default {MATTE})")
+    parser.add_argument("--cascade-factor", type=float, default=CASCADE_FACTOR,
+                        help=f"min intermediate/target size to cascade resizes from, 0 disables "
+                             f"(default {CASCADE_FACTOR})")
+    parser.add_argument("--no-fast-decode", dest="fast_decode", action="store_false", default=FAST_DECODE,
+                        help="always decode sources at full resolution")
+
+
+def job_settings(parser, args):
+    """
+    Validate the add_job_arguments options; returns (specs, RenderJob keyword arguments).
+    """
+    specs = []
+    try:
+        for selection in args.select:
+            specs.extend(parse_selection(selection))
+    except ValueError as e:
+        parser.error(str(e))
+    if not 1 <= args.quality <= 100:
+        parser.error("--quality must be between 1 and 100")
+    focus = None
+    if args.focus:
+        try:
+            focus = tuple(float(v) for v in args.focus.split(","))
+        except ValueError:
+            focus = ()
+        if len(focus) != 2 or not all(0 <= v <= 1 for v in focus):
+            parser.error(f"--focus must be two fractions between 0 and 1, e.g. 0.5,0.3, not {args.focus!r}")
+    try:
+        matte_rgb(args.matte)
+    except ValueError:
+        parser.error(f"--matte must be a color name or #rrggbb, not {args.matte!r}")
+    if args.crop == "auto" and not AUTO_CROP_AVAILABLE:
+        parser.error("--crop auto needs NumPy (pip install numpy)")
+    return specs, dict(
+        dpi=args.dpi, quality=args.quality, cascade_factor=args.cascade_factor, fast_decode=args.fast_decode,
+        focus=focus, crop_mode=args.crop, encoder=args.encoder, color_mode=args.color, matte=args.matte,
+    )
+
+
+def add_render_arguments(parser):
+    """
+    Per-worker render options (read back with render_options).
+    """
+    parser.add_argument("--strip-megapixels", type=float, default=STRIP_PIXELS / 1e6,
+                        help=f"render outputs this large strip-wise to bound memory; their JPEGs are not "
+                             f"Huffman-optimized and pixels may round one level differently, 0 disables "
+                             f"(default {STRIP_PIXELS / 1e6:g})")
+    parser.add_argument("--cache-mb", type=int, default=0,
+                        help="keep decoded crops in an on-disk cache of this many MB for repeat renders "
+                             "(needs NumPy; default 0, off)")
+    parser.add_argument("--cache-dir", help=f"render cache folder (default {default_cache_dir()})")
+    parser.add_argument("--no-overlap-io", dest="overlap_io", action="store_false",
+                        help="read sources and write outputs on the rendering thread")
+
+
+def render_options(parser, args):
+    """
+    Validate the add_render_arguments options; returns render_job / BatchEngine keyword arguments.
+    """
+    if args.cache_mb and not RENDER_CACHE_AVAILABLE:
+        parser.error("--cache-mb needs NumPy (pip install numpy)")
+    return dict(
+        strip_pixels=int(args.strip_megapixels * 1e6),
+        cache=RenderCache(args.cache_dir, args.cache_mb) if args.cache_mb else None,
+        overlap_io=args.overlap_io,
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cropengine",
+        description="Crop and resize images to print sizes without the GUI.",
+    )
+    parser.add_argument("input", help="image file or folder of images")
+    parser.add_argument("output", help="output folder (created if missing)")
+    add_job_arguments(parser)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU core)")
+    parser.add_argument("--split-sizes", action="store_true",
+                        help="schedule each (image, ratio) pair as its own task")
+    parser.add_argument("--memory-mb", type=int, default=None,
+                        help=f"RAM budget for parallel renders; tasks wait until their estimated peak fits "
+                             f"(default {MEMORY_FRACTION * 100:.0f}%% of physical RAM, 0 no limit)")
+    add_render_arguments(parser)
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="only process the top level of an input folder")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="only process files whose relative path or name matches; repeatable")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="skip files and folders whose relative path or name matches; repeatable")
+    parser.add_argument("--no-incremental", dest="incremental", action="store_false",
+                        help="render every output even if the manifest says it is up to date")
+    parser.add_argument("--report", action="store_true",
+                        help=f"time every stage and write {REPORT_NAME}.csv/.json into the output folder")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run this source (path or file name) under cProfile; stats go to <name>.prof")
+    parser.add_argument("--proof", choices=PROOF_FORMATS,
+                        help="instead of rendering, write proof sheets of every crop (one PDF or set of "
+                             "JPEG pages per ratio) into the output folder")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="instead of rendering, read only the image headers and list every planned output "
+                             "with its upscale factor, estimated size and time")
+    parser.add_argument("--calibration", metavar="FILE",
+                        help="bench_pipeline.py report whose timings and output sizes --dry-run estimates with")
+    parser.add_argument("--max-upscale", type=float, default=UPSCALE_WARNING,
+                        help=f"--dry-run warns about outputs enlarged more than this (default {UPSCALE_WARNING:g})")
+    return parser
+
+
+class JsonEventWriter:
+    """
+    Writes engine events as newline-delimited JSON and tallies the outcome.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.unchanged_files = 0
+        self.saved = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def __call__(self, event):
+        if event["event"] == "manifest_checked":
+            self.unchanged_files += event["skipped_files"]
+            self.skipped += event["skipped_outputs"]
+        elif event["event"] == "output_saved":
+            self.saved += 1
+        elif event["event"] in ("output_error", "file_error"):
+            self.errors += 1
+        self.stream.write(json.dumps(dict(event, ts=round(time.time(), 3))) + "\n")
+        self.stream.flush()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    specs, settings = job_settings(parser, args)
+    options = render_options(parser, args)
+    if args.memory_mb is not None and args.memory_mb < 0:
+        parser.error("--memory-mb must be 0 (no limit) or a positive number of MB")
+    if not os.path.exists(args.input):
+        parser.error(f"input not found: {args.input}")
+    calibrations = None
+    if args.calibration:
+        try:
+            calibrations = load_calibration(args.calibration)
+        except (OSError, ValueError) as e:
+            parser.error(f"--calibration: {e}")
+
+    writer = JsonEventWriter()
+    start = time.perf_counter()
+    if os.path.isdir(args.input):
+        jobs = scan_jobs(
+            args.input, args.output, specs, args.recursive, args.include, args.exclude, **settings,
+        )
+        first, jobs = peek(jobs)
+        if first is None:
+            writer({"event": "batch_error", "error": f"no {'/'.join(VALID_EXTENSIONS)} files in {args.input}"})
+            return EXIT_FAILED
+    else:
+        jobs = [RenderJob(args.input, args.output, specs, **settings)]
+
+    if args.dry_run:
+        # Nothing is written; the manifest (if any) only marks outputs that are up to date
+        manifest = Manifest(args.output) if args.incremental else None
+        summary = estimate_batch(jobs, calibrations, args.workers, args.memory_mb, manifest, writer,
+                                 args.max_upscale, options["strip_pixels"])
+        if not summary["errors"]:
+            return EXIT_OK
+        return EXIT_PARTIAL if summary["files"] > summary["errors"] else EXIT_FAILED
+
+    os.makedirs(args.output, exist_ok=True)
+    if args.proof:
+        title = os.path.basename(os.path.normpath(args.input))
+        sheets = make_proofs(jobs, args.output, args.proof, args.workers, on_event=writer, title=title)
+        return EXIT_OK if not writer.errors else EXIT_PARTIAL if sheets else EXIT_FAILED
+
+    engine = BatchEngine(
+        workers=args.workers, split_sizes=args.split_sizes, instrument=args.report, profile=args.profile,
+        memory_mb=args.memory_mb, **options,
+    )
+    stats = EncoderStats(writer)
+    report = RunReport(stats) if args.report else None
+    if args.incremental:
+        results = run_incremental(engine, jobs, Manifest(args.output), report or stats)
+    else:
+        results = engine.run(jobs, report or stats)
+    if report is not None:
+        json_path, csv_path = report.write(args.output)
+        writer({"event": "report_written", "json": json_path, "csv": csv_path, "totals": report.totals()})
+
+    writer({
+        "event": "batch_finished", "files": len(results) + writer.unchanged_files, "saved": writer.saved,
+        "skipped": writer.skipped, "errors": writer.errors, "ms": round((time.perf_counter() - start) * 1000, 1),
+        "encoders": stats.summary(),
+    })
+    if not writer.errors:
+        return EXIT_OK
+    return EXIT_PARTIAL if writer.saved or writer.skipped else EXIT_FAILED
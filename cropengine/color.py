@@ -0,0 +1,164 @@
+"""
+Color-managed, precision-preserving conversion of decoded sources.
+
+A plain convert('RGB') drops embedded ICC profiles, clips 16-bit grayscale to
+white and drops alpha without compositing. prepare() instead:
+
+    alpha    RGBA/LA/PA and transparent palettes are composited onto a matte
+             color (white by default) in the output color space
+    ICC      "preserve" keeps an RGB source's pixels and embeds its profile
+             in the outputs; CMYK and grayscale profiles (which an RGB output
+             cannot carry) are converted to sRGB. "srgb" converts every
+             profiled source to sRGB. Transforms are built once per profile
+             and reused for the rest of the batch.
+    16-bit   grayscale sources stay 32-bit float through crop and resize and
+             are rounded to 8 bits only just before encoding (to_8bit)
+
+Sources without a profile are treated as sRGB and converted as before.
+Pillow built without LittleCMS leaves COLOR_MANAGEMENT_AVAILABLE False;
+profiled RGB sources still have their profile embedded, other profiled
+sources fall back to Pillow's plain conversion.
+"""
+
+import hashlib
+import io
+from collections import OrderedDict
+
+from PIL import Image, ImageColor
+
+try:
+    from PIL import ImageCms
+except ImportError:
+    ImageCms = None
+
+COLOR_MANAGEMENT_AVAILABLE = ImageCms is not None
+
+COLOR_MODES = ("preserve", "srgb")
+COLOR_MODE = "preserve"
+MATTE = "white"  # Background for transparent pixels; any Pillow color name or #rrggbb
+TRANSFORM_CACHE_SIZE = 32  # Built ICC transforms kept per process, most recently used last
+
+HIGH_BIT_MODES = ("I;16", "I;16L", "I;16B", "I;16N", "I")  # Grayscale, 0..65535
+_ALPHA_BASE = {"RGBA": "RGB", "LA": "L", "PA": "RGB", "RGBa": "RGB", "La": "L"}
+_CMS_MODES = ("RGB", "CMYK", "L")  # Input modes a transform is built for
+
+_transforms = OrderedDict()
+_srgb = None
+
+
+def matte_rgb(matte=None):
+    """
+    (r, g, b) of a matte color name; None means MATTE.
+    """
+    return ImageColor.getrgb(matte or MATTE)[:3]
+
+
+def srgb_profile():
+    """
+    The sRGB profile as bytes, embedded in outputs converted to sRGB.
+    """
+    global _srgb
+    if _srgb is None:
+        _srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    return _srgb
+
+
+def _transform(icc, mode):
+    # Relative colorimetric with black point compensation, the usual choice for photographs
+    key = (hashlib.blake2b(icc, digest_size=16).digest(), mode)
+    if key in _transforms:
+        _transforms.move_to_end(key)
+        return _transforms[key]
+    source = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+    transform = ImageCms.buildTransform(
+        source, ImageCms.createProfile("sRGB"), mode, "RGB",
+        renderingIntent=ImageCms.Intent.RELATIVE_COLORIMETRIC, flags=ImageCms.Flags.BLACKPOINTCOMPENSATION,
+    )
+    _transforms[key] = transform
+    if len(_transforms) > TRANSFORM_CACHE_SIZE:
+        _transforms.popitem(last=False)
+    return transform
+
+
+def _profile_mode(mode):
+    # The mode a profiled source's pixels are transformed from
+    mode = _ALPHA_BASE.get(mode, mode)
+    if mode in HIGH_BIT_MODES or mode == "F":
+        return "L"
+    return mode if mode in _CMS_MODES else "RGB"
+
+
+def output_profile(img, color_mode=None):
+    """
+    The ICC profile (bytes or None) that outputs of `img` embed. Only needs
+    the header, so it also works for sources served from the render cache.
+    """
+    color_mode = color_mode or COLOR_MODE
+    if color_mode not in COLOR_MODES:
+        raise ValueError(f"unknown color mode {color_mode!r} (choose from {', '.join(COLOR_MODES)})")
+    icc = img.info.get("icc_profile")
+    if not icc:
+        return None
+    mode = _profile_mode(img.mode)
+    if mode == "RGB" and color_mode != "srgb":
+        return icc
+    if not COLOR_MANAGEMENT_AVAILABLE:
+        return None
+    try:
+        _transform(icc, mode)
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        return None  # Damaged or unsupported profile: plain conversion, untagged
+    return srgb_profile()
+
+
+def prepare(img, color_mode=None, matte=None):
+    """
+    A loaded source in its working mode, and the ICC profile (bytes or None)
+    its outputs should embed. The working mode is RGB, or F (0..255 floats)
+    for 16-bit grayscale sources without a profile.
+    """
+    icc = img.info.get("icc_profile") or None
+    out_icc = output_profile(img, color_mode)
+    alpha = None
+    if img.mode == "P" or (img.mode in ("L", "RGB") and "transparency" in img.info):
+        img = img.convert("RGBA")
+    if img.mode in _ALPHA_BASE:
+        alpha = img.getchannel("A")
+        if alpha.getextrema() == (255, 255):
+            alpha = None  # Fully opaque; nothing to composite
+        img = img.convert(_ALPHA_BASE[img.mode])
+
+    if img.mode in HIGH_BIT_MODES or img.mode == "F":
+        work = img.convert("F")
+        if img.mode != "F":
+            work = work.point(lambda v: v / 257)
+        if alpha is None and not icc:
+            return work, None
+        img = _rounded_l(work)  # Compositing and ICC transforms work on 8 bits
+
+    if out_icc is not None and out_icc != icc:
+        # Converted to sRGB with the cached transform
+        if img.mode not in _CMS_MODES:
+            img = img.convert("RGB")
+        img = ImageCms.applyTransform(img, _transform(icc, img.mode))
+    elif img.mode != "RGB":
+        img = img.convert("RGB")
+    if alpha is not None:
+        background = Image.new("RGB", img.size, matte_rgb(matte))
+        background.paste(img, mask=alpha)
+        img = background
+    return img, out_icc
+
+
+def to_8bit(img):
+    """
+    A working-mode image as the 8-bit RGB image that gets encoded.
+    """
+    if img.mode == "F":
+        return _rounded_l(img).convert("RGB")
+    return img
+
+
+def _rounded_l(img):
+    # Round to nearest; Pillow's F to L conversion truncates
+    return img.point(lambda v: v + 0.5).convert("L")
@@ -0,0 +1,48 @@
+"""
+Cancel / pause control shared between the caller and pool workers.
+"""
+
+import multiprocessing
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RunControl:
+    """
+    Checked by workers between outputs. Backed by multiprocessing events so the
+    same object works in-process and inside pool workers.
+    """
+
+    def __init__(self, ctx=None):
+        ctx = ctx or multiprocessing.get_context()
+        self._cancelled = ctx.Event()
+        self._running = ctx.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # Wake paused workers so they can stop
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """
+        Block while paused; raise Cancelled once cancel() has been called.
+        """
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise Cancelled("cancelled")
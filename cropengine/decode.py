@@ -0,0 +1,160 @@
+"""
+Reduced-resolution decoding for sources much larger than every planned output.
+
+JPEGs use libjpeg DCT scaling (Image.draft), which skips most of the decode
+work. Other formats are decoded in full and then box-reduced by an integer
+factor before color conversion. Either way, the decoded crop stays at least
+DECODE_GAP times the largest target, so the final LANCZOS resize still has
+fully oversampled input.
+"""
+
+import io
+import os
+from collections import OrderedDict
+from math import ceil
+
+from PIL import Image
+
+from .color import HIGH_BIT_MODES, output_profile, prepare, to_8bit
+from .imaging import DPI, target_pixels
+from .instrument import NULL_TIMER
+from .plan import crop_size_for
+
+FAST_DECODE = True
+DECODE_GAP = 2.0
+PREVIEW_CACHE_SIZE = 16  # Fitted previews kept in memory, most recently used last
+
+_preview_cache = OrderedDict()
+
+
+def decode_scale(source_size, specs, dpi=DPI, gap=DECODE_GAP):
+    """
+    Smallest fraction of the source resolution that still serves every spec.
+    Returns 1.0 when any output needs the full resolution (or more).
+    """
+    scale = 0.0
+    for spec in specs:
+        crop_w, crop_h = crop_size_for(source_size, spec.aspect_w, spec.aspect_h)
+        target_w, target_h = target_pixels(spec, dpi)
+        scale = max(scale, target_w * gap / crop_w, target_h * gap / crop_h)
+    return min(1.0, scale) if specs else 1.0
+
+
+def _prepare_decode(img, specs, dpi, fast, gap):
+    """
+    Set up DCT scaling on an opened, not yet loaded image.
+    Returns (original_size, box reduce factor still to apply after loading).
+    """
+    source_size = img.size
+    scale = decode_scale(source_size, specs, dpi, gap) if fast else 1.0
+    if scale <= 0.5 and img.format == "JPEG":
+        img.draft("RGB", (ceil(source_size[0] * scale), ceil(source_size[1] * scale)))
+    # Whatever DCT scaling did not cover is taken off with an integer box reduce
+    return source_size, int(img.width / (source_size[0] * scale))
+
+
+def _open(path, data=None):
+    return Image.open(path if data is None else io.BytesIO(data))
+
+
+def decoded_size(path, specs, dpi=DPI, fast=FAST_DECODE, gap=DECODE_GAP, data=None):
+    """
+    (original_size, size load_for_outputs would decode to), from the header only.
+    """
+    with _open(path, data) as img:
+        source_size, factor = _prepare_decode(img, specs, dpi, fast, gap)
+        if factor >= 2:
+            return source_size, (ceil(img.width / factor), ceil(img.height / factor))
+        return source_size, img.size
+
+
+def source_profile(path, color_mode=None, data=None):
+    """
+    The ICC profile outputs of `path` embed (see color.output_profile), from the header only.
+    """
+    with _open(path, data) as img:
+        return output_profile(img, color_mode)
+
+
+def load_for_outputs(path, specs, dpi=DPI, fast=FAST_DECODE, gap=DECODE_GAP, timer=NULL_TIMER, data=None,
+                     color_mode=None, matte=None):
+    """
+    Open and decode `path` in its working mode (see color.prepare), at reduced
+    scale when `fast` allows it; `data` is the file's content when it has
+    already been read. The ICC profile for its outputs is left in
+    image.info["icc_profile"].
+    Returns (image, original_size); crop coordinates given in original pixels
+    must be scaled by image.width / original_size[0].
+    """
+    with _open(path, data) as img:
+        source_size, factor = _prepare_decode(img, specs, dpi, fast, gap)
+        with timer.stage("decode"):
+            img.load()
+
+        # Reduce first, so color conversion and matting only see the pixels that are kept
+        if factor >= 2:
+            with timer.stage("reduce"):
+                img = _reduce(img, factor)
+
+        with timer.stage("convert"):
+            img, icc = prepare(img, color_mode, matte)
+        img.info.pop("icc_profile", None)
+        if icc:
+            img.info["icc_profile"] = icc
+
+        return img, source_size
+
+
+def _reduce(img, factor):
+    # Image.reduce cannot average palettes, color-keyed transparency, bilevel
+    # or 16-bit images, so those are first widened losslessly (info is kept)
+    if img.mode == "P" or "transparency" in img.info:
+        img = img.convert("LA" if img.mode == "L" else "RGBA")
+    elif img.mode == "1":
+        img = img.convert("L")
+    elif img.mode in HIGH_BIT_MODES:
+        img = img.convert("I")
+    return img.reduce(factor)
+
+
+def load_preview(path, max_size, fast=FAST_DECODE):
+    """
+    Decode `path` just large enough for a max_size x max_size preview.
+    Returns (image, original_size); the image is not yet resized to fit.
+    """
+    with Image.open(path) as img:
+        source_size = img.size
+        if fast:
+            # draft() keeps the result at least this large, so the final LANCZOS fit still downsamples
+            img.draft("RGB", (max_size, max_size))
+        img.load()
+        img, _ = prepare(img)
+        return to_8bit(img), source_size
+
+
+def fit_size(size, max_size):
+    """
+    Size of `size` scaled to fit a max_size x max_size box, keeping its aspect ratio.
+    """
+    ratio = min(max_size / size[0], max_size / size[1])
+    return int(size[0] * ratio), int(size[1] * ratio)
+
+
+def cached_preview(path, max_size, fast=FAST_DECODE):
+    """
+    load_preview already resized to fit_size(original_size, max_size), cached
+    per file (keyed on its size and mtime) so reopening a picker is instant.
+    Returns (preview, original_size).
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, max_size, fast)
+    if key in _preview_cache:
+        _preview_cache.move_to_end(key)
+        return _preview_cache[key]
+
+    img, source_size = load_preview(path, max_size, fast)
+    img = img.resize(fit_size(source_size, max_size), Image.LANCZOS)
+    _preview_cache[key] = (img, source_size)
+    if len(_preview_cache) > PREVIEW_CACHE_SIZE:
+        _preview_cache.popitem(last=False)
+    return img, source_size
@@ -0,0 +1,123 @@
+"""
+Encoder profiles: how outputs are written, and what that costs.
+
+    proof         fast JPEG: no Huffman optimization, 4:2:0 chroma
+    print         the long-standing default: optimized JPEG, full 4:4:4 chroma
+    archive       lossless TIFF (deflate)
+    archive-png   lossless PNG
+    archive-webp  lossless WebP (smallest lossless files, slowest to write)
+    archive-jpeg  progressive optimized JPEG, 4:4:4
+
+JPEG profiles use the job's quality. EncoderStats tallies encode throughput
+and output size per profile from output_saved events, so speed can be traded
+against bytes with real numbers.
+"""
+
+import io
+from collections import namedtuple
+
+from .imaging import atomic_save
+
+# encode_bytes_per_pixel: extra memory the encoder holds on top of the image
+# (an optimized or progressive JPEG buffers every coefficient); streams marks
+# encoders that can write a file-backed strip canvas without a full copy
+EncoderProfile = namedtuple("EncoderProfile", "name format extension params encode_bytes_per_pixel streams")
+
+PROFILES = {
+    "proof": EncoderProfile("proof", "JPEG", ".jpg", {"optimize": False, "subsampling": 2}, 0, True),
+    "print": EncoderProfile("print", "JPEG", ".jpg", {"optimize": True, "subsampling": 0}, 6, True),
+    "archive": EncoderProfile("archive", "TIFF", ".tif", {"compression": "tiff_deflate"}, 0, False),
+    "archive-png": EncoderProfile("archive-png", "PNG", ".png", {"compress_level": 6}, 0, False),
+    "archive-webp": EncoderProfile(
+        "archive-webp", "WEBP", ".webp", {"lossless": True, "quality": 50, "method": 4}, 18, False),
+    "archive-jpeg": EncoderProfile(
+        "archive-jpeg", "JPEG", ".jpg", {"optimize": True, "progressive": True, "subsampling": 0}, 6, True),
+}
+DEFAULT_ENCODER = "print"
+
+
+def get_profile(name=None):
+    """
+    The named EncoderProfile; None means DEFAULT_ENCODER.
+    """
+    try:
+        return PROFILES[name or DEFAULT_ENCODER]
+    except KeyError:
+        raise ValueError(f"unknown encoder profile {name!r} (choose from {', '.join(PROFILES)})") from None
+
+
+def save_params(profile, dpi, quality, streaming=False, icc=None):
+    """
+    Image.save keyword arguments for `profile`. `streaming` drops the JPEG
+    options that buffer the whole image (optimize, progressive), for the
+    strip-wise path. `icc` is the ICC profile to embed; None embeds none,
+    whatever the image's info carries.
+    """
+    params = dict(profile.params, icc_profile=icc)
+    if profile.format == "JPEG":
+        params["quality"] = quality
+        if streaming:
+            params.update(optimize=False, progressive=False)
+    if profile.format != "WEBP":  # WebP has no resolution field
+        params["dpi"] = (dpi, dpi)
+    return params
+
+
+def save_output(img, out_path, dpi, quality, profile, streaming=False, icc=None):
+    """
+    Write img with `profile`'s settings (atomically).
+    """
+    atomic_save(img, out_path, profile.format, **save_params(profile, dpi, quality, streaming, icc))
+
+
+def encode_output(img, dpi, quality, profile, icc=None):
+    """
+    img encoded with `profile`'s settings, as bytes (for a background writer).
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, profile.format, **save_params(profile, dpi, quality, icc=icc))
+    return buffer.getvalue()
+
+
+class EncoderStats:
+    """
+    Per-profile encode throughput and output size. Use it as the engine's
+    event callback; every event is passed on to `forward`.
+    """
+
+    def __init__(self, forward=None):
+        self.forward = forward
+        self.profiles = {}
+
+    def __call__(self, event):
+        if event["event"] == "output_saved" and "encoder" in event:
+            entry = self.profiles.setdefault(
+                event["encoder"], {"outputs": 0, "pixels": 0, "bytes": 0, "encode_ms": 0.0})
+            entry["outputs"] += 1
+            entry["pixels"] += event["width"] * event["height"]
+            entry["bytes"] += event["bytes"]
+            entry["encode_ms"] += event["encode_ms"]
+        if self.forward is not None:
+            self.forward(event)
+
+    def summary(self):
+        """
+        {profile: {outputs, megapixels_per_s, bytes_per_pixel, total_mb}}
+        """
+        result = {}
+        for name, entry in self.profiles.items():
+            seconds = entry["encode_ms"] / 1000
+            result[name] = {
+                "outputs": entry["outputs"],
+                "megapixels_per_s": round(entry["pixels"] / 1e6 / seconds, 1) if seconds else None,
+                "bytes_per_pixel": round(entry["bytes"] / entry["pixels"], 3) if entry["pixels"] else None,
+                "total_mb": round(entry["bytes"] / (1 << 20), 1),
+            }
+        return result
+
+    def lines(self):
+        return [
+            f"Encoder {name}: {s['outputs']} output(s), {s['megapixels_per_s']} MP/s, "
+            f"{s['bytes_per_pixel']} bytes/px, {s['total_mb']} MB"
+            for name, s in self.summary().items()
+        ]
@@ -0,0 +1,208 @@
+"""
+Dry-run planner: what a batch will produce and cost, from image headers only.
+
+For every source the header gives the pixel size (no pixels are decoded), and
+from it each planned output's upscale factor (target pixels over the source
+pixels its crop covers), its estimated file size and render time. Times and
+sizes come from a calibration: nanoseconds per pixel for each stage and
+output bytes per pixel, as measured by benchmarks/bench_pipeline.py (the
+"calibration" block of its report). Without one, DEFAULT_CALIBRATION is used;
+its byte counts are typical of photographs, so treat them as rough figures.
+
+Headers are read on a few threads, since on network shares the run is bound
+by file-open latency, not CPU. A folder holds few distinct source sizes, so
+the plan for each size (and settings) is worked out once and reused.
+"""
+
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .decode import decoded_size
+from .encoders import DEFAULT_ENCODER, get_profile
+from .imaging import base_name_of, output_name, target_pixels
+from .memory import STRIP_PIXELS, default_budget_mb, estimate_peak_mb
+from .plan import build_plan, crop_size_for
+
+UPSCALE_WARNING = 2.0  # Warn about outputs enlarged more than this from the source pixels
+HEADER_THREADS = 8
+PLAN_CACHE_SIZE = 64  # Planned source sizes kept, most recently used last
+_CHUNK = 256  # Headers in flight at a time
+
+# ns_per_pixel: decode and convert per decoded source pixel, crop/resize/encode
+# per output pixel (the stages and units of the benchmark's calibration)
+Calibration = namedtuple("Calibration", "ns_per_pixel output_bytes_per_pixel")
+OutputEstimate = namedtuple("OutputEstimate", "name path size scale bytes ms up_to_date")
+FileEstimate = namedtuple("FileEstimate", "source size decoded outputs ms peak_mb")
+
+# Stage costs from bench_pipeline.py on a single core; encode cost and output
+# bytes differ by profile
+_STAGE_NS = {"decode": 8.5, "convert": 0.01, "crop": 0.13, "resize": 25.0}
+DEFAULT_CALIBRATION = {
+    "proof": Calibration(dict(_STAGE_NS, encode=4.8), 0.6),
+    "print": Calibration(dict(_STAGE_NS, encode=19.4), 0.9),
+    "archive": Calibration(dict(_STAGE_NS, encode=93.0), 2.2),
+    "archive-png": Calibration(dict(_STAGE_NS, encode=275.0), 2.0),
+    "archive-webp": Calibration(dict(_STAGE_NS, encode=550.0), 1.5),
+    "archive-jpeg": Calibration(dict(_STAGE_NS, encode=25.0), 0.85),
+}
+
+_plans = OrderedDict()
+
+
+def load_calibration(path, calibrations=None):
+    """
+    DEFAULT_CALIBRATION (or `calibrations`) with the measurements of a
+    bench_pipeline.py report at `path` replacing those of its encoder.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    try:
+        measured = report["calibration"]
+        encoder = report.get("meta", {}).get("encoder", DEFAULT_ENCODER)
+        base = (calibrations or DEFAULT_CALIBRATION)[encoder]
+    except (KeyError, TypeError):
+        raise ValueError(f"{path} is not a bench_pipeline.py report with a calibration") from None
+    # Stages the benchmark could not measure keep their defaults
+    ns = dict(base.ns_per_pixel)
+    ns.update({stage: v for stage, v in measured.get("ns_per_pixel", {}).items() if v is not None})
+    calibrations = dict(calibrations or DEFAULT_CALIBRATION)
+    calibrations[encoder] = Calibration(ns, measured.get("output_bytes_per_pixel") or base.output_bytes_per_pixel)
+    return calibrations
+
+
+def upscale_factor(source_size, spec, dpi):
+    """
+    How much an output is enlarged from the source pixels its crop covers (below 1 shrinks).
+    """
+    crop_w, crop_h = crop_size_for(source_size, spec.aspect_w, spec.aspect_h)
+    target_w, target_h = target_pixels(spec, dpi)
+    return max(target_w / crop_w, target_h / crop_h)
+
+
+def _size_plan(job, source_size, decoded, pending, strip_pixels):
+    # ((spec, size, pixels, upscale factor) per planned output, peak MB of rendering `pending`)
+    key = (tuple(job.specs), tuple(pending), source_size, decoded, job.dpi, job.cascade_factor, job.encoder,
+           job.fast_decode, strip_pixels)
+    if key in _plans:
+        _plans.move_to_end(key)
+        return _plans[key]
+    outputs = tuple(
+        (out.spec, out.size, out.size[0] * out.size[1], round(upscale_factor(source_size, out.spec, job.dpi), 2))
+        for step in build_plan(job.specs, decoded, job.dpi, job.cascade_factor, strip_pixels).steps
+        for out in step.outputs
+    )
+    peak_mb = estimate_peak_mb(job._replace(specs=list(pending)), source_size, strip_pixels) if pending else 0
+    _plans[key] = outputs, peak_mb
+    if len(_plans) > PLAN_CACHE_SIZE:
+        _plans.popitem(last=False)
+    return outputs, peak_mb
+
+
+def estimate_job(job, source_size, decoded, calibration=None, strip_pixels=STRIP_PIXELS, pending=None):
+    """
+    FileEstimate for `job` given its header sizes (see decode.decoded_size).
+    Outputs not in `pending` (specs still to render; None means all) are
+    marked up to date and cost nothing.
+    """
+    calibration = calibration or DEFAULT_CALIBRATION[get_profile(job.encoder).name]
+    ns = calibration.ns_per_pixel
+    output_ns = ns["crop"] + ns["resize"] + ns["encode"]
+    pending = job.specs if pending is None else [spec for spec in job.specs if spec in pending]
+    planned, peak_mb = _size_plan(job, tuple(source_size), tuple(decoded), pending, strip_pixels)
+    extension = get_profile(job.encoder).extension
+    base_name = base_name_of(job.source)
+    folder = os.path.join(job.output_dir, "")
+
+    outputs = []
+    for spec, size, pixels, scale in planned:
+        name = output_name(base_name, spec, extension)
+        up_to_date = spec not in pending
+        outputs.append(OutputEstimate(
+            name, folder + name, size, scale,
+            0 if up_to_date else int(pixels * calibration.output_bytes_per_pixel),
+            0.0 if up_to_date else pixels * output_ns / 1e6, up_to_date,
+        ))
+    ms = 0.0
+    if pending:
+        ms = decoded[0] * decoded[1] * (ns["decode"] + ns["convert"]) / 1e6 + sum(o.ms for o in outputs)
+    return FileEstimate(job.source, source_size, decoded, outputs, ms, peak_mb)
+
+
+def _read_header(job):
+    # Errors travel back as text so one bad file never stops the run
+    try:
+        return decoded_size(job.source, job.specs, job.dpi, job.fast_decode), None
+    except Exception as e:
+        return None, str(e)
+
+
+def estimate_batch(jobs, calibrations=None, workers=None, memory_mb=None, manifest=None, on_event=None,
+                   max_upscale=UPSCALE_WARNING, strip_pixels=STRIP_PIXELS, threads=HEADER_THREADS):
+    """
+    Estimate every job without rendering anything, emitting a file_estimated
+    event per source and an estimate_finished summary (also returned).
+    `manifest` (read, never saved) leaves up-to-date outputs out of the
+    totals. The wall-clock estimate spreads the work over `workers`
+    processes, fewer when the memory budget cannot hold that many of the
+    largest renders at once.
+    """
+    on_event = on_event or (lambda event: None)
+    calibrations = calibrations or DEFAULT_CALIBRATION
+    workers = workers or os.cpu_count() or 1
+    memory_mb = default_budget_mb() if memory_mb is None else memory_mb
+    start = time.perf_counter()
+    totals = {"files": 0, "outputs": 0, "pending_outputs": 0, "upscaled": 0, "errors": 0}
+    total_bytes = 0
+    total_ms = 0.0
+    peak_mb = 0
+
+    jobs = iter(jobs)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        while True:
+            chunk = list(itertools.islice(jobs, _CHUNK))
+            if not chunk:
+                break
+            for job, (sizes, error) in zip(chunk, pool.map(_read_header, chunk)):
+                totals["files"] += 1
+                if error is not None:
+                    totals["errors"] += 1
+                    on_event({"event": "file_error", "source": job.source, "error": error})
+                    continue
+                pending = manifest.pending_specs(job, rehash=False) if manifest is not None else None
+                estimate = estimate_job(
+                    job, *sizes, calibrations[get_profile(job.encoder).name], strip_pixels, pending)
+                warnings = [
+                    f"{o.name} is enlarged {o.scale:.1f}x"
+                    for o in estimate.outputs if o.scale > max_upscale and not o.up_to_date
+                ]
+                totals["outputs"] += len(estimate.outputs)
+                totals["pending_outputs"] += sum(not o.up_to_date for o in estimate.outputs)
+                totals["upscaled"] += len(warnings)
+                total_bytes += sum(o.bytes for o in estimate.outputs)
+                total_ms += estimate.ms
+                peak_mb = max(peak_mb, estimate.peak_mb)
+                on_event({
+                    "event": "file_estimated", "source": job.source, "size": list(estimate.size),
+                    "decoded": list(estimate.decoded), "ms": round(estimate.ms, 1), "peak_mb": estimate.peak_mb,
+                    "outputs": [
+                        {"name": o.name, "width": o.size[0], "height": o.size[1], "scale": o.scale,
+                         "bytes": o.bytes, "ms": round(o.ms, 1), "up_to_date": o.up_to_date}
+                        for o in estimate.outputs
+                    ],
+                    "warnings": warnings,
+                })
+
+    parallel = workers
+    if memory_mb and peak_mb:
+        parallel = max(1, min(workers, memory_mb // peak_mb))
+    summary = dict(
+        event="estimate_finished", bytes=total_bytes, cpu_ms=round(total_ms, 1),
+        wall_ms=round(total_ms / parallel, 1), workers=parallel, peak_mb=peak_mb,
+        ms=round((time.perf_counter() - start) * 1000, 1), **totals,
+    )
+    on_event(summary)
+    return summary
@@ -0,0 +1,122 @@
+"""
+Pure-Pillow crop/resize/save helpers shared by the GUIs and the batch engine.
+"""
+
+import os
+from collections import namedtuple
+
+DPI = 300
+VALID_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".bmp", ".webp")
+JPEG_QUALITY = 95
+
+# One requested print: crop to aspect_w:aspect_h, resize to width_in x height_in inches
+OutputSpec = namedtuple("OutputSpec", "aspect_w aspect_h width_in height_in")
+
+
+def specs_from_target_sizes(target_sizes):
+    """
+    Build output specs from a {(aspect_w, aspect_h): (in_w, in_h)} mapping (V1 style).
+    """
+    return [OutputSpec(aw, ah, in_w, in_h) for (aw, ah), (in_w, in_h) in target_sizes.items()]
+
+
+def specs_from_dimensions_map(dimensions_map):
+    """
+    Build output specs from a {"4:5": ["8x10", ...]} mapping (V2 style).
+    """
+    specs = []
+    for ratio, dimensions in dimensions_map.items():
+        aspect_w, aspect_h = map(int, ratio.split(":"))
+        for dim in dimensions:
+            width_in, height_in = map(int, dim.split("x"))
+            specs.append(OutputSpec(aspect_w, aspect_h, width_in, height_in))
+    return specs
+
+
+def target_pixels(spec, dpi=DPI):
+    return int(spec.width_in * dpi), int(spec.height_in * dpi)
+
+
+def output_name(base_name, spec, extension=".jpg"):
+    return f"{base_name}_{spec.aspect_w}x{spec.aspect_h}_{spec.width_in}x{spec.height_in}in{extension}"
+
+
+def base_name_of(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def center_crop_to_aspect_ratio(img, aspect_w, aspect_h):
+    """
+    Improved center-crop with accurate aspect ratio handling.
+    """
+    return img.crop(crop_box(img.size, aspect_w, aspect_h))
+
+
+def focal_crop_to_aspect_ratio(img, aspect_w, aspect_h, focus=None):
+    """
+    Largest aspect_w:aspect_h crop centred as close to `focus` as the image
+    bounds allow. focus is (x, y) as fractions of the image size, so it stays
+    valid for reduced decodes; None is a plain center crop.
+    """
+    return img.crop(crop_box(img.size, aspect_w, aspect_h, focus))
+
+
+def crop_box(size, aspect_w, aspect_h, focus=None):
+    """
+    (left, top, right, bottom) of the crop the two functions above take from
+    an image of `size`, e.g. to draw it on a proof.
+    """
+    orig_w, orig_h = size
+    target_ratio = aspect_w / aspect_h
+    current_ratio = orig_w / orig_h
+
+    if focus is None:
+        if current_ratio > target_ratio:
+            # Crop width
+            new_width = int(orig_h * target_ratio)
+            left = (orig_w - new_width) // 2
+            return left, 0, left + new_width, orig_h
+        # Crop height
+        new_height = int(orig_w / target_ratio)
+        top = (orig_h - new_height) // 2
+        return 0, top, orig_w, top + new_height
+
+    if current_ratio > target_ratio:
+        crop_w, crop_h = int(orig_h * target_ratio), orig_h
+    else:
+        crop_w, crop_h = orig_w, int(orig_w / target_ratio)
+    # Clamp the window so it never leaves the image
+    left = min(max(0, round(focus[0] * orig_w - crop_w / 2)), orig_w - crop_w)
+    top = min(max(0, round(focus[1] * orig_h - crop_h / 2)), orig_h - crop_h)
+    return left, top, left + crop_w, top + crop_h
+
+
+def atomic_save(img, out_path, format, **params):
+    """
+    Save to a hidden temp file next to out_path, then rename it into place, so
+    an interrupted or cancelled job never leaves a truncated output behind.
+    """
+    _replace_atomically(out_path, lambda tmp_path: img.save(tmp_path, format=format, **params))
+
+
+def atomic_write(data, out_path):
+    """
+    atomic_save for bytes that are already encoded.
+    """
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    _replace_atomically(out_path, write)
+
+
+def _replace_atomically(out_path, write):
+    folder, name = os.path.split(out_path)
+    tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
@@ -0,0 +1,218 @@
+"""
+Opt-in per-stage timing and memory instrumentation.
+
+With instrumentation on, render_job times each stage (decode, convert,
+reduce, analyze, crop, resize, encode) and samples the process's resident memory after
+each one. Timings ride along on the normal engine events, so they work the same
+across a process pool. RunReport collects them and writes a CSV and a JSON
+report into the output folder.
+"""
+
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_NAME = "imagecropper-report"
+STAGES = ("decode", "convert", "reduce", "analyze", "cache", "crop", "resize", "encode", "write")
+
+_CSV_FIELDS = (
+    ("kind", "source", "output", "width", "height", "encoder", "bytes")
+    + tuple(f"{s}_ms" for s in STAGES)
+    + ("total_ms", "peak_mb")
+)
+
+
+def memory_mb():
+    """
+    Resident memory of this process in MB. Falls back to the peak so far where
+    the current value is not available, and to None on Windows.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20), 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / ((1 << 20) if sys.platform == "darwin" else 1024), 1)
+
+
+class StageTimer:
+    """
+    Accumulates milliseconds per stage and the highest memory sample seen.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.ms = {}
+        self.peak_mb = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] = self.ms.get(name, 0.0) + (time.perf_counter() - start) * 1000
+            self.sample()
+
+    def merge(self, other):
+        for name, ms in other.ms.items():
+            self.ms[name] = self.ms.get(name, 0.0) + ms
+        if other.peak_mb is not None and (self.peak_mb is None or other.peak_mb > self.peak_mb):
+            self.peak_mb = other.peak_mb
+
+    def sample(self):
+        mb = memory_mb()
+        if mb is not None and (self.peak_mb is None or mb > self.peak_mb):
+            self.peak_mb = mb
+        return mb
+
+    def rounded(self):
+        return {name: round(ms, 2) for name, ms in self.ms.items()}
+
+
+class _NullTimer:
+    """
+    Stand-in used when instrumentation is off; every stage is a no-op.
+    """
+
+    enabled = False
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def sample(self):
+        return None
+
+
+NULL_TIMER = _NullTimer()
+
+
+def matches_source(source, target):
+    """
+    True when `target` names `source`, either as a path or as a bare file name.
+    """
+    if not target:
+        return False
+    if os.path.basename(target) == target:
+        return os.path.basename(source) == target
+    return os.path.abspath(source) == os.path.abspath(target)
+
+
+@contextmanager
+def profiled(path):
+    """
+    Run the block under cProfile and dump the stats to `path` (None disables).
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+class RunReport:
+    """
+    Event consumer that builds the per-file / per-output timing report.
+    Call it with every engine event; events are passed on to `forward`.
+    """
+
+    def __init__(self, forward=None):
+        self.forward = forward
+        self.files = {}  # source -> row, in first-seen order
+        self.started = time.perf_counter()
+
+    def _file(self, source):
+        row = self.files.get(source)
+        if row is None:
+            row = self.files[source] = {"source": source, "stages_ms": {}, "peak_mb": None, "outputs": []}
+        return row
+
+    def __call__(self, event):
+        kind = event["event"]
+        if kind == "file_timed":
+            row = self._file(event["source"])
+            for stage, ms in event["stages_ms"].items():
+                row["stages_ms"][stage] = round(row["stages_ms"].get(stage, 0.0) + ms, 2)
+            row["peak_mb"] = _max(row["peak_mb"], event["peak_mb"])
+        elif kind == "output_saved" and "stages_ms" in event:
+            self._file(event["source"])["outputs"].append({
+                "output": event["name"], "width": event["width"], "height": event["height"],
+                "encoder": event.get("encoder"), "bytes": event.get("bytes"), "stages_ms": event["stages_ms"],
+                "total_ms": event["ms"], "peak_mb": event.get("rss_mb"),
+            })
+        if self.forward is not None:
+            self.forward(event)
+
+    def totals(self):
+        stages = dict.fromkeys(STAGES, 0.0)
+        peak = None
+        for row in self.files.values():
+            for stage, ms in row["stages_ms"].items():
+                stages[stage] = stages.get(stage, 0.0) + ms
+            peak = _max(peak, row["peak_mb"])
+        return {
+            "files": len(self.files),
+            "outputs": sum(len(row["outputs"]) for row in self.files.values()),
+            "stages_ms": {stage: round(ms, 2) for stage, ms in stages.items()},
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "peak_mb": peak,
+        }
+
+    def write(self, output_dir, name=REPORT_NAME):
+        """
+        Write <name>.json and <name>.csv into output_dir; returns both paths.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        json_path = os.path.join(output_dir, name + ".json")
+        csv_path = os.path.join(output_dir, name + ".csv")
+        totals = self.totals()
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"files": list(self.files.values()), "totals": totals}, f, indent=1)
+
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=_CSV_FIELDS, restval="")
+            writer.writeheader()
+            for row in self.files.values():
+                writer.writerow(_csv_row("file", row["source"], "", row["stages_ms"],
+                                         sum(row["stages_ms"].values()), row["peak_mb"]))
+                for out in row["outputs"]:
+                    writer.writerow(dict(
+                        _csv_row("output", row["source"], out["output"], out["stages_ms"],
+                                 out["total_ms"], out["peak_mb"]),
+                        width=out["width"], height=out["height"], encoder=out["encoder"], bytes=out["bytes"],
+                    ))
+            writer.writerow(_csv_row("total", "", "", totals["stages_ms"], totals["wall_ms"], totals["peak_mb"]))
+        return json_path, csv_path
+
+
+def _csv_row(kind, source, output, stages_ms, total_ms, peak_mb):
+    row = {"kind": kind, "source": source, "output": output, "total_ms": round(total_ms, 2), "peak_mb": peak_mb}
+    for stage in STAGES:
+        row[f"{stage}_ms"] = stages_ms.get(stage, "")
+    return row
+
+
+def _max(a, b):
+    if a is None:
+        return b
+    return a if b is None else max(a, b)
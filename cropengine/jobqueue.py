@@ -0,0 +1,256 @@
+"""
+SQLite-backed render job queue with leasing and retries.
+
+Ingestion machines submit RenderJobs; worker daemons (cropengine.worker)
+lease them one at a time. A lease expires unless its worker renews it, so a
+crashed or killed worker's job goes back to the queue. Failed jobs are retried
+with a growing delay until max_attempts is used up. Every saved output is
+recorded as it happens, and a retried job only renders the outputs still
+missing, so restarts never redo finished work.
+
+The queue is a single SQLite file using the default rollback journal (not
+WAL), so workers on several hosts can share it on a network filesystem with
+working file locks. Every call opens its own short-lived connection, which
+keeps a JobQueue usable from any thread or process.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import closing
+
+from .batch import RenderJob
+from .imaging import OutputSpec
+
+LEASE_SECONDS = 300  # A worker that stops renewing for this long loses its job
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # Seconds before the first retry; doubles with every attempt
+JOB_STATES = ("queued", "leased", "done", "failed")
+
+LeasedJob = namedtuple("LeasedJob", "id job attempt")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    not_before REAL NOT NULL DEFAULT 0,
+    submitted REAL NOT NULL,
+    finished REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, not_before);
+CREATE TABLE IF NOT EXISTS outputs (
+    job_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    ms REAL,
+    worker TEXT,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+
+def job_to_json(job):
+    """
+    A RenderJob as the JSON text stored in the queue.
+    """
+    return json.dumps(dict(job._asdict(), specs=[list(spec) for spec in job.specs]))
+
+
+def job_from_json(text):
+    """
+    The RenderJob stored by job_to_json. Fields this version does not know are ignored.
+    """
+    data = json.loads(text)
+    fields = {k: v for k, v in data.items() if k in RenderJob._fields}
+    fields["specs"] = [OutputSpec(*spec) for spec in fields["specs"]]
+    if fields.get("focus") is not None:
+        fields["focus"] = tuple(fields["focus"])
+    return RenderJob(**fields)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        # Autocommit mode; writes that must be atomic use BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def submit(self, jobs, max_attempts=MAX_ATTEMPTS):
+        """
+        Queue every job in `jobs` in one transaction; returns their ids.
+        """
+        now = time.time()
+        ids = []
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in jobs:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (spec, max_attempts, submitted) VALUES (?, ?, ?)",
+                    (job_to_json(job), max_attempts, now),
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        return ids
+
+    def lease(self, owner, lease_seconds=LEASE_SECONDS):
+        """
+        Take the oldest runnable job for `owner`, or return None when there is
+        none. Expired leases are returned to the queue first (or failed, when
+        they have used up their attempts).
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = 'failed', owner = NULL, finished = ?, "
+                "error = 'lease expired (worker stopped responding)' "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            conn.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL WHERE state = 'leased' AND lease_until < ?",
+                (now,),
+            )
+            row = conn.execute(
+                "SELECT id, spec, attempts FROM jobs WHERE state = 'queued' AND not_before <= ? "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job_id, spec, attempts = row
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (owner, now + lease_seconds, job_id),
+            )
+            conn.execute("COMMIT")
+        return LeasedJob(job_id, job_from_json(spec), attempts + 1)
+
+    def renew(self, job_id, owner, lease_seconds=LEASE_SECONDS):
+        """
+        Extend the lease; False if `owner` no longer holds it.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + lease_seconds, job_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def record_output(self, job_id, event, owner=None):
+        """
+        Remember one saved output (an output_saved event) of a job.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO outputs (job_id, name, path, width, height, ms, worker) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, event["name"], event["path"], event["width"], event["height"], event["ms"], owner),
+            )
+
+    def finished_outputs(self, job_id):
+        """
+        Names of the job's outputs already saved, by any attempt.
+        """
+        with closing(self._connect()) as conn:
+            return {name for (name,) in conn.execute("SELECT name FROM outputs WHERE job_id = ?", (job_id,))}
+
+    def complete(self, job_id, owner):
+        return self._finish(job_id, owner, "state = 'done', error = NULL, finished = ?", (time.time(),))
+
+    def fail(self, job_id, owner, error, retry_delay=RETRY_DELAY):
+        """
+        Record a failed attempt: the job is queued again after a delay that
+        doubles per attempt, or marked failed once out of attempts.
+        Returns True if it will be retried.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND owner = ? AND state = 'leased'",
+                (job_id, owner),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            attempts, max_attempts = row
+            retry = attempts < max_attempts
+            if retry:
+                conn.execute(
+                    "UPDATE jobs SET state = 'queued', owner = NULL, error = ?, not_before = ? WHERE id = ?",
+                    (error, now + retry_delay * 2 ** (attempts - 1), job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', owner = NULL, error = ?, finished = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+            conn.execute("COMMIT")
+        return retry
+
+    def release(self, job_id, owner):
+        """
+        Hand a job back untouched (the worker is shutting down); the attempt does not count.
+        """
+        return self._finish(job_id, owner, "state = 'queued', attempts = attempts - 1, not_before = 0", ())
+
+    def _finish(self, job_id, owner, assignments, params):
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, owner = NULL WHERE id = ? AND owner = ? AND state = 'leased'",
+                params + (job_id, owner),
+            )
+            return cursor.rowcount == 1
+
+    def retry_failed(self):
+        """
+        Queue every failed job again with fresh attempts; returns how many.
+        """
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = 0, not_before = 0, finished = NULL "
+                "WHERE state = 'failed'"
+            )
+            return cursor.rowcount
+
+    def counts(self):
+        """
+        {state: number of jobs} for every state in JOB_STATES.
+        """
+        counts = dict.fromkeys(JOB_STATES, 0)
+        with closing(self._connect()) as conn:
+            for state, count in conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+                counts[state] = count
+        return counts
+
+    def failures(self, limit=20):
+        """
+        (id, source, error) of the most recently failed jobs.
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, spec, error FROM jobs WHERE state = 'failed' ORDER BY finished DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [(job_id, json.loads(spec)["source"], error) for job_id, spec, error in rows]
@@ -0,0 +1,200 @@
+"""
+Output-folder manifest for incremental re-runs.
+
+The manifest remembers, per source file, its content hash and the render
+settings each output was produced with. Sources whose size and mtime are
+unchanged are trusted without re-hashing, so re-checking an unchanged folder
+costs one stat per source plus one listing per output folder.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from .color import COLOR_MODE, MATTE
+from .encoders import DEFAULT_ENCODER, get_profile
+from .imaging import base_name_of, output_name
+
+MANIFEST_NAME = ".imagecropper-manifest.json"
+MANIFEST_VERSION = 1
+
+# Save progress every this many recorded outputs, so a crash loses little work
+SAVE_EVERY = 50
+
+# RenderJob fields that identify where a render goes rather than how it looks
+_LOCATION_FIELDS = ("source", "output_dir", "specs")
+# Values that mean "what the engine did before this field existed"
+_NEUTRAL_SETTINGS = {"crop_mode": "center", "encoder": DEFAULT_ENCODER, "color_mode": COLOR_MODE, "matte": MATTE}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def data_digest(data):
+    """
+    file_digest of a file whose content is `data`.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def render_settings(job):
+    """
+    Stable description of every job setting that changes the output bytes.
+    Unset (None) and neutral settings are left out, so adding a field keeps
+    older manifests valid.
+    """
+    return ";".join(
+        f"{k}={v}" for k, v in job._asdict().items()
+        if k not in _LOCATION_FIELDS and v is not None and _NEUTRAL_SETTINGS.get(k) != v
+    )
+
+
+class Manifest:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.sources = {}
+        self._unsaved = 0
+        self._listings = {}  # output subfolder -> names in it, listed once on first use
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # Missing or unreadable manifest: everything is rendered again
+        if data.get("version") == MANIFEST_VERSION:
+            self.sources = data.get("sources", {})
+
+    def save(self):
+        data = {"version": MANIFEST_VERSION, "saved": time.time(), "sources": self.sources}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def _key(self, job, name):
+        """
+        Output path relative to the manifest's folder ("/"-separated), so
+        mirrored subfolders share one manifest.
+        """
+        rel = os.path.relpath(os.path.join(job.output_dir, name), self.output_dir)
+        return rel.replace(os.sep, "/")
+
+    def _exists(self, rel_path):
+        folder, _, name = rel_path.rpartition("/")
+        if folder not in self._listings:
+            try:
+                self._listings[folder] = set(os.listdir(os.path.join(self.output_dir, folder)))
+            except OSError:
+                self._listings[folder] = set()
+        return name in self._listings[folder]
+
+    def pending_specs(self, job, rehash=True):
+        """
+        Specs of `job` whose output is missing or was made from different
+        source content or settings. rehash=False treats every source whose
+        size or mtime changed as changed instead of hashing it (a quick check).
+        """
+        key = os.path.abspath(job.source)
+        try:
+            st = os.stat(job.source)
+            entry = self.sources.get(key)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                digest = entry["hash"]
+            elif not rehash:
+                return list(job.specs)
+            else:
+                digest = file_digest(job.source)
+        except OSError:
+            return list(job.specs)  # Let the render itself report the error
+
+        if entry is None or entry["hash"] != digest:
+            entry = self.sources[key] = {"hash": digest, "outputs": {}}
+        # Same content with a new mtime (copied, touched) is still up to date
+        entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+
+        settings = render_settings(job)
+        base_name = base_name_of(job.source)
+        extension = get_profile(job.encoder).extension
+        pending = []
+        for spec in job.specs:
+            out_key = self._key(job, output_name(base_name, spec, extension))
+            if entry["outputs"].get(out_key) != settings or not self._exists(out_key):
+                pending.append(spec)
+        return pending
+
+    def record(self, job, name):
+        entry = self.sources.get(os.path.abspath(job.source))
+        if entry is None:
+            return
+        key = self._key(job, name)
+        entry["outputs"][key] = render_settings(job)
+        self._exists(key)
+        folder, _, base = key.rpartition("/")
+        self._listings[folder].add(base)
+        self._unsaved += 1
+        if self._unsaved >= SAVE_EVERY:
+            self.save()
+
+    def stale_sources(self, current_sources):
+        """
+        Manifest sources that are no longer present, with the outputs they left behind.
+        """
+        current = {os.path.abspath(source) for source in current_sources}
+        stale = []
+        for key, entry in self.sources.items():
+            if key not in current and not os.path.exists(key):
+                outputs = sorted(out_key for out_key in entry["outputs"] if self._exists(out_key))
+                if outputs:
+                    stale.append({"source": key, "outputs": outputs})
+        return stale
+
+
+def run_incremental(engine, jobs, manifest, on_event=None, report_stale=True):
+    """
+    Run only the outputs the manifest does not already have, record every new
+    output as it is saved, and report outputs left by vanished sources once
+    every job has been seen (unless `jobs` is only part of the input, as in
+    a watch round: report_stale=False). `jobs` may be a generator; it is
+    filtered lazily. Returns the FileResults of the jobs that needed work.
+    """
+    on_event = on_event or (lambda event: None)
+    counts = {"skipped_files": 0, "skipped_outputs": 0, "pending_files": 0}
+    all_sources = []
+    by_source = {}
+
+    def pending_jobs():
+        for job in jobs:
+            all_sources.append(job.source)
+            specs = manifest.pending_specs(job)
+            counts["skipped_outputs"] += len(job.specs) - len(specs)
+            if not specs:
+                counts["skipped_files"] += 1
+                on_event({"event": "file_skipped", "source": job.source})
+                continue
+            counts["pending_files"] += 1
+            job = job._replace(specs=specs)
+            by_source[job.source] = job
+            yield job
+
+    def forward(event):
+        if event["event"] == "output_saved":
+            manifest.record(by_source[event["source"]], event["name"])
+        on_event(event)
+
+    try:
+        results = engine.run(pending_jobs(), forward)
+    finally:
+        manifest.save()
+    stale = manifest.stale_sources(all_sources) if report_stale else []
+    on_event(dict(event="manifest_checked", stale=stale, **counts))
+    return results
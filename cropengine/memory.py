@@ -0,0 +1,165 @@
+"""
+Memory estimates, the RAM budget and the strip-wise renderer for huge outputs.
+
+Pillow keeps RGB images at 4 bytes per pixel, and an optimized JPEG encode
+buffers every DCT coefficient of the image before writing. So a 30x45in
+output at 300 DPI needs roughly 500MB for the image plus 700MB to encode it.
+Outputs of at least STRIP_PIXELS are therefore resized a strip at a time into
+a file-backed scratch image and encoded in a single streaming pass. Their
+peak memory then depends on STRIP_HEIGHT, not on the output size. The cost:
+strip-wise LANCZOS can round a pixel one level differently from a one-pass
+resize, and the Huffman tables are not optimized, so those files are somewhat
+larger. Only streaming encoder profiles (the JPEG ones) take this path;
+lossless archive formats render in one piece.
+"""
+
+import mmap
+import os
+
+from PIL import Image
+
+from .color import to_8bit
+from .decode import decode_scale
+from .encoders import get_profile, save_output
+from .instrument import NULL_TIMER
+from .plan import build_plan
+
+BYTES_PER_PIXEL = 4  # Pillow's in-memory RGB layout
+WORKER_OVERHEAD_MB = 40  # Interpreter + Pillow per worker process
+
+STRIP_PIXELS = 64_000_000  # Outputs this large (e.g. 24x36in at 300 DPI) render strip-wise
+STRIP_HEIGHT = 256  # Output rows per strip
+MEMORY_FRACTION = 0.75  # Default budget: this share of physical RAM
+MIN_BUDGET_MB = 256  # Least left for renders once worker overheads are taken off a small budget
+
+_MB = 1 << 20
+
+
+def default_budget_mb():
+    """
+    MEMORY_FRACTION of physical RAM, or None where it cannot be determined.
+    """
+    try:
+        total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+    return int(total * MEMORY_FRACTION / _MB)
+
+
+def is_strip_output(size, strip_pixels=STRIP_PIXELS):
+    return bool(strip_pixels) and size[0] * size[1] >= strip_pixels
+
+
+def estimate_peak_mb(job, source_size, strip_pixels=STRIP_PIXELS):
+    """
+    Estimated peak memory of render_job(job) for a source of source_size pixels:
+    the decoded image, the largest crop, and the worst resize/encode of any
+    output together with the cascade intermediate it may be holding.
+    """
+    encoder = get_profile(job.encoder)
+    scale = decode_scale(source_size, job.specs, job.dpi) if job.fast_decode else 1.0
+    decoded = (max(1, int(source_size[0] * scale)), max(1, int(source_size[1] * scale)))
+    plan = build_plan(job.specs, decoded, job.dpi, job.cascade_factor, strip_pixels)
+
+    worst_step = 0
+    for step in plan.steps:
+        crop_w, crop_h = step.crop_size
+        parents = {out.parent for out in step.outputs if out.parent is not None}
+        kept = 0
+        worst_output = 0
+        for index, out in enumerate(step.outputs):
+            w, h = out.size
+            if encoder.streams and is_strip_output(out.size, strip_pixels):
+                # One output strip plus the horizontal pass over its source rows
+                transient = w * STRIP_HEIGHT * 2 + w * min(crop_h, STRIP_HEIGHT * crop_h // h + 8)
+            else:
+                # Horizontal resize pass, then the output alongside the encoder's buffers
+                transient = max(w * crop_h + w * h, w * h * (1 + encoder.encode_bytes_per_pixel / BYTES_PER_PIXEL))
+            worst_output = max(worst_output, transient + kept)
+            if index in parents:
+                kept = max(kept, w * h)
+        worst_step = max(worst_step, crop_w * crop_h + worst_output)
+
+    peak = (decoded[0] * decoded[1] + worst_step) * BYTES_PER_PIXEL
+    return int(peak / _MB) + 1
+
+
+def estimate_job_mb(job, strip_pixels=STRIP_PIXELS):
+    """
+    estimate_peak_mb for a job, reading only the source's header.
+    Unreadable sources cost nothing; the render will report them.
+    """
+    try:
+        with Image.open(job.source) as img:
+            source_size = img.size
+    except Exception:
+        return 0
+    return estimate_peak_mb(job, source_size, strip_pixels)
+
+
+class MemoryBudget:
+    """
+    Admission control for the process pool: a task is admitted while the
+    estimated peaks of admitted tasks fit in `limit_mb`. One task is always
+    admitted when nothing else is running, so an over-budget task still runs,
+    alone. A budget smaller than the workers' own overhead is clamped to
+    MIN_BUDGET_MB rather than left at zero or below.
+    """
+
+    def __init__(self, limit_mb, workers):
+        if limit_mb and limit_mb < 0:
+            raise ValueError(f"memory budget must be positive, not {limit_mb} MB")
+        self.limit_mb = max(limit_mb - workers * WORKER_OVERHEAD_MB, MIN_BUDGET_MB) if limit_mb else None
+        self.in_use_mb = 0
+        self.running = 0
+
+    def fits(self, cost_mb):
+        return self.limit_mb is None or self.running == 0 or self.in_use_mb + cost_mb <= self.limit_mb
+
+    def acquire(self, cost_mb):
+        self.in_use_mb += cost_mb
+        self.running += 1
+
+    def release(self, cost_mb):
+        self.in_use_mb -= cost_mb
+        self.running -= 1
+
+
+def save_strips(source, size, out_path, dpi, quality, encoder, strip_height=STRIP_HEIGHT, timer=NULL_TIMER,
+                icc=None):
+    """
+    LANCZOS-resize `source` to `size` one strip of rows at a time into a
+    file-backed scratch image next to out_path, then encode it with the
+    (streaming) encoder profile in a single pass. Pixels match
+    source.resize(size) to within one level of rounding.
+    """
+    width, height = size
+    src_w, src_h = source.size
+    scale = src_h / height
+    folder, name = os.path.split(out_path)
+    scratch_path = os.path.join(folder, f".{name}.{os.getpid()}.strips")
+    try:
+        with open(scratch_path, "w+b") as f:
+            f.truncate(width * height * BYTES_PER_PIXEL)
+            buffer = mmap.mmap(f.fileno(), width * height * BYTES_PER_PIXEL)
+        canvas = None
+        try:
+            # Rows go straight into the mapping (page cache, not the heap)
+            with timer.stage("resize"):
+                for top in range(0, height, strip_height):
+                    bottom = min(height, top + strip_height)
+                    strip = to_8bit(source.resize((width, bottom - top), Image.LANCZOS,
+                                                  box=(0, top * scale, src_w, bottom * scale)))
+                    row_bytes = width * BYTES_PER_PIXEL
+                    buffer[top * row_bytes:bottom * row_bytes] = strip.tobytes("raw", "RGBX")
+            # A read-only image sharing the mapping; without optimize/progressive
+            # the JPEG encoder streams it instead of buffering every coefficient
+            canvas = Image.frombuffer("RGBX", size, buffer, "raw", "RGBX", 0, 1)
+            with timer.stage("encode"):
+                save_output(canvas, out_path, dpi, quality, encoder, streaming=True, icc=icc)
+        finally:
+            canvas = None  # The mapping cannot be closed while an image still exports it
+            buffer.close()
+    finally:
+        if os.path.exists(scratch_path):
+            os.remove(scratch_path)
@@ -0,0 +1,170 @@
+"""
+Overlapped I/O for the render loop: read the next sources while the current
+one renders, and write finished outputs while the next one is resized.
+
+    Prefetcher   -- a reader thread loads the bytes of upcoming sources, a
+                    bounded number of files and bytes ahead of the renderer
+    AsyncWriter  -- outputs are encoded to memory by the renderer and
+                    written to disk (atomically) by a writer thread, with a
+                    bound on the bytes waiting to be written
+
+Both only move file I/O off the rendering thread; decoding, resizing and
+encoding stay where they were, so outputs are byte-identical. Completion
+callbacks run on the rendering thread (in poll/close), so engine events are
+still emitted from the thread that renders.
+"""
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .imaging import atomic_write
+from .instrument import NULL_TIMER
+
+PREFETCH_FILES = 2  # Sources read ahead of the one being rendered
+PREFETCH_MB = 256  # ... unless they already hold this much
+WRITE_BUFFER_MB = 256  # Encoded outputs waiting for the disk before the renderer blocks
+
+_MB = 1 << 20
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Prefetcher:
+    """
+    Iterates `items` as (item, data) pairs, where data is the content of the
+    file path_of(item) (None if it could not be read; the renderer then opens
+    it itself and reports the error). Items are pulled from `items` on the
+    iterating thread; only the reads happen in the background. Consecutive
+    items with the same path share one read.
+    """
+
+    def __init__(self, items, path_of, depth=PREFETCH_FILES, max_mb=PREFETCH_MB):
+        self.items = iter(items)
+        self.path_of = path_of
+        self.depth = depth
+        self.max_bytes = max_mb * _MB
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._ahead = deque()  # (item, path, future, size)
+        self._buffered = 0
+        self._exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._fill()
+        if not self._ahead:
+            self.close()
+            raise StopIteration
+        item, _, future, size = self._ahead.popleft()
+        self._buffered -= size
+        self._fill()  # Queue the next read before the caller starts rendering
+        try:
+            data = future.result()
+        except OSError:
+            data = None
+        return item, data
+
+    def _fill(self):
+        # Always one item beyond the current, plus `depth` more within the byte budget
+        while not self._exhausted and len(self._ahead) <= self.depth and (
+                not self._ahead or self._buffered < self.max_bytes):
+            try:
+                item = next(self.items)
+            except StopIteration:
+                self._exhausted = True
+                return
+            path = self.path_of(item)
+            if self._ahead and self._ahead[-1][1] == path:
+                self._ahead.append((item, path, self._ahead[-1][2], 0))
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            self._ahead.append((item, path, self._reader.submit(_read, path), size))
+            self._buffered += size
+
+    def close(self):
+        """
+        Drop reads not started yet and stop the reader thread.
+        """
+        for _, _, future, _ in self._ahead:
+            future.cancel()
+        self._ahead.clear()
+        self._reader.shutdown(wait=False)
+
+
+class AsyncWriter:
+    """
+    Writes encoded outputs on a background thread. submit() blocks while more
+    than max_mb are waiting; each callback(error) runs on the submitting
+    thread, from poll() or close(), once its file is in place (error None) or
+    has failed.
+    """
+
+    def __init__(self, max_mb=WRITE_BUFFER_MB):
+        self.max_bytes = max_mb * _MB
+        self._lock = threading.Condition()
+        self._pending = deque()  # (path, data, callback, timer)
+        self._pending_bytes = 0
+        self._done = deque()  # (callback, error)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, data, callback, timer=NULL_TIMER):
+        with self._lock:
+            # One output is always accepted, however large
+            while self._pending_bytes and self._pending_bytes + len(data) > self.max_bytes:
+                self._lock.wait()
+            self._pending.append((path, data, callback, timer))
+            self._pending_bytes += len(data)
+            self._lock.notify_all()
+        self.poll()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._lock.wait()
+                if not self._pending:
+                    return
+                path, data, callback, timer = self._pending[0]
+            error = None
+            try:
+                with timer.stage("write"):
+                    atomic_write(data, path)
+            except Exception as e:
+                error = e
+            with self._lock:
+                self._pending.popleft()
+                self._pending_bytes -= len(data)
+                self._done.append((callback, error))
+                self._lock.notify_all()
+
+    def poll(self):
+        """
+        Run the callbacks of writes finished so far.
+        """
+        while True:
+            with self._lock:
+                if not self._done:
+                    return
+                callback, error = self._done.popleft()
+            callback(error)
+
+    def close(self):
+        """
+        Wait for every pending write, run the remaining callbacks and stop the thread.
+        """
+        with self._lock:
+            self._closed = True
+            self._lock.notify_all()
+        self._thread.join()
+        self.poll()
@@ -0,0 +1,180 @@
+"""
+Thread-safe progress/log channel for the Tk GUIs.
+
+Worker threads (and the batch engine's event callback) only ever put events
+on a queue. The Tk main loop drains that queue on an `after` timer and applies
+each batch with a single text-widget update, so the UI never touches Tk from
+another thread and stays responsive on 10k-file runs.
+
+Nothing here imports tkinter: widgets are used duck-typed, which keeps the
+package importable on headless machines.
+"""
+
+import queue
+import time
+
+from .batch import format_event
+
+DRAIN_INTERVAL_MS = 100
+MAX_EVENTS_PER_DRAIN = 2000
+MAX_LOG_LINES = 5000
+
+# Events that mean one source file is finished, one way or another
+_FILE_DONE_EVENTS = ("file_planned", "file_error", "file_skipped", "file_proofed", "file_cancelled")
+
+
+class ProgressTracker:
+    """
+    Files done, throughput and ETA for a run. Total may arrive late (the
+    scanner streams files), in which case the ETA is unknown until then.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = None
+        self.done = 0
+        self.outputs = 0
+        self.errors = 0
+        self.started = time.monotonic()
+
+    def update(self, event):
+        kind = event["event"]
+        if kind in _FILE_DONE_EVENTS:
+            self.done += 1
+        if kind == "output_saved":
+            self.outputs += 1
+        elif kind in ("output_error", "file_error"):
+            self.errors += 1
+        elif kind == "scan_total":
+            self.total = event["files"]
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        Seconds left, or None while the total or the rate is unknown.
+        """
+        if self.total is None or not self.rate:
+            return None
+        return max(0.0, (self.total - self.done) / self.rate)
+
+    def status(self):
+        total = "?" if self.total is None else self.total
+        text = f"{self.done}/{total} files, {self.outputs} outputs, {self.rate:.1f} files/s"
+        if self.eta is not None:
+            minutes, seconds = divmod(int(self.eta), 60)
+            text += f", ETA {minutes}:{seconds:02d}"
+        if self.errors:
+            text += f", {self.errors} error(s)"
+        return text
+
+
+class TkLogChannel:
+    """
+    Queue-backed event channel drained by the Tk main loop.
+
+    root         -- any Tk widget (used for `after`)
+    log_widget   -- a (Scrolled)Text kept in state "disabled" between updates
+    progressbar  -- optional ttk.Progressbar
+    status_var   -- optional StringVar for the files/s + ETA line
+    on_finished  -- called in the main loop when a "batch_done" event is drained
+    """
+
+    def __init__(self, root, log_widget, progressbar=None, status_var=None, on_finished=None,
+                 max_lines=MAX_LOG_LINES, interval_ms=DRAIN_INTERVAL_MS):
+        self.root = root
+        self.log_widget = log_widget
+        self.progressbar = progressbar
+        self.status_var = status_var
+        self.on_finished = on_finished
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.tracker = ProgressTracker()
+        self._queue = queue.SimpleQueue()
+        self._after_id = None
+
+    # Safe to call from any thread
+
+    def put(self, event):
+        self._queue.put(event)
+
+    def log(self, message):
+        self._queue.put({"event": "log", "message": message})
+
+    # Main-loop side
+
+    def start(self):
+        """
+        Reset the counters and start draining.
+        """
+        self.tracker.reset()
+        if self.progressbar is not None:
+            self.progressbar.config(mode="indeterminate", value=0)
+            self.progressbar.start(50)
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def clear(self):
+        self.log_widget.config(state="normal")
+        self.log_widget.delete("1.0", "end")
+        self.log_widget.config(state="disabled")
+
+    def _drain(self):
+        self._after_id = None
+        lines = []
+        finished = False
+        for _ in range(MAX_EVENTS_PER_DRAIN):
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event["event"] == "log":
+                lines.append(event["message"])
+                continue
+            if event["event"] == "batch_done":
+                finished = True
+                continue
+            self.tracker.update(event)
+            line = format_event(event)
+            if line is not None:
+                lines.append(line)
+
+        if lines:
+            self._append(lines)
+        self._show_progress(finished)
+
+        if finished and self.on_finished is not None:
+            self.on_finished()
+        # Keep draining until the queue is empty after the run has finished
+        if not finished or not self._queue.empty():
+            self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def _append(self, lines):
+        widget = self.log_widget
+        widget.config(state="normal")
+        widget.insert("end", "\n".join(lines) + "\n")
+        line_count = int(widget.index("end-1c").split(".")[0])
+        if line_count > self.max_lines:
+            widget.delete("1.0", f"{line_count - self.max_lines + 1}.0")
+        widget.see("end")
+        widget.config(state="disabled")
+
+    def _show_progress(self, finished):
+        tracker = self.tracker
+        if self.status_var is not None:
+            self.status_var.set(tracker.status())
+        if self.progressbar is None:
+            return
+        if finished:
+            self.progressbar.stop()
+            self.progressbar.config(mode="determinate", maximum=max(tracker.done, 1), value=tracker.done)
+        elif tracker.total:
+            if str(self.progressbar.cget("mode")) != "determinate":
+                self.progressbar.stop()
+            self.progressbar.config(mode="determinate", maximum=tracker.total, value=tracker.done)
@@ -0,0 +1,286 @@
+"""
+Proof sheets: every crop of a batch on a few pages, checked before printing.
+
+For each aspect ratio, every source is shown as a thumbnail with the crop
+render_job would take (same crop_box arithmetic, same focus or subject-aware
+centering) outlined and the trimmed area shaded, packed SHEET_GRID to a page.
+Sources are decoded at thumbnail scale (JPEG DCT scaling via load_preview),
+so a proof never decodes a full-resolution image, and thumbnails are made
+across a process pool.
+
+Pages go into one PDF per ratio (proof_4x5.pdf) or numbered JPEGs
+(proof_4x5_p001.jpg), written as they fill so memory stays flat however
+large the batch.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from math import gcd
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .control import Cancelled
+from .decode import load_preview
+from .imaging import atomic_save, crop_box
+from .plan import crop_size_for
+from .saliency import SaliencyMap
+
+PROOF_FORMATS = ("pdf", "jpg")
+SHEET_SIZE_INCHES = (8.5, 11)
+SHEET_DPI = 150
+SHEET_GRID = (4, 5)  # Columns, rows
+SHADE = 150  # Opacity (0-255) of the black laid over trimmed areas
+BOX_COLOR = (230, 30, 30)
+PAGE_QUALITY = 85
+
+_IN_FLIGHT_PER_WORKER = 4  # Thumbnails queued per pool worker; the job iterator is read no further ahead
+
+
+def ratios_of(specs):
+    """
+    The distinct aspect ratios of `specs`, reduced (8:10 -> 4:5), in first-seen order.
+    """
+    ratios = []
+    for spec in specs:
+        divisor = gcd(spec.aspect_w, spec.aspect_h)
+        ratio = (spec.aspect_w // divisor, spec.aspect_h // divisor)
+        if ratio not in ratios:
+            ratios.append(ratio)
+    return ratios
+
+
+def proof_tiles(job, tile_size):
+    """
+    {ratio: thumbnail} for job.source, each fitting tile_size with that
+    ratio's crop outlined and the area outside it shaded.
+    """
+    img, _ = load_preview(job.source, max(tile_size), job.fast_decode)
+    scale = min(tile_size[0] / img.width, tile_size[1] / img.height)
+    img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+    saliency = SaliencyMap(img) if job.crop_mode == "auto" and job.focus is None else None
+
+    tiles = {}
+    for aspect_w, aspect_h in ratios_of(job.specs):
+        focus = job.focus
+        if saliency is not None:
+            focus = saliency.focus_for(crop_size_for(img.size, aspect_w, aspect_h), img.size)
+        left, top, right, bottom = crop_box(img.size, aspect_w, aspect_h, focus)
+        shade = Image.new("L", img.size, SHADE)
+        ImageDraw.Draw(shade).rectangle((left, top, right - 1, bottom - 1), fill=0)
+        tile = img.copy()
+        tile.paste((0, 0, 0), (0, 0) + img.size, shade)
+        ImageDraw.Draw(tile).rectangle((left, top, right - 1, bottom - 1), outline=BOX_COLOR, width=2)
+        tiles[(aspect_w, aspect_h)] = tile
+    return tiles
+
+
+def _proof_task(job, tile_size):
+    # Errors travel back as text so one bad file never stops the pool
+    try:
+        return proof_tiles(job, tile_size), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _pooled_results(pool, jobs, tile_size, limit):
+    # Yields (job, result) in job order, consuming `jobs` lazily with at most `limit` tasks in flight
+    in_flight = deque()
+    for job in jobs:
+        in_flight.append((job, pool.submit(_proof_task, job, tile_size)))
+        if len(in_flight) >= limit:
+            job, future = in_flight.popleft()
+            yield job, future.result()
+    while in_flight:
+        job, future = in_flight.popleft()
+        yield job, future.result()
+
+
+class SheetLayout:
+    """
+    Page geometry: grid cells with a caption band under each thumbnail.
+    """
+
+    def __init__(self, size_inches=SHEET_SIZE_INCHES, dpi=SHEET_DPI, grid=SHEET_GRID):
+        self.dpi = dpi
+        self.columns, self.rows = grid
+        self.size = (int(size_inches[0] * dpi), int(size_inches[1] * dpi))
+        self.margin = dpi // 4
+        self.header = dpi // 4
+        self.caption = dpi // 8
+        self.cell = ((self.size[0] - 2 * self.margin) // self.columns,
+                     (self.size[1] - 2 * self.margin - self.header) // self.rows)
+        self.padding = max(2, dpi // 30)
+        self.tile_size = (self.cell[0] - 2 * self.padding, self.cell[1] - 2 * self.padding - self.caption)
+        self.font = ImageFont.load_default(max(8, self.caption - 4))
+        self.header_font = ImageFont.load_default(max(10, self.header - 10))
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    def cell_origin(self, index):
+        row, column = divmod(index, self.columns)
+        return (self.margin + column * self.cell[0] + self.padding,
+                self.margin + self.header + row * self.cell[1] + self.padding)
+
+
+class ProofSheet:
+    """
+    The pages of one ratio, each written out as soon as it is full.
+    """
+
+    def __init__(self, output_dir, ratio, layout, fmt="pdf", title=""):
+        if fmt not in PROOF_FORMATS:
+            raise ValueError(f"unknown proof format {fmt!r} (choose from {', '.join(PROOF_FORMATS)})")
+        self.output_dir = output_dir
+        self.ratio = ratio
+        self.layout = layout
+        self.format = fmt
+        self.title = title
+        self.stem = f"proof_{ratio[0]}x{ratio[1]}"
+        self.path = os.path.join(output_dir, self.stem + ".pdf") if fmt == "pdf" else None
+        # The PDF grows page by page under a temp name and is renamed into place on close
+        self._pdf_tmp = os.path.join(output_dir, f".{self.stem}.pdf.{os.getpid()}.tmp")
+        self.pages = []  # Paths of the finished pages (the PDF once per page)
+        self._page = None
+        self._count = 0
+
+    def add(self, tile, label):
+        """
+        Place one thumbnail; returns the finished page's path when this filled it, else None.
+        """
+        layout = self.layout
+        if self._page is None:
+            self._new_page()
+        x, y = layout.cell_origin(self._count)
+        self._page.paste(tile, (x + (layout.tile_size[0] - tile.width) // 2,
+                                y + (layout.tile_size[1] - tile.height) // 2))
+        draw = ImageDraw.Draw(self._page)
+        draw.text((x + layout.tile_size[0] // 2, y + layout.tile_size[1] + layout.caption // 2),
+                  _fit_text(draw, label, layout.font, layout.tile_size[0]), fill=(0, 0, 0),
+                  font=layout.font, anchor="mm")
+        self._count += 1
+        if self._count == layout.per_page:
+            return self._flush()
+        return None
+
+    def _new_page(self):
+        layout = self.layout
+        self._page = Image.new("RGB", layout.size, (255, 255, 255))
+        heading = f"{self.ratio[0]}:{self.ratio[1]} proof  -  page {len(self.pages) + 1}"
+        if self.title:
+            heading += f"  -  {self.title}"
+        ImageDraw.Draw(self._page).text((layout.margin, layout.margin), heading, fill=(0, 0, 0),
+                                        font=layout.header_font)
+
+    def _flush(self):
+        page, self._page, self._count = self._page, None, 0
+        number = len(self.pages) + 1
+        if self.format == "pdf":
+            page.save(self._pdf_tmp, "PDF", resolution=self.layout.dpi, quality=PAGE_QUALITY,
+                      append=number > 1)
+            path = self.path
+        else:
+            path = os.path.join(self.output_dir, f"{self.stem}_p{number:03d}.jpg")
+            atomic_save(page, path, "JPEG", quality=PAGE_QUALITY, dpi=(self.layout.dpi, self.layout.dpi))
+        self.pages.append(path)
+        return path
+
+    def close(self):
+        """
+        Write the last, partly filled page and put the PDF in place. Returns the files written.
+        """
+        if self._page is not None:
+            self._flush()
+        if self.format == "pdf":
+            if not self.pages:
+                return []
+            os.replace(self._pdf_tmp, self.path)
+            return [self.path]
+        return list(self.pages)
+
+    def discard(self):
+        """
+        Drop an unfinished PDF (JPEG pages already written are kept).
+        """
+        self._page = None
+        if os.path.exists(self._pdf_tmp):
+            os.remove(self._pdf_tmp)
+
+
+def _fit_text(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while len(text) > 1 and draw.textlength(text + "...", font=font) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def make_proofs(jobs, output_dir, fmt="pdf", workers=None, control=None, on_event=None, layout=None,
+                title=""):
+    """
+    Write proof sheets for `jobs` (RenderJobs, e.g. from scan_jobs) into
+    output_dir, one set per aspect ratio in their specs. Thumbnails are made
+    on `workers` processes (None = one per CPU core, 1 = in-process) and
+    placed in job order. Returns the files written; cancelling through
+    `control` discards the unfinished PDFs and returns [].
+    """
+    on_event = on_event or (lambda event: None)
+    layout = layout or SheetLayout()
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    start = time.perf_counter()
+    sheets = {}
+    files = errors = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if pool is None:
+            results = ((job, _proof_task(job, layout.tile_size)) for job in jobs)
+        else:
+            results = _pooled_results(pool, jobs, layout.tile_size, workers * _IN_FLIGHT_PER_WORKER)
+        for job, (tiles, error) in results:
+            if control is not None:
+                control.checkpoint()
+            files += 1
+            if error is not None:
+                errors += 1
+                on_event({"event": "file_error", "source": job.source, "error": error})
+                continue
+            label = os.path.basename(job.source)
+            for ratio, tile in tiles.items():
+                if ratio not in sheets:
+                    sheets[ratio] = ProofSheet(output_dir, ratio, layout, fmt, title)
+                page = sheets[ratio].add(tile, label)
+                if page is not None:
+                    on_event({"event": "proof_page", "ratio": f"{ratio[0]}:{ratio[1]}",
+                              "page": len(sheets[ratio].pages), "path": page})
+            on_event({"event": "file_proofed", "source": job.source, "ratios": len(tiles)})
+        written = []
+        for ratio, sheet in sheets.items():
+            had = len(sheet.pages)
+            written.extend(sheet.close())
+            if len(sheet.pages) > had:
+                on_event({"event": "proof_page", "ratio": f"{ratio[0]}:{ratio[1]}",
+                          "page": len(sheet.pages), "path": sheet.pages[-1]})
+    except Cancelled:
+        for sheet in sheets.values():
+            sheet.discard()
+        on_event({"event": "proof_cancelled", "files": files})
+        return []
+    except BaseException:
+        for sheet in sheets.values():
+            sheet.discard()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    on_event({
+        "event": "proof_finished", "files": files, "errors": errors, "sheets": written,
+        "pages": sum(len(sheet.pages) for sheet in sheets.values()),
+        "ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+    return written
@@ -0,0 +1,76 @@
+"""
+Subject-aware crop centering.
+
+The decoded image is shrunk to at most ANALYSIS_SIZE pixels on its longest
+side, and an edge-energy map (absolute luminance gradients) is computed from
+it with NumPy. For every aspect ratio, each possible crop window is scored
+from an integral image in one vectorized pass, and the best window's center
+becomes the crop focus. That takes a few milliseconds per image, whatever its
+size. A slight pull towards the center keeps flat images centered.
+
+NumPy is optional: without it, AUTO_CROP_AVAILABLE is False and auto mode
+reports an error per file instead of silently center-cropping.
+"""
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AUTO_CROP_AVAILABLE = np is not None
+
+CROP_MODES = ("center", "auto")
+ANALYSIS_SIZE = 256
+# Share of the image's total energy a window loses for being maximally off center
+CENTER_BIAS = 0.05
+
+
+class SaliencyMap:
+    """
+    Edge energy of a downscaled copy of `img`, ready to place crop windows.
+    """
+
+    def __init__(self, img, analysis_size=ANALYSIS_SIZE):
+        if np is None:
+            raise RuntimeError("automatic crop centering needs NumPy (pip install numpy)")
+        scale = min(1.0, analysis_size / max(img.size))
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        small = img.resize(size, Image.BILINEAR, reducing_gap=2.0).convert("L")
+        luma = np.asarray(small, dtype=np.float32)
+
+        energy = np.zeros_like(luma)
+        dx = np.abs(np.diff(luma, axis=1))
+        dy = np.abs(np.diff(luma, axis=0))
+        energy[:, 1:] += dx
+        energy[:, :-1] += dx
+        energy[1:, :] += dy
+        energy[:-1, :] += dy
+
+        # Integral image with a zero row/column in front: any window sum is four lookups
+        self.integral = np.pad(energy.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+        self.height, self.width = luma.shape
+        self.total = float(self.integral[-1, -1])
+
+    def focus_for(self, crop_size, image_size):
+        """
+        Focus (x, y fractions) of the highest-scoring window with the shape of
+        crop_size (pixels of an image_size image).
+        """
+        win_w = min(self.width, max(1, round(crop_size[0] * self.width / image_size[0])))
+        win_h = min(self.height, max(1, round(crop_size[1] * self.height / image_size[1])))
+        s = self.integral
+        # Sum of every win_w x win_h window, indexed by its top-left corner
+        sums = s[win_h:, win_w:] - s[:-win_h, win_w:] - s[win_h:, :-win_w] + s[:-win_h, :-win_w]
+
+        rows, cols = sums.shape
+        if rows * cols > 1:
+            # Normalized distance of each window from the centered one; on a
+            # flat image this alone decides, so it falls back to the center
+            ys = np.abs(np.arange(rows) - (rows - 1) / 2) / max(1, (rows - 1) / 2)
+            xs = np.abs(np.arange(cols) - (cols - 1) / 2) / max(1, (cols - 1) / 2)
+            sums = sums - CENTER_BIAS * max(self.total, 1.0) * np.maximum(ys[:, None], xs[None, :])
+
+        top, left = np.unravel_index(np.argmax(sums), sums.shape)
+        return float((left + win_w / 2) / self.width), float((top + win_h / 2) / self.height)
@@ -0,0 +1,225 @@
+"""
+Streaming directory scanner.
+
+scan_images() walks the input tree with os.scandir and yields each image as
+soon as it is found, so processing can start before the walk is finished.
+Files are confirmed by their magic bytes, which is cheap compared with
+opening them in Pillow and skips mislabelled files. Symlinked folders are
+followed, but each folder is entered only once, so links back up the tree
+cannot loop.
+"""
+
+import fnmatch
+import itertools
+import os
+import queue
+import threading
+from collections import namedtuple
+
+from .batch import RenderJob
+from .imaging import VALID_EXTENSIONS
+
+# rel_dir is the file's folder relative to the scan root ("" at the top level)
+ScanEntry = namedtuple("ScanEntry", "path rel_dir name")
+
+_SNIFF_BYTES = 12
+WALK_AHEAD = 10_000  # ScanEntries walk_ahead may hold before the consumer takes them
+
+
+def sniff_image(path):
+    """
+    Identify an image format from the file's first bytes. Returns None for non-images.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(_SNIFF_BYTES)
+    except OSError:
+        return None
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "TIFF"
+    if head.startswith(b"BM"):
+        return "BMP"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _matches(rel_path, patterns):
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(name, p) for p in patterns)
+
+
+def scan_images(root, recursive=True, include=None, exclude=None,
+                extensions=VALID_EXTENSIONS, sniff=True, skip_dirs=()):
+    """
+    Yield a ScanEntry for every image under `root`, depth first, sorted within each folder.
+
+    include / exclude -- glob patterns matched against the path relative to
+                         root (with "/" separators) or the bare name; excluded
+                         folders are not descended into
+    extensions        -- cheap pre-filter on the file name; None sniffs every file
+    sniff             -- confirm candidates by magic bytes
+    skip_dirs         -- folders never to enter (e.g. an output folder inside the input)
+    """
+    skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+    visited = set()  # (st_dev, st_ino) of every folder entered
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        folder = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            st = os.stat(folder)
+            if (st.st_dev, st.st_ino) in visited:
+                continue  # Reached again through a symlink
+            visited.add((st.st_dev, st.st_ino))
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            if exclude and _matches(rel_path, exclude):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if recursive and os.path.normcase(os.path.abspath(entry.path)) not in skip:
+                    subdirs.append(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+                continue
+            if extensions is not None and not entry.name.lower().endswith(extensions):
+                continue
+            if include and not _matches(rel_path, include):
+                continue
+            if sniff and sniff_image(entry.path) is None:
+                continue
+            yield ScanEntry(entry.path, rel_dir, entry.name)
+
+        # Reversed so the stack pops subfolders in name order
+        stack.extend(reversed(subdirs))
+
+
+def scan_entry(root, path, recursive=True, include=None, exclude=None,
+               extensions=VALID_EXTENSIONS, sniff=True, skip_dirs=()):
+    """
+    The ScanEntry scan_images(root, ...) would yield for `path`, or None if
+    the walk would skip it (e.g. for a file reported by a folder watcher).
+    """
+    rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+    parts = rel_path.split("/")
+    if parts[0] == ".." or (len(parts) > 1 and not recursive):
+        return None
+    skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+    for depth in range(1, len(parts)):
+        if exclude and _matches("/".join(parts[:depth]), exclude):
+            return None
+        if os.path.normcase(os.path.abspath(os.path.join(root, *parts[:depth]))) in skip:
+            return None
+    name = parts[-1]
+    if exclude and _matches(rel_path, exclude):
+        return None
+    if extensions is not None and not name.lower().endswith(extensions):
+        return None
+    if include and not _matches(rel_path, include):
+        return None
+    if not os.path.isfile(path) or (sniff and sniff_image(path) is None):
+        return None
+    return ScanEntry(path, os.path.join(*parts[:-1]) if len(parts) > 1 else "", name)
+
+
+def output_dir_for(entry, output_root):
+    """
+    Output folder mirroring the entry's subfolder under output_root.
+    """
+    return os.path.join(output_root, entry.rel_dir) if entry.rel_dir else output_root
+
+
+def scan_jobs(input_root, output_root, specs, recursive=True, include=None, exclude=None,
+              extensions=VALID_EXTENSIONS, on_total=None, **job_settings):
+    """
+    Yield a RenderJob per image found under input_root, writing into the
+    mirrored subfolder of output_root. The output folder itself is never scanned.
+    With on_total, the walk runs ahead (see walk_ahead) and on_total(count)
+    is called once it has found every image, for progress reporting.
+    """
+    entries = scan_images(input_root, recursive, include, exclude, extensions, skip_dirs=[output_root])
+    if on_total is not None:
+        entries = walk_ahead(entries, on_total)
+    for entry in entries:
+        yield RenderJob(entry.path, output_dir_for(entry, output_root), specs, **job_settings)
+
+
+def walk_ahead(entries, on_total, limit=WALK_AHEAD):
+    """
+    Yield `entries` (e.g. from scan_images) while a background thread walks
+    on ahead of the consumer, calling on_total(count) when the walk ends.
+    This gives a total from the same single walk, without a second listing.
+    At most `limit` entries are held, so on a huge tree the walk waits for
+    the consumer and the total arrives once it is within `limit` of the end.
+    """
+    found = queue.Queue(maxsize=limit)
+    stopping = threading.Event()
+    end = object()
+
+    def put(item):
+        # Give up once the consumer has gone, instead of waiting on a full queue forever
+        while not stopping.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def walk():
+        count = 0
+        try:
+            for entry in entries:
+                if not put(entry):
+                    return
+                count += 1
+            on_total(count)
+        except Exception as e:
+            put(e)
+        finally:
+            put(end)
+
+    threading.Thread(target=walk, daemon=True).start()
+    try:
+        while True:
+            item = found.get()
+            if item is end:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopping.set()  # The consumer stopped early (cancelled); stop walking
+
+
+def count_images(input_root, output_root=None, recursive=True, include=None, exclude=None,
+                 extensions=VALID_EXTENSIONS):
+    """
+    Total for progress reporting from a separate walk, without sniffing.
+    scan_jobs(..., on_total=...) gets the total from its own walk instead.
+    """
+    skip_dirs = [output_root] if output_root else []
+    return sum(1 for _ in scan_images(input_root, recursive, include, exclude, extensions, False, skip_dirs))
+
+
+def peek(iterable):
+    """
+    Return (first item or None, iterator still yielding every item).
+    """
+    it = iter(iterable)
+    first = next(it, None)
+    if first is None:
+        return None, it
+    return first, itertools.chain([first], it)
@@ -0,0 +1,52 @@
+"""
+Print-size vocabulary shared by the GUIs, the command line and the benchmarks.
+"""
+
+from .imaging import OutputSpec
+
+# V1's fixed print set: (aspect_w, aspect_h) -> (width_in, height_in)
+TARGET_SIZES_INCHES = {
+    (4, 5): (16, 20),   # 16x20 inches @300 DPI => 4800x6000 pixels
+    (3, 4): (18, 24),   # 18x24 inches @300 DPI => 5400x7200 pixels
+    (2, 3): (24, 36),   # 24x36 inches @300 DPI => 7200x10800 pixels
+    (5, 7): (5, 7),     # 5x7 inches @300 DPI   => 1500x2100 pixels
+}
+
+RATIO_DIMENSIONS = {
+    "1:1": [(5, 5), (8, 8), (10, 10), (12, 12), (16, 16), (20, 20), (24, 24), (30, 30), (36, 36)],
+    "4:5": [(4, 5), (8, 10), (11, 14), (16, 20), (20, 25), (24, 30), (32, 40)],
+    "2:3": [(2, 3), (4, 6), (8, 12), (12, 18), (16, 24), (20, 30), (24, 36), (30, 45)],
+    "3:4": [(3, 4), (6, 8), (9, 12), (12, 16), (18, 24), (24, 32), (30, 40)],
+    "5:7": [(5, 7), (10, 14), (15, 21), (20, 28), (25, 35), (30, 42)],
+    "16:9": [(16, 9), (32, 18), (48, 27), (64, 36)],
+    "9:16": [(9, 16), (18, 32), (27, 48), (36, 64)],
+    "16:10": [(16, 10), (32, 20), (48, 30), (64, 40)]
+}
+
+
+def parse_selection(selection):
+    """
+    Parse "4:5=8x10,16x20" (listed sizes) or "4:5" (every size of the ratio)
+    into output specs. Raises ValueError for anything outside RATIO_DIMENSIONS.
+    """
+    ratio, _, dims = selection.partition("=")
+    ratio = ratio.strip()
+    if ratio not in RATIO_DIMENSIONS:
+        raise ValueError(f"unknown aspect ratio '{ratio}' (choose from {', '.join(RATIO_DIMENSIONS)})")
+    aspect_w, aspect_h = map(int, ratio.split(":"))
+    available = RATIO_DIMENSIONS[ratio]
+
+    if not dims.strip():
+        sizes = available
+    else:
+        sizes = []
+        for dim in dims.split(","):
+            try:
+                width_in, height_in = map(int, dim.strip().split("x"))
+            except ValueError:
+                raise ValueError(f"bad size '{dim}' for {ratio} (expected WxH, e.g. 8x10)")
+            if (width_in, height_in) not in available:
+                listed = ", ".join(f"{w}x{h}" for w, h in available)
+                raise ValueError(f"{dim.strip()} is not a {ratio} size (choose from {listed})")
+            sizes.append((width_in, height_in))
+    return [OutputSpec(aspect_w, aspect_h, w, h) for w, h in sizes]
@@ -0,0 +1,343 @@
+"""
+Watch-folder service: render new and changed images as they arrive.
+
+    python -m cropengine.watch INPUT OUTPUT --select 4:5=8x10,16x20 --select 1:1
+
+Changes are picked up with inotify on Linux and by rescanning the tree every
+POLL_SECONDS elsewhere (or with --polling, e.g. on network shares, where
+inotify sees nothing). A file is only rendered once its size and mtime have
+held for SETTLE_SECONDS, so copies in progress are left alone. Settled files
+are rendered in rounds of at most MAX_BATCH through the same incremental,
+manifest-backed path as the folder mode: up-to-date outputs are skipped, a
+changed file is re-rendered, and a burst of thousands of files queues up as
+paths instead of starting unbounded work. SIGINT and SIGTERM stop after the
+outputs in progress; the manifest lets the next start carry on from there.
+Events are printed as JSON lines, like the command-line mode.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import multiprocessing
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+
+from .batch import BatchEngine, RenderJob
+from .cli import JsonEventWriter, add_job_arguments, add_render_arguments, job_settings, render_options
+from .control import RunControl
+from .imaging import VALID_EXTENSIONS
+from .manifest import Manifest, run_incremental
+from .scan import output_dir_for, scan_entry, scan_images
+
+POLL_SECONDS = 2.0  # Rescan interval without inotify
+RESCAN_SECONDS = 300.0  # Full rescan interval with inotify, for anything it missed
+SETTLE_SECONDS = 2.0  # A file must keep its size and mtime this long before it is rendered
+MAX_BATCH = 64  # Settled files rendered per round; the rest wait for the next one
+
+INOTIFY_AVAILABLE = sys.platform.startswith("linux")
+
+# From <sys/inotify.h>
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+class Inotify:
+    """
+    inotify watches on every folder under `root` (minus skip_dirs), through
+    libc. Raises OSError when inotify cannot be used, e.g. when the per-user
+    watch limit is reached; callers then fall back to polling.
+    """
+
+    def __init__(self, root, skip_dirs=()):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+        self.folders = {}  # watch descriptor -> folder
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, folder):
+        for path, dirnames, _ in os.walk(folder):
+            dirnames[:] = [d for d in dirnames
+                           if os.path.normcase(os.path.abspath(os.path.join(path, d))) not in self.skip]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Removed while walking
+                raise OSError(code, f"cannot watch {path}: {os.strerror(code)}")
+            self.folders[wd] = path
+
+    def read(self, timeout):
+        """
+        Wait up to `timeout` seconds. Returns (changed paths, new folders), or
+        None when the kernel queue overflowed and everything must be rescanned.
+        """
+        changed, folders = set(), set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return changed, folders
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changed, folders
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                return None
+            if mask & _IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and os.path.normcase(os.path.abspath(path)) not in self.skip:
+                    folders.add(path)
+            else:
+                changed.add(path)
+        for folder in folders:
+            try:
+                self.add_tree(folder)
+            except OSError:
+                return None  # Out of watches mid-run; the caller rescans
+        return changed, folders
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Debouncer:
+    """
+    Holds changed paths until their size and mtime stop changing.
+    """
+
+    def __init__(self, settle_seconds=SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self.pending = {}  # path -> ((size, mtime_ns), time the signature was first seen)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def note(self, path, now):
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        signature = (st.st_size, st.st_mtime_ns)
+        held = self.pending.get(path)
+        if held is None or held[0] != signature:
+            self.pending[path] = (signature, now)
+
+    def ready(self, now, limit=None):
+        """
+        Remove and return up to `limit` paths that have settled, oldest first.
+        """
+        settled = []
+        for path in list(self.pending):
+            if limit is not None and len(settled) >= limit:
+                break
+            self.note(path, now)
+            held = self.pending.get(path)
+            if held is not None and now - held[1] >= self.settle_seconds:
+                del self.pending[path]
+                settled.append(path)
+        return settled
+
+
+class FolderWatcher:
+    """
+    Renders every settled new or changed image under input_root with `engine`,
+    whose worker pool is kept for as long as run() runs.
+    `job_settings` are RenderJob keyword arguments; `scan_options` are the
+    scan_images filters (recursive, include, exclude, extensions).
+    """
+
+    def __init__(self, input_root, output_root, specs, engine, emit=None, job_settings=None,
+                 scan_options=None, settle_seconds=SETTLE_SECONDS, poll_seconds=POLL_SECONDS,
+                 max_batch=MAX_BATCH, use_inotify=True):
+        self.input_root = input_root
+        self.output_root = output_root
+        self.specs = specs
+        self.engine = engine
+        self.emit = emit or (lambda event: None)
+        self.job_settings = job_settings or {}
+        self.scan_options = dict(recursive=True, include=None, exclude=None, extensions=VALID_EXTENSIONS)
+        self.scan_options.update(scan_options or {})
+        self.poll_seconds = poll_seconds
+        self.max_batch = max_batch
+        self.use_inotify = use_inotify and INOTIFY_AVAILABLE
+        self.debouncer = Debouncer(settle_seconds)
+        self.stopping = threading.Event()
+        self.rendered = 0
+        self._signatures = {}  # path -> (size, mtime_ns) at the last rescan
+
+    def stop(self):
+        """
+        Stop after the outputs in progress.
+        """
+        self.stopping.set()
+        if self.engine.control is not None:
+            self.engine.control.cancel()
+
+    def run(self):
+        os.makedirs(self.output_root, exist_ok=True)
+        manifest = Manifest(self.output_root)
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = Inotify(self.input_root, [self.output_root])
+            except OSError as e:
+                self.emit({"event": "watch_fallback", "error": str(e)})
+        self.emit({"event": "watch_started", "input": self.input_root, "output": self.output_root,
+                   "method": "inotify" if inotify else "polling"})
+        # One worker pool for every round, instead of starting one per file drop
+        self.engine.start()
+        try:
+            self._rescan(time.monotonic())
+            last_rescan = time.monotonic()
+            while not self.stopping.is_set():
+                # Wake up at least every poll_seconds so stop() is noticed (a signal does not end select)
+                timeout = self.poll_seconds
+                if self.debouncer:
+                    timeout = min(timeout, self.debouncer.settle_seconds)
+                if inotify is None:
+                    self.stopping.wait(timeout)
+                    changes = None if time.monotonic() - last_rescan >= self.poll_seconds else (set(), set())
+                else:
+                    changes = inotify.read(timeout)
+                    if time.monotonic() - last_rescan >= RESCAN_SECONDS:
+                        changes = None
+                now = time.monotonic()
+                if changes is None:
+                    self._rescan(now)
+                    last_rescan = now
+                else:
+                    changed, folders = changes
+                    for path in changed:
+                        self.debouncer.note(path, now)
+                    for folder in folders:
+                        self._rescan(now, folder)
+                batch = self.debouncer.ready(now, self.max_batch)
+                if batch and not self.stopping.is_set():
+                    self._render(batch, manifest)
+        finally:
+            self.engine.close()
+            if inotify is not None:
+                inotify.close()
+            self.emit({"event": "watch_stopped", "rendered": self.rendered, "pending": len(self.debouncer)})
+
+    def _rescan(self, now, folder=None):
+        # Polling: every image whose size or mtime differs from the last rescan
+        root = folder or self.input_root
+        signatures = {}
+        for entry in scan_images(root, sniff=False, skip_dirs=[self.output_root], **self.scan_options):
+            try:
+                st = os.stat(entry.path)
+            except OSError:
+                continue
+            signatures[entry.path] = (st.st_size, st.st_mtime_ns)
+            if self._signatures.get(entry.path) != signatures[entry.path]:
+                self.debouncer.note(entry.path, now)
+        if folder is None:
+            self._signatures = signatures
+        else:
+            self._signatures.update(signatures)
+
+    def _render(self, paths, manifest):
+        jobs = []
+        for path in paths:
+            entry = scan_entry(self.input_root, path, skip_dirs=[self.output_root], **self.scan_options)
+            if entry is not None:
+                jobs.append(RenderJob(entry.path, output_dir_for(entry, self.output_root), self.specs,
+                                      **self.job_settings))
+        if not jobs:
+            return
+        self.emit({"event": "watch_batch", "files": len(jobs), "pending": len(self.debouncer)})
+        results = run_incremental(self.engine, jobs, manifest, self.emit, report_stale=False)
+        self.rendered += len(results)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cropengine.watch",
+        description="Watch a folder and render new or changed images as they arrive.",
+    )
+    parser.add_argument("input", help="folder to watch")
+    parser.add_argument("output", help="output folder (created if missing)")
+    add_job_arguments(parser)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU core)")
+    parser.add_argument("--memory-mb", type=int, default=None,
+                        help="RAM budget for parallel renders (default: a share of physical RAM, 0 no limit)")
+    add_render_arguments(parser)
+    parser.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="only watch the top level of the input folder")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="only render files whose relative path or name matches; repeatable")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="ignore files and folders whose relative path or name matches; repeatable")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"seconds a file must stay unchanged before it is rendered (default {SETTLE_SECONDS:g})")
+    parser.add_argument("--batch", type=int, default=MAX_BATCH,
+                        help=f"settled files rendered per round (default {MAX_BATCH})")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS,
+                        help=f"seconds between rescans when polling (default {POLL_SECONDS:g})")
+    parser.add_argument("--polling", action="store_true",
+                        help="rescan instead of using inotify (network shares, other platforms)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    specs, settings = job_settings(parser, args)
+    options = render_options(parser, args)
+    if args.memory_mb is not None and args.memory_mb < 0:
+        parser.error("--memory-mb must be 0 (no limit) or a positive number of MB")
+    if not os.path.isdir(args.input):
+        parser.error(f"input folder not found: {args.input}")
+    if args.batch < 1:
+        parser.error("--batch must be at least 1")
+
+    engine = BatchEngine(workers=args.workers, control=RunControl(), memory_mb=args.memory_mb, **options)
+    watcher = FolderWatcher(
+        args.input, args.output, specs, engine, JsonEventWriter(), settings,
+        dict(recursive=args.recursive, include=args.include, exclude=args.exclude),
+        args.settle, args.poll, args.batch, use_inotify=not args.polling,
+    )
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: watcher.stop())
+    watcher.run()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Render worker daemon for the shared job queue (see cropengine.jobqueue).
+
+    python -m cropengine.worker submit QUEUE.db INPUT OUTPUT --select 4:5=8x10,16x20
+    python -m cropengine.worker run QUEUE.db --processes 4
+    python -m cropengine.worker status QUEUE.db
+
+`submit` queues one job per image (folders are scanned like the CLI does).
+`run` leases jobs one at a time per process and renders them with render_job,
+renewing the lease from a background thread while a job runs. Any number of
+daemons may serve the same queue file, on one host or several. SIGINT and
+SIGTERM stop a daemon between outputs and hand its job back to the queue.
+Events are printed as JSON lines, like the command-line mode.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+from .batch import RenderJob, render_job
+from .cli import (
+    EXIT_FAILED, EXIT_OK, JsonEventWriter, add_job_arguments, add_render_arguments, job_settings, render_options,
+)
+from .control import RunControl
+from .encoders import get_profile
+from .imaging import VALID_EXTENSIONS, base_name_of, output_name
+from .jobqueue import LEASE_SECONDS, MAX_ATTEMPTS, RETRY_DELAY, JobQueue, worker_id
+from .scan import scan_jobs
+
+POLL_SECONDS = 2.0  # Wait between queue checks while idle
+
+
+class Worker:
+    """
+    Leases jobs from `queue` and renders them until stopped.
+    `options` are passed to render_job (strip_pixels, cache).
+    """
+
+    def __init__(self, queue, emit=None, lease_seconds=LEASE_SECONDS, poll_seconds=POLL_SECONDS,
+                 retry_delay=RETRY_DELAY, **options):
+        self.queue = queue
+        self.emit = emit or (lambda event: None)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.retry_delay = retry_delay
+        self.options = options
+        self.owner = worker_id()
+        self.stopping = threading.Event()
+        self.control = None  # RunControl of the job in progress
+        self.processed = 0
+
+    def stop(self):
+        """
+        Stop after the output in progress; its job goes back to the queue.
+        """
+        self.stopping.set()
+        if self.control is not None:
+            self.control.cancel()
+
+    def run(self, exit_when_idle=False, max_jobs=None):
+        self.emit({"event": "worker_started", "worker": self.owner, "queue": self.queue.path})
+        while not self.stopping.is_set() and (max_jobs is None or self.processed < max_jobs):
+            leased = self.queue.lease(self.owner, self.lease_seconds)
+            if leased is None:
+                if exit_when_idle:
+                    break
+                self.stopping.wait(self.poll_seconds)
+                continue
+            self.process(leased)
+            self.processed += 1
+        self.emit({"event": "worker_stopped", "worker": self.owner, "jobs": self.processed})
+
+    def process(self, leased):
+        """
+        Render the outputs of a leased job that no earlier attempt finished, then settle the job.
+        """
+        job = leased.job
+        self.emit({"event": "job_leased", "job": leased.id, "source": job.source, "attempt": leased.attempt})
+        done = self.queue.finished_outputs(leased.id)
+        extension = get_profile(job.encoder).extension
+        base_name = base_name_of(job.source)
+        specs = [spec for spec in job.specs if output_name(base_name, spec, extension) not in done]
+
+        self.control = RunControl()
+        if self.stopping.is_set():
+            self.control.cancel()
+        finished = threading.Event()
+        renewing = threading.Thread(target=self._renew, args=(leased.id, finished), daemon=True)
+        renewing.start()
+        try:
+            result = render_job(job._replace(specs=specs), self._forward(leased.id), control=self.control,
+                                **self.options) if specs else None
+        finally:
+            control, self.control = self.control, None
+            finished.set()
+            renewing.join()
+
+        if result is None or (result.error is None and all(out.error is None for out in result.outputs)):
+            if self.queue.complete(leased.id, self.owner):
+                self.emit({"event": "job_done", "job": leased.id, "source": job.source,
+                           "outputs": len(job.specs), "rendered": len(specs)})
+            else:
+                # The lease ran out just before the end; the job is now another worker's
+                self.emit({"event": "job_lost", "job": leased.id, "source": job.source,
+                           "warning": "lease lost before the job could be completed"})
+        elif self.stopping.is_set():
+            self.queue.release(leased.id, self.owner)
+            self.emit({"event": "job_released", "job": leased.id, "source": job.source})
+        elif control.cancelled:
+            # The lease was lost; whoever holds it now finishes the job
+            self.emit({"event": "job_lost", "job": leased.id, "source": job.source})
+        else:
+            error = result.error or next(out.error for out in result.outputs if out.error)
+            retry = self.queue.fail(leased.id, self.owner, error, self.retry_delay)
+            self.emit({"event": "job_failed", "job": leased.id, "source": job.source,
+                       "error": error, "retry": retry})
+
+    def _forward(self, job_id):
+        def forward(event):
+            if event["event"] == "output_saved":
+                self.queue.record_output(job_id, event, self.owner)
+            self.emit(dict(event, job=job_id))
+        return forward
+
+    def _renew(self, job_id, finished):
+        # Renew at a third of the lease, so one missed renewal never loses the job
+        while not finished.wait(self.lease_seconds / 3):
+            if not self.queue.renew(job_id, self.owner, self.lease_seconds):
+                # Another worker took the job over; stop rendering it
+                if self.control is not None:
+                    self.control.cancel()
+                return
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cropengine.worker",
+        description="Queue render jobs and run worker daemons that render them.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="queue a job per image")
+    submit.add_argument("queue", help="queue database file (created if missing)")
+    submit.add_argument("input", help="image file or folder of images")
+    submit.add_argument("output", help="output folder the workers write to")
+    add_job_arguments(submit)
+    submit.add_argument("--no-recursive", dest="recursive", action="store_false",
+                        help="only queue the top level of an input folder")
+    submit.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help=f"renders tried per job before it is marked failed (default {MAX_ATTEMPTS})")
+
+    run = commands.add_parser("run", help="render queued jobs until stopped")
+    run.add_argument("queue", help="queue database file")
+    run.add_argument("-p", "--processes", type=int, default=1, help="daemon processes to start (default 1)")
+    run.add_argument("--lease", type=float, default=LEASE_SECONDS,
+                     help=f"seconds a job stays leased without renewal (default {LEASE_SECONDS})")
+    run.add_argument("--poll", type=float, default=POLL_SECONDS,
+                     help=f"seconds between queue checks while idle (default {POLL_SECONDS:g})")
+    run.add_argument("--retry-delay", type=float, default=RETRY_DELAY,
+                     help=f"seconds before a failed job is retried, doubling per attempt (default {RETRY_DELAY})")
+    run.add_argument("--exit-when-idle", action="store_true", help="stop once the queue has no runnable job")
+    add_render_arguments(run)
+
+    status = commands.add_parser("status", help="print job counts and recent failures")
+    status.add_argument("queue", help="queue database file")
+    status.add_argument("--retry-failed", action="store_true", help="queue failed jobs again first")
+    return parser
+
+
+def _serve(queue_path, options, lease, poll, retry_delay, exit_when_idle):
+    worker = Worker(JobQueue(queue_path), JsonEventWriter(), lease, poll, retry_delay, **options)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: worker.stop())
+    worker.run(exit_when_idle)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    writer = JsonEventWriter()
+
+    if args.command == "submit":
+        specs, settings = job_settings(parser, args)
+        if not os.path.exists(args.input):
+            parser.error(f"input not found: {args.input}")
+        # Workers may run in another directory or on another host: queue absolute paths
+        source, output = os.path.abspath(args.input), os.path.abspath(args.output)
+        if os.path.isdir(source):
+            jobs = scan_jobs(source, output, specs, args.recursive, **settings)
+        else:
+            jobs = [RenderJob(source, output, specs, **settings)]
+        jobs = (job._replace(source=os.path.abspath(job.source)) for job in jobs)
+        ids = JobQueue(args.queue).submit(jobs, args.max_attempts)
+        writer({"event": "jobs_submitted", "queue": args.queue, "jobs": len(ids),
+                "first": ids[0] if ids else None, "last": ids[-1] if ids else None})
+        if not ids:
+            writer({"event": "batch_error", "error": f"no {'/'.join(VALID_EXTENSIONS)} files in {args.input}"})
+            return EXIT_FAILED
+        return EXIT_OK
+
+    if args.command == "status":
+        queue = JobQueue(args.queue)
+        retried = queue.retry_failed() if args.retry_failed else 0
+        json.dump({
+            "queue": args.queue, "jobs": queue.counts(), "retried": retried,
+            "failures": [{"job": job_id, "source": source, "error": error}
+                         for job_id, source, error in queue.failures()],
+        }, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+        return 0
+
+    options = render_options(parser, args)
+    serve_args = (args.queue, options, args.lease, args.poll, args.retry_delay, args.exit_when_idle)
+    if args.processes <= 1:
+        _serve(*serve_args)
+        return 0
+    daemons = [multiprocessing.Process(target=_serve, args=serve_args) for _ in range(args.processes)]
+    for daemon in daemons:
+        daemon.start()
+    # Daemons handle SIGINT themselves (the terminal sends it to all); pass SIGTERM on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: [daemon.terminate() for daemon in daemons])
+    for daemon in daemons:
+        while daemon.is_alive():
+            daemon.join(1.0)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from cropengine.batch import BatchEngine, RenderJob
+from cropengine.imaging import OutputSpec
+
+SPECS = [OutputSpec(4, 5, 4, 5), OutputSpec(4, 5, 2, 3), OutputSpec(2, 3, 4, 6), OutputSpec(1, 1, 3, 3)]
+DPI = 50
+
+
+@pytest.fixture
+def sources(tmp_path):
+    folder = tmp_path / "in"
+    folder.mkdir()
+    paths = []
+    for i, size in enumerate([(640, 480), (480, 640), (500, 500)]):
+        img = Image.new("RGB", size, (40 * i, 90, 160))
+        ImageDraw.Draw(img).ellipse((50, 60, 300, 280), fill=(250, 200 - 50 * i, 20))
+        path = str(folder / f"IMG_{i}.jpg")
+        img.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def render(sources, output_dir, **engine_options):
+    os.makedirs(output_dir)
+    events = []
+    jobs = [RenderJob(source, output_dir, SPECS, dpi=DPI) for source in sources]
+    results = BatchEngine(memory_mb=0, **engine_options).run(jobs, events.append)
+    return results, events
+
+
+def read_outputs(folder):
+    outputs = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), "rb") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+@pytest.mark.parametrize("options", [{"workers": 2}, {"workers": 2, "split_sizes": True}])
+def test_pool_outputs_match_serial(sources, tmp_path, options):
+    serial_results, _ = render(sources, str(tmp_path / "serial"), workers=1)
+    pool_results, _ = render(sources, str(tmp_path / "pool"), **options)
+
+    serial = read_outputs(tmp_path / "serial")
+    assert len(serial) == len(sources) * len(SPECS)
+    assert read_outputs(tmp_path / "pool") == serial
+    assert [r.source for r in pool_results] == [r.source for r in serial_results] == sources
+    assert [[o.name for o in r.outputs] for r in pool_results] == [[o.name for o in r.outputs] for r in serial_results]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_file_does_not_stop_the_batch(sources, tmp_path, workers):
+    bad = os.path.join(os.path.dirname(sources[0]), "IMG_bad.jpg")
+    with open(bad, "wb") as f:
+        f.write(b"not a jpeg")
+    results, events = render([sources[0], bad, sources[1]], str(tmp_path / "out"), workers=workers)
+
+    assert [r.error is None for r in results] == [True, False, True]
+    assert [event["source"] for event in events if event["event"] == "file_error"] == [bad]
+    done = [event["source"] for event in events if event["event"] == "file_planned"]
+    assert sorted(done) == sorted([sources[0], sources[1]])
+    assert len(os.listdir(tmp_path / "out")) == 2 * len(SPECS)
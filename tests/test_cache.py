@@ -0,0 +1,106 @@
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+from cropengine.batch import RenderJob, render_job
+from cropengine.imaging import OutputSpec
+
+pytest.importorskip("numpy")
+from cropengine.cache import RenderCache  # noqa: E402
+
+SPEC_8x10 = OutputSpec(4, 5, 8, 10)  # 400x500 at 50 DPI: decoded at a quarter of the source
+SPEC_16x20 = OutputSpec(4, 5, 16, 20)  # 800x1000: decoded at half
+DPI = 50
+_MB = 1 << 20
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = str(tmp_path / "IMG_1.png")
+    img = Image.new("RGB", (3200, 4000), (30, 60, 90))
+    ImageDraw.Draw(img).ellipse((400, 800, 2800, 3600), fill=(240, 200, 40))
+    img.save(path)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RenderCache(str(tmp_path / "cache"), limit_mb=64)
+
+
+def cached_crops(cache, source, output_dir, specs):
+    events = []
+    result = render_job(RenderJob(source, output_dir, specs, dpi=DPI), events.append, cache=cache)
+    assert result.error is None
+    planned, = [event for event in events if event["event"] == "file_planned"]
+    return planned["cached"]
+
+
+def test_larger_cached_crop_serves_smaller_sizes(cache, source, tmp_path):
+    out = str(tmp_path / "out")
+    assert cached_crops(cache, source, out, [SPEC_16x20]) == 0
+    assert cached_crops(cache, source, out, [SPEC_16x20]) == 1
+    # A different size set decodes at another scale, but the crop is reused
+    assert cached_crops(cache, source, out, [SPEC_8x10]) == 1
+    with Image.open(os.path.join(out, "IMG_1_4x5_8x10in.jpg")) as img:
+        assert img.size == (400, 500)
+
+
+def test_too_small_crop_is_replaced(cache, source, tmp_path):
+    out = str(tmp_path / "out")
+    assert cached_crops(cache, source, out, [SPEC_8x10]) == 0
+    assert cached_crops(cache, source, out, [SPEC_8x10, SPEC_16x20]) == 0
+    assert len(cache.entries()) == 1
+    assert cached_crops(cache, source, out, [SPEC_8x10]) == 1
+    assert cached_crops(cache, source, out, [SPEC_16x20]) == 1
+
+
+def test_exact_hit_gives_the_same_bytes(cache, source, tmp_path):
+    outputs = []
+    for run in range(2):
+        out = str(tmp_path / f"run{run}")
+        cached_crops(cache, source, out, [SPEC_8x10])
+        with open(os.path.join(out, "IMG_1_4x5_8x10in.jpg"), "rb") as f:
+            outputs.append(f.read())
+    assert outputs[0] == outputs[1]
+
+
+def test_key_depends_on_source_ratio_and_center(cache, source):
+    job = RenderJob(source, "out", [SPEC_8x10])
+    key = cache.key(job, 4, 5)
+    assert cache.key(job._replace(specs=[SPEC_16x20], dpi=300), 8, 10) == key
+    assert cache.key(job, 1, 1) != key
+    assert cache.key(job._replace(focus=(0.25, 0.5)), 4, 5) != key
+    assert cache.key(job._replace(matte="black"), 4, 5) != key
+    with open(source, "ab") as f:
+        f.write(b"\0")
+    assert cache.key(job, 4, 5) != key
+
+
+def test_get_and_put(cache):
+    img = Image.new("RGB", (40, 50), (1, 2, 3))
+    assert cache.get("a") is None
+    assert cache.put("a", img)
+    assert cache.get("a").tobytes() == img.tobytes()
+    assert cache.get("a", (40, 50)) is not None
+    assert cache.get("a", (41, 50)) is None
+    assert cache.get("a", (40, 51)) is None
+    with open(cache._path("b"), "wb") as f:
+        f.write(b"damaged")
+    assert cache.get("b") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), limit_mb=3.5)
+    img = Image.new("RGB", (1024, 341))  # About 1 MB as .npy
+    for age, key in enumerate("abc"):
+        assert cache.put(key, img)
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    # "a" is the oldest, but a hit makes it the most recently used
+    assert cache.get("a") is not None
+    assert cache.put("d", img)
+    assert sorted(os.path.basename(path)[0] for _, _, path in cache.entries()) == ["a", "c", "d"]
+    assert cache.usage_mb() <= 3.5
+    # An entry larger than the whole cache is never stored
+    assert not cache.put("huge", Image.new("RGB", (2048, 2048)))
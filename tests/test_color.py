@@ -0,0 +1,110 @@
+import itertools
+import struct
+
+import pytest
+from PIL import Image
+
+from cropengine.color import COLOR_MANAGEMENT_AVAILABLE, MATTE, matte_rgb, prepare, srgb_profile, to_8bit
+
+
+def s15(value):
+    return struct.pack(">i", round(value * 65536))
+
+
+def cmyk_profile():
+    """
+    A minimal ICC v2 CMYK profile: an 8-bit A2B0 lookup table to Lab in which
+    every ink darkens neutrally, unlike Pillow's naive CMYK conversion.
+    """
+    clut = b"".join(
+        bytes([round(255 * (1 - c * 0.3) * (1 - m * 0.4) * (1 - y * 0.1) * (1 - k)), 128, 128])
+        for c, m, y, k in itertools.product((0, 1), repeat=4))
+    identity = bytes(range(256))
+    a2b0 = (b"mft1" + bytes(4) + bytes([4, 3, 2, 0]) + b"".join(s15(v) for v in (1, 0, 0, 0, 1, 0, 0, 0, 1))
+            + identity * 4 + clut + identity * 3)
+    wtpt = b"XYZ " + bytes(4) + s15(0.9642) + s15(1.0) + s15(0.8249)
+    text = b"test CMYK\0"
+    desc = b"desc" + bytes(4) + struct.pack(">I", len(text)) + text + bytes(78)
+    tags = [(b"A2B0", a2b0), (b"wtpt", wtpt), (b"desc", desc)]
+
+    offset = 128 + 4 + 12 * len(tags)
+    table, data = b"", b""
+    for signature, body in tags:
+        body += bytes(-len(body) % 4)
+        table += signature + struct.pack(">II", offset + len(data), len(body))
+        data += body
+    header = (struct.pack(">I", offset + len(data)) + b"lcms" + struct.pack(">I", 0x02100000) + b"prtrCMYKLab "
+              + bytes(12) + b"acsp" + bytes(28) + s15(0.9642) + s15(1.0) + s15(0.8249) + bytes(48))
+    return header + struct.pack(">I", len(tags)) + table + data
+
+
+def pixels(img):
+    return [img.getpixel((x, 0)) for x in range(img.width)]
+
+
+@pytest.mark.skipif(not COLOR_MANAGEMENT_AVAILABLE, reason="needs Pillow with LittleCMS")
+def test_cmyk_with_a_profile_becomes_srgb():
+    img = Image.new("CMYK", (3, 1))
+    img.putpixel((1, 0), (0, 0, 0, 255))
+    img.putpixel((2, 0), (255, 0, 0, 0))
+    img.info["icc_profile"] = cmyk_profile()
+
+    out, icc = prepare(img)
+    assert out.mode == "RGB"
+    assert icc == srgb_profile()
+    white, black, cyan = pixels(out)
+    assert white == (255, 255, 255)
+    assert black == (0, 0, 0)
+    # The profile's neutral cyan, not Pillow's plain (0, 255, 255)
+    assert cyan[0] == cyan[1] == cyan[2] and 100 < cyan[0] < 230
+
+
+def test_preserve_keeps_rgb_pixels_and_profile():
+    img = Image.new("RGB", (2, 1), (10, 200, 30))
+    img.putpixel((1, 0), (250, 5, 90))
+    img.info["icc_profile"] = icc = b"an RGB profile, embedded as it is"
+    out, out_icc = prepare(img)
+    assert out_icc is icc
+    assert out.tobytes() == img.tobytes()
+
+
+@pytest.mark.skipif(not COLOR_MANAGEMENT_AVAILABLE, reason="needs Pillow with LittleCMS")
+def test_srgb_mode_tags_rgb_sources_srgb():
+    img = Image.new("RGB", (1, 1), (10, 200, 30))
+    img.info["icc_profile"] = srgb_profile()
+    out, icc = prepare(img, "srgb")
+    assert icc == srgb_profile()
+    assert all(abs(a - b) <= 1 for a, b in zip(out.getpixel((0, 0)), (10, 200, 30)))
+
+
+def test_16_bit_grayscale_is_scaled_not_clipped():
+    img = Image.new("I;16", (4, 1))
+    for x, value in enumerate((0, 257 * 64, 32768, 65535)):
+        img.putpixel((x, 0), value)
+    out, icc = prepare(img)
+    assert icc is None
+    assert out.mode == "F"
+    assert pixels(out) == pytest.approx([0, 64, 32768 / 257, 255])
+    assert pixels(to_8bit(out)) == [(0, 0, 0), (64, 64, 64), (128, 128, 128), (255, 255, 255)]
+
+
+def test_alpha_is_matted():
+    img = Image.new("RGBA", (3, 1), (255, 0, 0, 0))
+    img.putpixel((1, 0), (0, 0, 255, 255))
+    img.putpixel((2, 0), (0, 0, 0, 128))
+    out, _ = prepare(img)
+    assert out.mode == "RGB"
+    transparent, opaque, half = pixels(out)
+    assert transparent == matte_rgb(MATTE) == (255, 255, 255)
+    assert opaque == (0, 0, 255)
+    assert all(abs(v - 127) <= 1 for v in half)
+    assert pixels(prepare(img, matte="#204060")[0])[0] == (0x20, 0x40, 0x60)
+
+
+def test_transparent_palette_is_matted():
+    img = Image.new("P", (2, 1))
+    img.putpalette([0, 255, 0, 255, 0, 0])
+    img.putpixel((1, 0), 1)
+    img.info["transparency"] = 0
+    out, _ = prepare(img, matte="black")
+    assert pixels(out) == [(0, 0, 0), (255, 0, 0)]
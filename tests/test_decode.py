@@ -0,0 +1,53 @@
+import pytest
+from PIL import Image
+
+from cropengine.decode import DECODE_GAP, decode_scale, decoded_size, load_for_outputs
+from cropengine.imaging import OutputSpec
+
+SPEC_8x10 = OutputSpec(4, 5, 8, 10)  # 800x1000 at 100 DPI
+DPI = 100
+
+
+@pytest.mark.parametrize("source_size, expected", [
+    ((4000, 5000), 0.4),
+    # Exactly DECODE_GAP times the target: full resolution is the least that serves it
+    ((1600, 2000), 1.0),
+    ((1600 * 2, 2000 * 2), 0.5),
+    ((1000, 1250), 1.0),
+])
+def test_decode_scale(source_size, expected):
+    assert DECODE_GAP == 2.0
+    assert decode_scale(source_size, [SPEC_8x10], DPI) == pytest.approx(expected)
+
+
+def test_decode_scale_takes_the_most_demanding_spec():
+    specs = [OutputSpec(4, 5, 4, 5), SPEC_8x10, OutputSpec(1, 1, 2, 2)]
+    assert decode_scale((4000, 5000), specs, DPI) == pytest.approx(0.4)
+    assert decode_scale((4000, 5000), [], DPI) == 1.0
+
+
+@pytest.mark.parametrize("size, decoded", [
+    ((3200, 4000), (1600, 2000)),  # Scale 0.5: halved
+    ((3199, 3999), (3199, 3999)),  # Just under: a factor 2 reduce would drop below the gap
+])
+def test_box_reduce_at_the_gap_boundary(tmp_path, size, decoded):
+    path = str(tmp_path / "source.png")
+    Image.new("RGB", size).save(path)
+    assert decoded_size(path, [SPEC_8x10], DPI) == (size, decoded)
+    img, source_size = load_for_outputs(path, [SPEC_8x10], DPI)
+    assert (source_size, img.size) == (size, decoded)
+
+
+def test_reduced_sources_are_converted_after_the_reduce(tmp_path):
+    rgba = Image.new("RGBA", (3200, 4000), (255, 0, 0, 0))
+    rgba.paste((0, 0, 255, 255), (0, 0, 1600, 4000))
+    rgba.save(tmp_path / "alpha.png")
+    img, _ = load_for_outputs(str(tmp_path / "alpha.png"), [SPEC_8x10], DPI)
+    assert (img.mode, img.size) == ("RGB", (1600, 2000))
+    assert img.getpixel((10, 10)) == (0, 0, 255)
+    assert img.getpixel((1500, 10)) == (255, 255, 255)  # Transparent: the white matte
+
+    Image.new("I;16", (3200, 4000), 51400).save(tmp_path / "gray16.png")
+    img, _ = load_for_outputs(str(tmp_path / "gray16.png"), [SPEC_8x10], DPI)
+    assert (img.mode, img.size) == ("F", (1600, 2000))
+    assert img.getpixel((10, 10)) == pytest.approx(51400 / 257)
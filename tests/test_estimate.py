@@ -0,0 +1,77 @@
+import os
+
+import pytest
+from PIL import Image
+
+from cropengine.batch import RenderJob
+from cropengine.estimate import Calibration, estimate_batch, upscale_factor
+from cropengine.imaging import OutputSpec
+from cropengine.manifest import Manifest
+
+SPEC_6x4 = OutputSpec(3, 2, 6, 4)  # 600x400 at 100 DPI: the source's own size
+SPEC_15x10 = OutputSpec(3, 2, 15, 10)  # 1500x1000: enlarged 2.5x
+# One ns per pixel for decode, resize and encode; one byte per output pixel
+CALIBRATIONS = {"print": Calibration({"decode": 1.0, "convert": 0.0, "crop": 0.0, "resize": 1.0, "encode": 1.0}, 1.0)}
+
+
+@pytest.fixture
+def job(tmp_path):
+    source = str(tmp_path / "IMG_1.png")
+    Image.new("RGB", (600, 400)).save(source)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    return RenderJob(source, str(output_dir), [SPEC_6x4, SPEC_15x10], dpi=100, fast_decode=False)
+
+
+def run(jobs, **kwargs):
+    events = []
+    summary = estimate_batch(jobs, CALIBRATIONS, workers=2, memory_mb=0, on_event=events.append, **kwargs)
+    return summary, events
+
+
+def test_upscale_factor():
+    assert upscale_factor((600, 400), SPEC_6x4, 100) == 1.0
+    assert upscale_factor((600, 400), SPEC_15x10, 100) == 2.5
+    assert upscale_factor((1200, 1000), SPEC_6x4, 100) == 0.5
+
+
+def test_estimate_batch(job):
+    missing = job._replace(source=os.path.join(os.path.dirname(job.source), "missing.png"))
+    summary, events = run([job, missing])
+
+    estimated, error, finished = events
+    assert estimated["event"] == "file_estimated"
+    assert estimated["size"] == estimated["decoded"] == [600, 400]
+    assert [(o["name"], o["width"], o["height"], o["scale"], o["bytes"]) for o in estimated["outputs"]] == [
+        ("IMG_1_3x2_15x10in.jpg", 1500, 1000, 2.5, 1500 * 1000),
+        ("IMG_1_3x2_6x4in.jpg", 600, 400, 1.0, 600 * 400),
+    ]
+    assert estimated["warnings"] == ["IMG_1_3x2_15x10in.jpg is enlarged 2.5x"]
+    assert (error["event"], error["source"]) == ("file_error", missing.source)
+    assert finished is summary
+
+    assert summary["files"] == 2
+    assert summary["errors"] == 1
+    assert summary["outputs"] == summary["pending_outputs"] == 2
+    assert summary["upscaled"] == 1
+    assert summary["bytes"] == 1500 * 1000 + 600 * 400
+    # Decode of the source plus resize and encode of every output pixel
+    assert summary["cpu_ms"] == pytest.approx((600 * 400 + 2 * (1500 * 1000 + 600 * 400)) / 1e6, abs=0.1)
+    assert summary["workers"] == 2
+    assert summary["wall_ms"] == pytest.approx(summary["cpu_ms"] / 2, abs=0.1)
+
+
+def test_estimate_batch_skips_up_to_date_outputs(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    name = "IMG_1_3x2_15x10in.jpg"
+    open(os.path.join(job.output_dir, name), "wb").close()
+    manifest.record(job, name)
+
+    summary, events = run([job], manifest=manifest)
+    assert [o["up_to_date"] for o in events[0]["outputs"]] == [True, False]
+    # Only pending outputs are warned about
+    assert events[0]["warnings"] == []
+    assert summary["outputs"] == 2
+    assert summary["pending_outputs"] == 1
+    assert summary["bytes"] == 600 * 400
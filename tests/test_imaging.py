@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image
+
+from cropengine.imaging import (
+    OutputSpec, base_name_of, center_crop_to_aspect_ratio, crop_box, focal_crop_to_aspect_ratio, output_name,
+    specs_from_dimensions_map, specs_from_target_sizes, target_pixels,
+)
+
+
+@pytest.mark.parametrize("size, ratio, expected", [
+    ((3000, 2000), (1, 1), (500, 0, 2500, 2000)),
+    ((2000, 3000), (1, 1), (0, 500, 2000, 2500)),
+    ((3001, 2000), (1, 1), (500, 0, 2500, 2000)),
+    ((4000, 5000), (4, 5), (0, 0, 4000, 5000)),
+])
+def test_center_crop_box(size, ratio, expected):
+    assert crop_box(size, *ratio) == expected
+
+
+@pytest.mark.parametrize("focus, expected", [
+    ((0.5, 0.5), (500, 0, 2500, 2000)),
+    ((0.6, 0.5), (800, 0, 2800, 2000)),
+    # The window is clamped to the image
+    ((0.0, 0.5), (0, 0, 2000, 2000)),
+    ((1.0, 0.0), (1000, 0, 3000, 2000)),
+])
+def test_focal_crop_box(focus, expected):
+    assert crop_box((3000, 2000), 1, 1, focus) == expected
+
+
+def test_crop_functions_use_crop_box():
+    img = Image.new("RGB", (300, 200))
+    assert center_crop_to_aspect_ratio(img, 2, 3).size == (133, 200)
+    assert focal_crop_to_aspect_ratio(img, 2, 3, (0.9, 0.5)).size == (133, 200)
+
+
+def test_specs_and_names():
+    specs = specs_from_dimensions_map({"4:5": ["8x10", "16x20"]})
+    assert specs == [OutputSpec(4, 5, 8, 10), OutputSpec(4, 5, 16, 20)]
+    assert specs_from_target_sizes({(2, 3): (24, 36)}) == [OutputSpec(2, 3, 24, 36)]
+    assert target_pixels(specs[0]) == (2400, 3000)
+    assert target_pixels(specs[0], dpi=150) == (1200, 1500)
+    assert output_name(base_name_of("/photos/IMG_1.tif"), specs[0]) == "IMG_1_4x5_8x10in.jpg"
+    assert output_name("IMG_1", specs[0], ".png") == "IMG_1_4x5_8x10in.png"
@@ -0,0 +1,93 @@
+import pytest
+
+from cropengine.batch import RenderJob
+from cropengine.imaging import OutputSpec
+from cropengine.jobqueue import JobQueue
+
+JOB = RenderJob("/photos/IMG_1.jpg", "/prints", [OutputSpec(4, 5, 8, 10), OutputSpec(2, 3, 24, 36)], focus=(0.25, 0.5))
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "queue.db"))
+
+
+def state(queue):
+    return {name: count for name, count in queue.counts().items() if count}
+
+
+def test_lease_takes_the_oldest_job(queue):
+    first, second = queue.submit([JOB, JOB._replace(source="/photos/IMG_2.jpg")])
+    leased = queue.lease("a")
+    assert (leased.id, leased.attempt) == (first, 1)
+    assert leased.job == JOB
+    assert queue.lease("b").id == second
+    assert queue.lease("c") is None
+    assert state(queue) == {"leased": 2}
+
+
+def test_only_the_owner_renews_and_completes(queue):
+    job_id, = queue.submit([JOB])
+    queue.lease("a")
+    assert queue.renew(job_id, "a")
+    assert not queue.renew(job_id, "b")
+    assert not queue.complete(job_id, "b")
+    assert queue.complete(job_id, "a")
+    assert not queue.complete(job_id, "a")
+    assert state(queue) == {"done": 1}
+
+
+def test_failed_attempts_are_retried_then_failed(queue):
+    job_id, = queue.submit([JOB], max_attempts=2)
+    queue.lease("a")
+    assert queue.fail(job_id, "a", "disk full", retry_delay=0)
+    leased = queue.lease("a")
+    assert (leased.id, leased.attempt) == (job_id, 2)
+    assert not queue.fail(job_id, "a", "disk full again", retry_delay=0)
+    assert state(queue) == {"failed": 1}
+    assert queue.failures() == [(job_id, JOB.source, "disk full again")]
+
+    assert queue.retry_failed() == 1
+    assert queue.lease("a").attempt == 1
+
+
+def test_retries_wait_for_their_delay(queue):
+    job_id, = queue.submit([JOB])
+    queue.lease("a")
+    assert queue.fail(job_id, "a", "timeout", retry_delay=60)
+    assert queue.lease("a") is None
+    assert state(queue) == {"queued": 1}
+
+
+def test_expired_lease_goes_back_to_the_queue(queue):
+    job_id, = queue.submit([JOB])
+    queue.lease("a", lease_seconds=-1)
+    leased = queue.lease("b")
+    assert (leased.id, leased.attempt) == (job_id, 2)
+    # The first worker has lost the job
+    assert not queue.renew(job_id, "a")
+    assert not queue.complete(job_id, "a")
+    assert queue.complete(job_id, "b")
+
+
+def test_expired_lease_out_of_attempts_fails(queue):
+    job_id, = queue.submit([JOB], max_attempts=1)
+    queue.lease("a", lease_seconds=-1)
+    assert queue.lease("b") is None
+    assert queue.failures() == [(job_id, JOB.source, "lease expired (worker stopped responding)")]
+
+
+def test_released_job_keeps_its_attempt(queue):
+    job_id, = queue.submit([JOB])
+    queue.lease("a")
+    assert queue.release(job_id, "a")
+    assert queue.lease("b").attempt == 1
+
+
+def test_finished_outputs(queue):
+    job_id, = queue.submit([JOB])
+    queue.lease("a")
+    queue.record_output(job_id, {"name": "IMG_1_4x5_8x10in.jpg", "path": "/prints/IMG_1_4x5_8x10in.jpg",
+                                 "width": 2400, "height": 3000, "ms": 12.5}, "a")
+    assert queue.finished_outputs(job_id) == {"IMG_1_4x5_8x10in.jpg"}
+    assert queue.finished_outputs(job_id + 1) == set()
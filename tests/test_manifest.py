@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from cropengine.batch import RenderJob
+from cropengine.imaging import OutputSpec
+from cropengine.manifest import Manifest, render_settings
+
+SPEC_8x10 = OutputSpec(4, 5, 8, 10)
+SPEC_16x20 = OutputSpec(4, 5, 16, 20)
+
+
+@pytest.fixture
+def job(tmp_path):
+    source = tmp_path / "in" / "IMG_1.jpg"
+    source.parent.mkdir()
+    source.write_bytes(b"first version")
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    return RenderJob(str(source), str(output_dir), [SPEC_8x10, SPEC_16x20])
+
+
+def render(manifest, job, specs=None):
+    # Stand-in for the engine: write each output and record it
+    for spec in specs or job.specs:
+        name = f"IMG_1_4x5_{spec.width_in}x{spec.height_in}in.jpg"
+        with open(os.path.join(job.output_dir, name), "wb") as f:
+            f.write(b"jpeg")
+        manifest.record(job, name)
+    manifest.save()
+
+
+def test_render_settings_leave_out_location_and_neutral_values():
+    job = RenderJob("a.jpg", "out", [SPEC_8x10])
+    assert render_settings(job) == "dpi=300;quality=95;cascade_factor=2.0;fast_decode=True"
+    assert render_settings(job._replace(source="b.jpg", output_dir="other", specs=[])) == render_settings(job)
+    assert render_settings(job._replace(encoder="print", crop_mode="center")) == render_settings(job)
+    assert "quality=80" in render_settings(job._replace(quality=80))
+    assert "encoder=proof" in render_settings(job._replace(encoder="proof"))
+
+
+def test_keys_are_relative_to_the_manifest_folder(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    job = RenderJob("a.jpg", os.path.join(str(tmp_path), "sub", "dir"), [SPEC_8x10])
+    assert manifest._key(job, "a_4x5_8x10in.jpg") == "sub/dir/a_4x5_8x10in.jpg"
+
+
+def test_recorded_outputs_are_up_to_date(job):
+    manifest = Manifest(job.output_dir)
+    assert manifest.pending_specs(job) == [SPEC_8x10, SPEC_16x20]
+    render(manifest, job, [SPEC_8x10])
+    assert manifest.pending_specs(job) == [SPEC_16x20]
+    # The saved manifest gives the same answer to a later run
+    assert Manifest(job.output_dir).pending_specs(job) == [SPEC_16x20]
+
+
+def test_changed_settings_are_pending(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    render(manifest, job)
+    assert manifest.pending_specs(job) == []
+    assert manifest.pending_specs(job._replace(quality=80)) == [SPEC_8x10, SPEC_16x20]
+
+
+def test_missing_outputs_are_pending(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    render(manifest, job)
+    os.remove(os.path.join(job.output_dir, "IMG_1_4x5_16x20in.jpg"))
+    assert Manifest(job.output_dir).pending_specs(job) == [SPEC_16x20]
+
+
+def test_changed_source_content_is_pending(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    render(manifest, job)
+    with open(job.source, "wb") as f:
+        f.write(b"second version")
+    manifest = Manifest(job.output_dir)
+    # The quick check trusts nothing whose size or mtime changed
+    assert manifest.pending_specs(job, rehash=False) == [SPEC_8x10, SPEC_16x20]
+    assert manifest.pending_specs(job) == [SPEC_8x10, SPEC_16x20]
+
+
+def test_touched_source_with_the_same_content_is_up_to_date(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    render(manifest, job)
+    st = os.stat(job.source)
+    os.utime(job.source, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert Manifest(job.output_dir).pending_specs(job) == []
+
+
+def test_stale_sources(job):
+    manifest = Manifest(job.output_dir)
+    manifest.pending_specs(job)
+    render(manifest, job)
+    assert manifest.stale_sources([job.source]) == []
+    os.remove(job.source)
+    assert manifest.stale_sources([]) == [{
+        "source": os.path.abspath(job.source),
+        "outputs": ["IMG_1_4x5_16x20in.jpg", "IMG_1_4x5_8x10in.jpg"],
+    }]
@@ -0,0 +1,120 @@
+import os
+import threading
+
+import pytest
+from PIL import Image
+
+from cropengine import batch
+from cropengine.batch import RenderJob, render_job
+from cropengine.control import RunControl
+from cropengine.encoders import encode_output
+from cropengine.imaging import OutputSpec
+from cropengine.pipeline import AsyncWriter, Prefetcher
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for i in range(6):
+        path = str(tmp_path / f"{i}.bin")
+        with open(path, "wb") as f:
+            f.write(bytes([i]) * (i + 1))
+        paths.append(path)
+    return paths
+
+
+def test_prefetcher_keeps_order_and_reads_each_file(files):
+    items = [(i, path) for i, path in enumerate(files)]
+    pairs = list(Prefetcher(items, lambda item: item[1]))
+    assert [item for item, _ in pairs] == items
+    assert [data for _, data in pairs] == [bytes([i]) * (i + 1) for i in range(len(files))]
+
+
+def test_prefetcher_shares_reads_and_reports_unreadable_files(files, tmp_path):
+    missing = str(tmp_path / "missing.bin")
+    items = [files[0], files[0], missing, files[1]]
+    pairs = list(Prefetcher(items, lambda path: path))
+    assert [data for _, data in pairs] == [b"\0", b"\0", None, b"\1\1"]
+
+
+def test_prefetcher_raises_errors_of_the_items_it_pulls(files):
+    def items():
+        yield files[0]
+        raise ValueError("bad job")
+
+    prefetcher = Prefetcher(items(), lambda path: path)
+    with pytest.raises(ValueError, match="bad job"):
+        list(prefetcher)
+    prefetcher.close()
+
+
+def test_prefetcher_close_stops_reading_ahead(files):
+    pulled = []
+
+    def items():
+        for path in files:
+            pulled.append(path)
+            yield path
+
+    prefetcher = Prefetcher(items(), lambda path: path, depth=2)
+    assert next(prefetcher)[1] == b"\0"
+    prefetcher.close()
+    # The current item, one beyond it and `depth` more at most
+    assert len(pulled) <= 1 + 1 + 2
+    assert not prefetcher._ahead
+
+
+def test_async_writer_writes_in_order_and_reports_on_the_caller(tmp_path):
+    writer = AsyncWriter()
+    settled = []
+    paths = [str(tmp_path / f"{i}.jpg") for i in range(20)]
+    for i, path in enumerate(paths):
+        writer.submit(path, bytes([i]) * 1000, lambda error, i=i: settled.append((i, error, threading.get_ident())))
+    writer.close()
+    assert [(i, error) for i, error, _ in settled] == [(i, None) for i in range(20)]
+    assert {thread for _, _, thread in settled} == {threading.get_ident()}
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            assert f.read() == bytes([i]) * 1000
+
+
+def test_async_writer_reports_write_errors(tmp_path):
+    writer = AsyncWriter()
+    settled = []
+    writer.submit(str(tmp_path / "missing-folder" / "a.jpg"), b"data", settled.append)
+    writer.submit(str(tmp_path / "b.jpg"), b"data", settled.append)
+    writer.close()
+    assert isinstance(settled[0], OSError)
+    assert settled[1] is None
+    # The failed write left no temp file behind
+    assert os.listdir(tmp_path) == ["b.jpg"]
+
+
+def test_cancelled_render_closes_the_writer(tmp_path, monkeypatch):
+    source = str(tmp_path / "IMG_1.png")
+    Image.new("RGB", (600, 750), (200, 120, 40)).save(source)
+    specs = [OutputSpec(4, 5, w, w * 5 // 4) for w in (8, 4)] + [OutputSpec(1, 1, w, w) for w in (6, 3)]
+    control = RunControl()
+    encoded = []
+
+    # Cancel once two outputs have been handed to the writer
+    def encode_then_cancel(*args, **kwargs):
+        data = encode_output(*args, **kwargs)
+        encoded.append(data)
+        if len(encoded) == 2:
+            control.cancel()
+        return data
+
+    monkeypatch.setattr(batch, "encode_output", encode_then_cancel)
+    events = []
+    out = tmp_path / "out"
+    render_job(RenderJob(source, str(out), specs, dpi=50), events.append, control=control, overlap_io=True)
+
+    saved = [event["name"] for event in events if event["event"] == "output_saved"]
+    assert len(saved) == 2
+    assert events[-1] == {"event": "file_cancelled", "source": source, "completed": 2}
+    # Both submitted outputs were written in full before render_job returned, and nothing else
+    assert sorted(os.listdir(out)) == sorted(saved)
+    for name in saved:
+        with Image.open(out / name) as img:
+            img.load()
@@ -0,0 +1,66 @@
+import pytest
+
+from cropengine.imaging import OutputSpec
+from cropengine.plan import build_plan, crop_size_for
+
+SPEC_16x20 = OutputSpec(4, 5, 16, 20)
+SPEC_8x10 = OutputSpec(4, 5, 8, 10)
+SPEC_4x5 = OutputSpec(4, 5, 4, 5)
+
+
+def parents(plan):
+    return [[out.parent for out in step.outputs] for step in plan.steps]
+
+
+@pytest.mark.parametrize("size, ratio, expected", [
+    ((3000, 2000), (1, 1), (2000, 2000)),
+    ((3000, 2000), (2, 3), (1333, 2000)),
+    ((2000, 3000), (3, 2), (2000, 1333)),
+    ((2000, 3000), (2, 3), (2000, 3000)),
+])
+def test_crop_size_for(size, ratio, expected):
+    assert crop_size_for(size, *ratio) == expected
+
+
+def test_cascades_from_the_smallest_large_enough_output():
+    plan = build_plan([SPEC_4x5, SPEC_8x10, SPEC_16x20], (6000, 7500), dpi=100)
+    step, = plan.steps
+    assert (step.aspect_w, step.aspect_h, step.crop_size) == (4, 5, (6000, 7500))
+    assert [out.spec for out in step.outputs] == [SPEC_16x20, SPEC_8x10, SPEC_4x5]
+    assert [out.size for out in step.outputs] == [(1600, 2000), (800, 1000), (400, 500)]
+    assert parents(plan) == [[None, 0, 1]]
+    assert plan.output_count == 3
+    assert plan.cascaded_count == 2
+    assert plan.plan_cost < plan.naive_cost
+
+
+def test_groups_equivalent_ratios_and_drops_duplicates():
+    specs = [SPEC_8x10, OutputSpec(8, 10, 8, 10), SPEC_8x10, OutputSpec(2, 3, 4, 6)]
+    plan = build_plan(specs, (3000, 3000), dpi=100)
+    assert [(step.aspect_w, step.aspect_h) for step in plan.steps] == [(4, 5), (2, 3)]
+    assert plan.output_count == 3
+    # Every requested spec still counts towards the naive crop-per-size cost
+    assert plan.naive_cost == 2 * (2400 * 3000 * 3 + 2000 * 3000)
+
+
+def test_cascading_can_be_disabled():
+    plan = build_plan([SPEC_16x20, SPEC_8x10, SPEC_4x5], (6000, 7500), dpi=100, cascade_factor=None)
+    assert parents(plan) == [[None, None, None]]
+    assert plan.cascaded_count == 0
+
+
+def test_outputs_over_max_parent_pixels_are_not_parents():
+    plan = build_plan([SPEC_16x20, SPEC_8x10, SPEC_4x5], (6000, 7500), dpi=100, max_parent_pixels=1600 * 2000)
+    assert parents(plan) == [[None, None, 1]]
+
+
+def test_upscaled_outputs_are_not_parents():
+    # 16x20in at 100 DPI is larger than the 1000x1250 crop
+    plan = build_plan([SPEC_16x20, SPEC_8x10, SPEC_4x5], (1000, 1250), dpi=100)
+    assert parents(plan) == [[None, None, 1]]
+
+
+def test_estimated_saving():
+    plan = build_plan([SPEC_16x20, SPEC_8x10], (6000, 7500), dpi=100)
+    assert plan.estimated_saving(2.0) == pytest.approx(2.0 * (plan.naive_cost / plan.plan_cost - 1))
+    assert build_plan([], (100, 100)).estimated_saving(2.0) == 0.0
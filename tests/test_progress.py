@@ -0,0 +1,12 @@
+from cropengine.progress import ProgressTracker
+
+
+def test_every_way_a_file_finishes_counts_as_done():
+    tracker = ProgressTracker()
+    tracker.update({"event": "scan_total", "files": 6})
+    for kind in ("file_planned", "file_error", "file_skipped", "file_proofed", "file_cancelled"):
+        tracker.update({"event": kind, "source": "a.jpg"})
+    tracker.update({"event": "output_saved", "source": "a.jpg"})
+    tracker.update({"event": "file_started", "source": "b.jpg"})
+    assert (tracker.total, tracker.done, tracker.outputs, tracker.errors) == (6, 5, 1, 1)
+    assert tracker.status().startswith("5/6 files, 1 outputs")
@@ -0,0 +1,37 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from cropengine.imaging import crop_box
+from cropengine.plan import crop_size_for
+
+pytest.importorskip("numpy")
+from cropengine.saliency import SaliencyMap  # noqa: E402
+
+
+def subject_image(size, subject):
+    img = Image.new("RGB", size, (90, 90, 90))
+    ImageDraw.Draw(img).rectangle(subject, fill=(250, 250, 240), outline=(0, 0, 0), width=4)
+    return img
+
+
+@pytest.mark.parametrize("size, subject, ratio", [
+    ((1200, 600), (960, 200, 1100, 400), (1, 1)),  # Right of center
+    ((1200, 600), (20, 250, 120, 350), (1, 1)),  # Against the left edge
+    ((600, 1200), (250, 900, 350, 1150), (4, 5)),  # Near the bottom
+])
+def test_crop_moves_towards_an_off_center_subject(size, subject, ratio):
+    img = subject_image(size, subject)
+    crop = crop_size_for(size, *ratio)
+    focus = SaliencyMap(img).focus_for(crop, size)
+
+    left, top, right, bottom = box = crop_box(size, *ratio, focus)
+    assert (right - left, bottom - top) == crop
+    assert 0 <= left and 0 <= top and right <= size[0] and bottom <= size[1]
+    # The whole subject is inside the crop, which the center crop would miss
+    assert left <= subject[0] and top <= subject[1] and subject[2] <= right and subject[3] <= bottom
+    assert box != crop_box(size, *ratio)
+
+
+def test_flat_image_stays_centered():
+    img = Image.new("RGB", (800, 400), (120, 120, 120))
+    assert SaliencyMap(img).focus_for((400, 400), (800, 400)) == pytest.approx((0.5, 0.5), abs=0.01)
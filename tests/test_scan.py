@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cropengine.imaging import OutputSpec
+from cropengine.scan import scan_images, scan_jobs, sniff_image, walk_ahead
+
+MAGIC = {
+    "JPEG": b"\xff\xd8\xff\xe0" + bytes(8),
+    "PNG": b"\x89PNG\r\n\x1a\n" + bytes(4),
+    "TIFF": b"II*\x00" + bytes(8),
+    "BMP": b"BM" + bytes(10),
+    "WEBP": b"RIFF\x00\x00\x00\x00WEBP",
+}
+
+
+def write(path, data=MAGIC["JPEG"]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def rel_paths(root, **kwargs):
+    return [os.path.relpath(entry.path, root).replace(os.sep, "/") for entry in scan_images(root, **kwargs)]
+
+
+@pytest.mark.parametrize("format", MAGIC)
+def test_sniff_image(tmp_path, format):
+    path = str(tmp_path / "image")
+    write(path, MAGIC[format])
+    assert sniff_image(path) == format
+
+
+def test_sniff_rejects_non_images(tmp_path):
+    path = str(tmp_path / "notes.jpg")
+    write(path, b"just some text")
+    assert sniff_image(path) is None
+    assert sniff_image(str(tmp_path / "missing.jpg")) is None
+
+
+def test_scan_images(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, "b.jpg"))
+    write(os.path.join(root, "a.png"), MAGIC["PNG"])
+    write(os.path.join(root, "fake.jpg"), b"not an image")
+    write(os.path.join(root, "readme.txt"), MAGIC["JPEG"])
+    write(os.path.join(root, "sub", "c.jpg"))
+    write(os.path.join(root, "sub", "deeper", "d.tif"), MAGIC["TIFF"])
+    write(os.path.join(root, "skip", "e.jpg"))
+
+    assert rel_paths(root) == ["a.png", "b.jpg", "skip/e.jpg", "sub/c.jpg", "sub/deeper/d.tif"]
+    assert rel_paths(root, recursive=False) == ["a.png", "b.jpg"]
+    assert rel_paths(root, exclude=["skip"]) == ["a.png", "b.jpg", "sub/c.jpg", "sub/deeper/d.tif"]
+    assert rel_paths(root, include=["*.tif"]) == ["sub/deeper/d.tif"]
+    assert rel_paths(root, skip_dirs=[os.path.join(root, "sub")]) == ["a.png", "b.jpg", "skip/e.jpg"]
+    assert "fake.jpg" in rel_paths(root, sniff=False)
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="needs symlinks")
+def test_symlink_loops_are_walked_once(tmp_path):
+    root = str(tmp_path)
+    write(os.path.join(root, "sub", "a.jpg"))
+    os.symlink(root, os.path.join(root, "sub", "loop"))
+    os.symlink(os.path.join(root, "sub"), os.path.join(root, "alias"))
+    found = rel_paths(root)
+    assert len(found) == 1
+    assert found[0] in ("alias/a.jpg", "sub/a.jpg")
+
+
+def test_scan_jobs_mirror_subfolders(tmp_path):
+    input_root = str(tmp_path)
+    output_root = os.path.join(input_root, "out")
+    write(os.path.join(input_root, "a.jpg"))
+    write(os.path.join(input_root, "2024", "june", "b.jpg"))
+    write(os.path.join(output_root, "a_4x5_8x10in.jpg"))  # Earlier output: never scanned
+
+    totals = []
+    specs = [OutputSpec(4, 5, 8, 10)]
+    jobs = list(scan_jobs(input_root, output_root, specs, on_total=totals.append, dpi=150))
+    assert [(job.source, job.output_dir) for job in jobs] == [
+        (os.path.join(input_root, "a.jpg"), output_root),
+        (os.path.join(input_root, "2024", "june", "b.jpg"), os.path.join(output_root, "2024", "june")),
+    ]
+    assert all(job.specs == specs and job.dpi == 150 for job in jobs)
+    assert totals == [2]
+
+
+def test_walk_ahead_keeps_order_and_reports_the_total():
+    totals = []
+    assert list(walk_ahead(iter(range(100)), totals.append, limit=7)) == list(range(100))
+    assert totals == [100]
+
+
+def test_walk_ahead_raises_walk_errors():
+    def entries():
+        yield 1
+        raise OSError("disk gone")
+
+    it = walk_ahead(entries(), lambda total: None)
+    assert next(it) == 1
+    with pytest.raises(OSError, match="disk gone"):
+        next(it)
+
+
+def test_walk_ahead_is_bounded_and_stops_with_the_consumer():
+    progress = []
+
+    def entries():
+        while True:
+            progress.append(None)
+            yield len(progress)
+
+    it = walk_ahead(entries(), lambda total: None, limit=5)
+    assert [next(it) for _ in range(3)] == [1, 2, 3]
+    time.sleep(0.2)
+    # Three consumed, five queued, one more waiting to be queued
+    assert len(progress) <= 3 + 5 + 1
+    threads = threading.active_count()
+    it.close()
+    time.sleep(0.3)
+    stopped_at = len(progress)
+    time.sleep(0.2)
+    assert len(progress) == stopped_at
+    assert threading.active_count() < threads
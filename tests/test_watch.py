@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cropengine import batch
+from cropengine.batch import BatchEngine, FileResult, RenderJob
+from cropengine.imaging import OutputSpec
+from cropengine.watch import INOTIFY_AVAILABLE, Debouncer, FolderWatcher
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(100)
+SPECS = [OutputSpec(4, 5, 8, 10)]
+
+
+def write(path, data=JPEG):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_debouncer_coalesces_and_waits_for_files_to_settle(tmp_path):
+    path = str(tmp_path / "a.jpg")
+    write(path, b"part")
+    debouncer = Debouncer(settle_seconds=2.0)
+    debouncer.note(path, 0.0)
+    debouncer.note(path, 1.0)  # Unchanged: still counted from 0.0
+    assert len(debouncer) == 1
+    assert debouncer.ready(1.5) == []
+
+    write(path, b"partial copy")  # Still being copied: the wait starts again
+    assert debouncer.ready(2.5) == []
+    assert debouncer.ready(4.0) == []
+    assert debouncer.ready(4.5) == [path]
+    assert len(debouncer) == 0
+
+
+def test_debouncer_limit_and_vanished_files(tmp_path):
+    paths = [str(tmp_path / f"{i}.jpg") for i in range(3)]
+    debouncer = Debouncer(settle_seconds=0)
+    for path in paths:
+        write(path)
+        debouncer.note(path, 0.0)
+    os.remove(paths[1])
+    assert debouncer.ready(1.0, limit=1) == [paths[0]]
+    assert debouncer.ready(1.0) == [paths[2]]
+
+
+class FakeEngine:
+    """
+    Records what each round renders and writes outputs like a real render.
+    """
+    control = None
+
+    def __init__(self):
+        self.rounds = []
+        self.started = self.closed = 0
+
+    def start(self):
+        self.started += 1
+        return self
+
+    def close(self):
+        self.closed += 1
+
+    def run(self, jobs, on_event):
+        jobs = list(jobs)
+        for job in jobs:
+            os.makedirs(job.output_dir, exist_ok=True)
+            write(os.path.join(job.output_dir, os.path.basename(job.source)[:-4] + "_4x5_8x10in.jpg"))
+        self.rounds.append(sorted(job.source for job in jobs))
+        return [FileResult(job.source, [], None) for job in jobs]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+@pytest.mark.parametrize("use_inotify", [
+    False, pytest.param(True, marks=pytest.mark.skipif(not INOTIFY_AVAILABLE, reason="needs inotify"))])
+def test_watcher_ignores_its_output_folder(tmp_path, use_inotify):
+    input_root = str(tmp_path)
+    output_root = os.path.join(input_root, "prints")
+    os.makedirs(output_root)
+    write(os.path.join(output_root, "old_4x5_8x10in.jpg"))
+    engine = FakeEngine()
+    events = []
+    watcher = FolderWatcher(input_root, output_root, SPECS, engine, events.append,
+                            settle_seconds=0.1, poll_seconds=0.1, use_inotify=use_inotify)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        wait_for(lambda: any(event["event"] == "watch_started" for event in events))
+        first = os.path.join(input_root, "first.jpg")
+        write(first)
+        wait_for(lambda: len(engine.rounds) == 1)
+        second = os.path.join(input_root, "second.jpg")
+        write(second)
+        wait_for(lambda: len(engine.rounds) == 2)
+        time.sleep(0.5)  # Time for the outputs just written to be (wrongly) picked up
+    finally:
+        watcher.stop()
+        thread.join(10)
+
+    assert engine.rounds == [[first], [second]]
+    outputs = sorted(name for name in os.listdir(output_root) if not name.startswith("."))
+    assert outputs == ["first_4x5_8x10in.jpg", "old_4x5_8x10in.jpg", "second_4x5_8x10in.jpg"]
+    # One engine start for the life of the watcher
+    assert (engine.started, engine.closed) == (1, 1)
+    assert events[-1] == {"event": "watch_stopped", "rendered": 2, "pending": 0}
+
+
+def test_started_engine_keeps_its_pool_across_runs(tmp_path, monkeypatch):
+    from PIL import Image
+
+    pools = []
+
+    class CountingPool(batch.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", CountingPool)
+    source = str(tmp_path / "IMG_1.png")
+    Image.new("RGB", (400, 500)).save(source)
+    job = RenderJob(source, str(tmp_path / "out"), SPECS, dpi=20)
+
+    engine = BatchEngine(workers=2, memory_mb=0)
+    for _ in range(2):
+        assert engine.run([job])[0].error is None
+    assert len(pools) == 2
+
+    with BatchEngine(workers=2, memory_mb=0) as engine:
+        for _ in range(3):
+            assert engine.run([job])[0].error is None
+    assert len(pools) == 3
+    assert engine._pool is None